@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    sources: List[Dict]
+    vector: np.ndarray  # normalized query embedding
+    embedding_model: str
+    created_at: float
+
+def normalize_query(query: str) -> str:
+    """Normalize a question for exact matching: case, whitespace and trailing punctuation."""
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+class AnswerCache:
+    """Two-level answer cache: exact normalized-question matches, then near-duplicate questions by embedding similarity.
+
+    Entries are keyed by (scope, normalized question, LLM model), where the
+    scope is the searched collections and document filter, expire after
+    ttl seconds and are evicted least recently used first.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, similarity_threshold: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _valid(self, key, entry: CachedAnswer) -> bool:
+        """Drop an expired entry. Caller holds the lock."""
+        if time.time() - entry.created_at > self.ttl:
+            del self._entries[key]
+            return False
+        return True
+
+    def get_exact(self, scope: Tuple, query: str, llm_model: Optional[str]) -> Optional[CachedAnswer]:
+        key = (scope, normalize_query(query), llm_model)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._valid(key, entry):
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry
+        return None
+
+    def get_similar(self, scope: Tuple, vector: np.ndarray, llm_model: Optional[str], embedding_model: str) -> Optional[CachedAnswer]:
+        """Return the answer to the most similar cached question above the threshold, counting a miss otherwise."""
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in list(self._entries.items())
+                if key[0] == scope and key[2] == llm_model and entry.embedding_model == embedding_model
+                and self._valid(key, entry)
+            ]
+            if candidates:
+                scores = np.stack([entry.vector for _, entry in candidates]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.semantic_hits += 1
+                    return entry
+            self.misses += 1
+        return None
+
+    def put(self, scope: Tuple, query: str, llm_model: Optional[str], embedding_model: str, vector: np.ndarray, answer: str, sources: List[Dict]):
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        key = (scope, normalize_query(query), llm_model)
+        with self._lock:
+            self._entries[key] = CachedAnswer(answer, sources, vector, embedding_model, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, collection_name: str):
+        """Forget all answers that searched a collection, e.g. after it was re-ingested."""
+        with self._lock:
+            for key in [key for key in self._entries if collection_name in key[0][0]]:
+                del self._entries[key]
+
+    def stats(self) -> Dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+        }
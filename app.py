@@ -44,6 +44,8 @@ EMBEDDING_MODEL_OPTIONS = {
 # Initialize session state
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
+if 'chat_session_id' not in st.session_state:
+    st.session_state.chat_session_id = None  # backend chat session, so follow-up questions keep their context
 if 'current_page' not in st.session_state:
     st.session_state.current_page = "Chat"
 
@@ -67,6 +69,10 @@ if 'pdf_data' not in st.session_state:
     st.session_state.pdf_data = None
 if 'collection_name' not in st.session_state:
     st.session_state.collection_name = None
+if 'uploaded_file_key' not in st.session_state:
+    st.session_state.uploaded_file_key = None
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
 
 # Page configuration
 st.set_page_config(
@@ -210,6 +216,8 @@ if st.session_state.current_page == "Chat":
     if uploaded_file is not None:
         if not settings_configured:
             st.warning("⚠️ Please configure LLM and Database settings before uploading a PDF.")
+        elif st.session_state.uploaded_file_key == (uploaded_file.name, uploaded_file.size):
+            pass  # Streamlit reruns the script on every interaction; the file is already being processed
         else:
             st.session_state.pdf_data = uploaded_file.getvalue()
             st.session_state.collection_name = uploaded_file.name.replace(".pdf", "")  # Store collection name
@@ -227,14 +235,50 @@ if st.session_state.current_page == "Chat":
 
                 #Expect JSON
                 response_json = response.json()
+                st.session_state.job_id = response_json.get("job_id")
+                # The backend may put the file into a shared collection
+                st.session_state.collection_name = response_json.get("collection_name", st.session_state.collection_name)
+                st.session_state.uploaded_file_key = (uploaded_file.name, uploaded_file.size)
+                # A new document starts a new conversation
+                st.session_state.chat_session_id = None
+                st.session_state.chat_history = []
                 st.info(response_json["message"])  # Display immediate message
                 st.success("Started PDF processing in the background.")
 
             except requests.exceptions.RequestException as e:
                 st.error(f"⚠️ Error: {e}")
 
+    # Processing status of the last upload
+    if st.session_state.job_id:
+        col1, col2 = st.columns(2)
+        with col1:
+            st.button("🔄 Refresh Processing Status")  # Any click reruns the script and refetches the status
+        with col2:
+            cancel = st.button("⛔ Cancel Processing")
+        try:
+            if cancel:
+                response = requests.post(f"{BACKEND_URL}/jobs/{st.session_state.job_id}/cancel", timeout=30)
+            else:
+                response = requests.get(f"{BACKEND_URL}/jobs/{st.session_state.job_id}", timeout=30)
+            response.raise_for_status()
+            job = response.json()
+            progress = job.get("progress", {})
+            st.caption(
+                f"Processing status: **{job['status']}** · "
+                f"pages parsed: {progress.get('pages_parsed', 0)} · "
+                f"chunks embedded: {progress.get('chunks_embedded', 0)} · "
+                f"points upserted: {progress.get('points_upserted', 0)}"
+            )
+            if job.get("error"):
+                st.error(f"⚠️ Processing failed: {job['error']}")
+        except requests.exceptions.RequestException as e:
+            st.error(f"⚠️ Error fetching processing status: {e}")
+
     # Query input and display
     st.subheader("💬 Ask a Question")
+    for past_query, past_answer in st.session_state.chat_history:
+        st.markdown(f'<div class="chat-message user-message">You: {past_query}</div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="chat-message bot-message">AI: {past_answer}</div>', unsafe_allow_html=True)
     query = st.text_input("Type your question here...")
 
     if st.button("🔍 Get Answer"):
@@ -245,25 +289,58 @@ if st.session_state.current_page == "Chat":
         elif st.session_state.pdf_data is None:
             st.warning("Please upload a PDF file first.")
         else:
-            with st.spinner(" Thinking..."):
-                try:
-                     # Pass the collection name to the query endpoint
-                    response = requests.post(
-                        f"{BACKEND_URL}/query",
-                        json={"query": query, "collection_name": st.session_state.collection_name},  # Include collection name
-                        timeout=3000
-                    )
-                    response.raise_for_status()
-
-                    if response.status_code == 200:
-                        answer = response.json().get("answer", "No answer found.")
-                        st.markdown(
-                            f'<div class="chat-message user-message">You: {query}</div>', unsafe_allow_html=True)
-                        st.markdown(
-                            f'<div class="chat-message bot-message">AI: {answer}</div>', unsafe_allow_html=True)
-
-                except requests.exceptions.RequestException as e:
-                    st.error(f"⚠️ Error: {e}")
+            st.markdown(
+                f'<div class="chat-message user-message">You: {query}</div>', unsafe_allow_html=True)
+            answer_placeholder = st.empty()
+            answer_placeholder.markdown(
+                '<div class="chat-message bot-message">AI: Thinking...</div>', unsafe_allow_html=True)
+            try:
+                if st.session_state.chat_session_id is None:
+                    session_response = requests.post(f"{BACKEND_URL}/sessions", timeout=30)
+                    session_response.raise_for_status()
+                    st.session_state.chat_session_id = session_response.json()["session_id"]
+
+                # Stream the answer so tokens show up as soon as the LLM produces them
+                response = requests.post(
+                    f"{BACKEND_URL}/query/stream",
+                    json={
+                        "query": query,
+                        "collection_name": st.session_state.collection_name,  # Include collection name
+                        "session_id": st.session_state.chat_session_id,
+                    },
+                    stream=True,
+                    timeout=(10, 300)  # Connect timeout, then maximum wait between streamed events
+                )
+                if response.status_code == 404:
+                    st.session_state.chat_session_id = None  # Expired on the backend; the next question starts a new one
+                response.raise_for_status()
+
+                answer = ""
+                citations = []
+                event = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                    elif line.startswith("data: "):
+                        data = json.loads(line[len("data: "):])
+                        if event == "token":
+                            answer += data["text"]
+                            answer_placeholder.markdown(
+                                f'<div class="chat-message bot-message">AI: {answer}▌</div>', unsafe_allow_html=True)
+                        elif event == "done":
+                            citations = data.get("citations", [])
+                        elif event == "error":
+                            st.error(f"⚠️ Error: {data['detail']}")
+
+                answer_placeholder.markdown(
+                    f'<div class="chat-message bot-message">AI: {answer or "No answer found."}</div>', unsafe_allow_html=True)
+                if answer:
+                    st.session_state.chat_history.append((query, answer))
+                for citation in citations:
+                    st.caption(f"Sources: {citation['doc_id']}, pages " + ", ".join(str(page) for page in citation["pages"]))
+
+            except requests.exceptions.RequestException as e:
+                st.error(f"⚠️ Error: {e}")
 
 elif st.session_state.current_page == "Settings":
     st.title("🔧 Settings")
@@ -291,6 +368,21 @@ elif st.session_state.current_page == "Settings":
                     selected_llm_key = next((key for key, value in LLM_OPTIONS.items() if value == selected_llm), None)
                     st.session_state.llm_selected = selected_llm_key
 
+                    # Send the new model to the backend if the database settings are already saved
+                    if st.session_state.qdrant_api_key and st.session_state.qdrant_cloud_url:
+                        settings_data = {
+                            "qdrant_api_key": st.session_state.qdrant_api_key,
+                            "groq_api_key": st.session_state.groq_api_key,
+                            "qdrant_cloud_url": st.session_state.qdrant_cloud_url,
+                            "embedding_model": st.session_state.embedding_model,
+                            "llm_model": st.session_state.llm_selected or None
+                        }
+                        try:
+                            response = requests.post(f"{BACKEND_URL}/set-settings", json=settings_data, timeout=3000)
+                            response.raise_for_status()
+                        except requests.exceptions.RequestException as e:
+                            st.error(f"⚠️ Error sending settings to backend: {e}")
+
                     st.success("LLM Settings saved successfully!")
 
     with tab2:
@@ -320,7 +412,8 @@ elif st.session_state.current_page == "Settings":
                         "qdrant_api_key": st.session_state.qdrant_api_key,
                         "groq_api_key": st.session_state.groq_api_key,
                         "qdrant_cloud_url": st.session_state.qdrant_cloud_url,
-                        "embedding_model": st.session_state.embedding_model
+                        "embedding_model": st.session_state.embedding_model,
+                        "llm_model": st.session_state.llm_selected or None
                     }
                     try:
                         response = requests.post(f"{BACKEND_URL}/set-settings", json=settings_data, timeout=3000)
@@ -2,28 +2,53 @@ import os
 import shutil
 import logging
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import inspect
+import threading
+import time
+
+# Cold start is measured from here; the imports below are most of it
+IMPORT_STARTED = time.perf_counter()
+
+import sys
+import re
+from collections import OrderedDict, deque
+import dataclasses
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import pickle
-from typing import List
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
 import numpy as np
 import hashlib
+import uuid
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-from sentence_transformers import SentenceTransformer
-from langchain_groq import ChatGroq
-from PyPDF2 import PdfReader
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from PyPDF2 import PdfReader, __version__ as PYPDF2_VERSION
 from pydantic import BaseModel
 import json
-from nltk.tokenize import sent_tokenize
-import nltk
 import sqlite3
 
-# Download necessary NLTK resources
-nltk.download('punkt')
-nltk.download('punkt_tab')  # Ensure the punkt_tab resource is available
+from answer_cache import AnswerCache, CachedAnswer
+from bulk_upload import SpooledFile, copy_and_hash, spool_uploads
+from chat_sessions import ChatSessionStore, format_history
+from context_builder import assemble_context, estimate_tokens
+from embedding_batcher import ChunkEmbeddingBatcher, EmbeddingBatcher
+from embedding_cache import EmbeddingCache
+from extraction_cache import ExtractionCache
+from jobs import IngestionJob, JobCancelled, JobQueue, QueueFull
+from lexical_index import LexicalIndexStore, reciprocal_rank_fusion
+from metrics import TOKEN_BUCKETS, CallbackMetric, Counter, Gauge, Histogram, MetricsRegistry, StageTimer, Tracer, timed
+from profiler import SamplingProfiler
+from reranker import CrossEncoderReranker
+from sentence_splitter import get_sentence_splitter, split_pages
+from vector_reduction import VectorReducer, VectorReducerStore
+from vector_store import LocalVectorStore, QdrantVectorStore, SearchHit, VectorStore
+
+# Imported on first use, so a worker can serve /health before they are loaded
+if TYPE_CHECKING:
+    from langchain_groq import ChatGroq
+    from qdrant_client import AsyncQdrantClient, QdrantClient
+    from sentence_transformers import SentenceTransformer
 
 # Initialize FastAPI app
 app = FastAPI()
@@ -39,237 +64,2098 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 # Pydantic models
 class QueryRequest(BaseModel):
     query: str
-    collection_name: str
+    collection_name: Optional[str] = None
+    collection_names: Optional[List[str]] = None  # search several collections at once
+    doc_ids: Optional[List[str]] = None  # only search these documents
+    session_id: Optional[str] = None  # continue this chat session, see POST /sessions
+    trace: bool = False  # return the stage timings of this question with the answer
 
 class SettingsData(BaseModel):
     qdrant_api_key: str
     qdrant_cloud_url: str
     embedding_model: str
     groq_api_key: str
+    llm_model: Optional[str] = None  # Groq model name, ChatGroq's default when not set
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Constants for optimized chunking and batching
-MAX_CHUNK_SIZE = 512  # maximum words per chunk
+MAX_CHUNK_SIZE = 512  # maximum words (or tokens, see CHUNK_SIZE_UNIT) per chunk
 CHUNK_OVERLAP = 50
+CHUNK_SIZE_UNIT = os.getenv("CHUNK_SIZE_UNIT", "words")  # "words" or "tokens" (embedding model tokenizer)
 BATCH_SIZE = 10       # number of chunks processed per batch
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))  # chunks encoded per forward pass
+NORMALIZE_EMBEDDINGS = os.getenv("NORMALIZE_EMBEDDINGS", "true").lower() == "true"
+
+# PDF extraction settings
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PARALLEL_EXTRACT_MIN_PAGES = int(os.getenv("PARALLEL_EXTRACT_MIN_PAGES", "32"))  # smaller files are extracted serially
+PAGES_PER_EXTRACT_TASK = 8
+
+# Extraction cache settings
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"  # keep the page texts of extracted PDFs
+EXTRACTION_CACHE_DIR = os.path.join(UPLOAD_DIR, "extraction_cache")
+EXTRACTION_CACHE_MAX_MB = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "1024"))
+
+# Sentence splitting settings
+SENTENCE_SPLITTER = os.getenv("SENTENCE_SPLITTER", "nltk")  # "nltk" (Punkt) or "regex" (rule-based, no model data, other chunk boundaries)
+NLTK_DATA_DIR = os.getenv("NLTK_DATA_DIR", "")  # bundled punkt data, searched before NLTK's default paths
+NLTK_DOWNLOAD = os.getenv("NLTK_DOWNLOAD", "true").lower() == "true"  # download punkt on first use if it is not found locally
+PARALLEL_SPLIT_MIN_PAGES = int(os.getenv("PARALLEL_SPLIT_MIN_PAGES", "64"))  # pages Punkt splits serially before the rest go to the extraction pool; 0 never uses the pool
+PAGES_PER_SPLIT_TASK = 16
+
+# Incremental re-ingestion settings
+SHARED_COLLECTION = os.getenv("SHARED_COLLECTION", "")  # put every upload into this collection instead of one per file
+INCREMENTAL_INGESTION = os.getenv("INCREMENTAL_INGESTION", "true").lower() == "true"
+INGESTION_DB_PATH = os.path.join(UPLOAD_DIR, "ingestion.db")  # last ingested file hash per collection
+SCROLL_PAGE_SIZE = 1000
+POSITION_FIELDS = ("start_char", "end_char", "page_start", "page_end")
+
+# Vector store settings
+VECTOR_STORE = os.getenv("VECTOR_STORE", "qdrant")  # "qdrant" or "local" (no Qdrant server needed)
+LOCAL_VECTOR_STORE_DIR = os.path.join(UPLOAD_DIR, "vector_store")
+LOCAL_ANN_THRESHOLD = int(os.getenv("LOCAL_ANN_THRESHOLD", "50000"))  # live vectors before HNSW is used, if hnswlib is installed
+
+# Hybrid search settings
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"  # fuse BM25 with vector search
+LEXICAL_INDEX_DIR = os.path.join(UPLOAD_DIR, "lexical_index")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # hits taken from each retriever before fusion
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Prompt context packing
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # most context tokens sent to any model
+ANSWER_TOKEN_RESERVE = int(os.getenv("ANSWER_TOKEN_RESERVE", "1024"))  # context window left for the instructions and answer
+DEFAULT_CONTEXT_WINDOW = 8192
+LLM_CONTEXT_WINDOWS = {
+    "llama-3.3-70b-versatile": 131072,
+    "llama-3.1-8b-instant": 131072,
+    "deepseek-r1-distill-qwen-32b": 131072,
+    "mixtral-8x7b-32768": 32768,
+    "gemma2-9b-it": 8192,
+}
+
+# Cross-encoder reranking of a larger candidate pool
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))  # chunks retrieved for the reranker to choose from
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "3"))  # chunks kept for the prompt
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))  # retrieval order is kept when reranking takes longer
+
+# Compact vector storage
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")  # "none", "int8" or "binary"
+QUANTIZATION_RESCORE = os.getenv("QUANTIZATION_RESCORE", "true").lower() == "true"  # rescore candidates with full vectors
+QUANTIZATION_OVERSAMPLING = float(os.getenv("QUANTIZATION_OVERSAMPLING", "2.0"))  # candidates rescored per requested hit
+VECTOR_REDUCTION = os.getenv("VECTOR_REDUCTION", "")  # "", "matryoshka" or "pca"
+VECTOR_DIMENSIONS = int(os.getenv("VECTOR_DIMENSIONS", "0"))  # stored dimensions when reducing
+PCA_FIT_SAMPLES = int(os.getenv("PCA_FIT_SAMPLES", "2048"))  # vectors a new collection's PCA basis is fitted on
+VECTOR_REDUCERS_DIR = os.path.join(UPLOAD_DIR, "vector_reducers")
+
+# Client pool settings
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+RETIRED_CLIENT_GRACE_SECONDS = float(os.getenv("RETIRED_CLIENT_GRACE_SECONDS", "300"))  # time requests get to finish with clients of old settings
+
+# Query path settings
+QUERY_EMBED_WORKERS = int(os.getenv("QUERY_EMBED_WORKERS", "4"))  # threads encoding questions off the event loop
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "32"))  # questions encoded together at most
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "5"))  # how long to wait for more questions to batch
+QUERY_BATCH_QUEUE_SIZE = int(os.getenv("QUERY_BATCH_QUEUE_SIZE", "256"))  # waiting questions before callers block
+
+# Ingestion job queue settings
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))  # PDFs processed concurrently
+INGESTION_QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", "20"))  # PDFs allowed to wait for a worker
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "256"))  # chunks of concurrent ingestions encoded together at most
+BULK_INGESTION_WORKERS = int(os.getenv("BULK_INGESTION_WORKERS", "4"))  # documents of one bulk upload ingested in parallel
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "10000"))  # PDFs accepted in one bulk upload
+BULK_UPLOAD_DIR = os.path.join(UPLOAD_DIR, "bulk")
+INCOMING_UPLOAD_DIR = os.path.join(UPLOAD_DIR, "incoming")  # single uploads, each under its own name until ingested
+# Nothing can still be ingesting a file spooled before this start, e.g. one whose job was dropped at shutdown
+shutil.rmtree(INCOMING_UPLOAD_DIR, ignore_errors=True)
+os.makedirs(INCOMING_UPLOAD_DIR, exist_ok=True)
+
+# Embedding cache settings
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.path.join(UPLOAD_DIR, "embedding_cache.db")
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+# Answer cache settings
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))  # seconds
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))  # cosine similarity for reusing an answer
+
+# Chat session settings
+SESSION_DB_PATH = os.path.join(UPLOAD_DIR, "chat_sessions.db")
+SESSION_TTL = int(os.getenv("SESSION_TTL", "604800"))  # seconds a session is kept after its last turn
+SESSION_HISTORY_TURNS = int(os.getenv("SESSION_HISTORY_TURNS", "4"))  # latest turns used to rewrite follow-ups and put into the prompt
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "800"))  # most tokens of history put into a prompt
+SESSION_CANDIDATES = int(os.getenv("SESSION_CANDIDATES", "20"))  # chunks kept per session to answer follow-ups from
+SESSION_REUSE_RATIO = float(os.getenv("SESSION_REUSE_RATIO", "0.9"))  # kept chunks are reused while they fit a follow-up this well
+SESSION_WARM_MAX = int(os.getenv("SESSION_WARM_MAX", "1000"))  # sessions whose chunks are kept in memory
+QUERY_REWRITE_CACHE_SIZE = int(os.getenv("QUERY_REWRITE_CACHE_SIZE", "10000"))
+
+# Embedding model registry settings
+EMBEDDING_MODEL_MEMORY_BUDGET_MB = int(os.getenv("EMBEDDING_MODEL_MEMORY_BUDGET_MB", "2048"))
+EMBEDDING_MODEL_IDLE_TIMEOUT = int(os.getenv("EMBEDDING_MODEL_IDLE_TIMEOUT", "3600"))  # seconds
+PRELOAD_EMBEDDING_MODELS = [name for name in os.getenv("PRELOAD_EMBEDDING_MODELS", "").split(",") if name]
+
+# Startup
+COLD_START_BUDGET_SECONDS = float(os.getenv("COLD_START_BUDGET_SECONDS", "10"))  # startup warm-up past this continues in the background
+
+# Instrumentation
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))  # share of questions and ingestions traced into /traces
+TRACE_HISTORY = int(os.getenv("TRACE_HISTORY", "100"))  # traces kept for /traces
+PROFILER_MAX_SECONDS = int(os.getenv("PROFILER_MAX_SECONDS", "300"))  # longest run of the sampling profiler
+
+METRICS = MetricsRegistry()
+INGESTION_SECONDS = METRICS.register(Histogram("rag_ingestion_seconds", "Seconds to ingest one PDF.", ("status",)))
+INGESTION_STAGE_SECONDS = METRICS.register(Histogram("rag_ingestion_stage_seconds", "Seconds one PDF spent in each ingestion stage.", ("stage",)))
+PAGE_EXTRACT_SECONDS = METRICS.register(Histogram("rag_pdf_page_extract_seconds", "Seconds to extract the text of one PDF page."))
+INGESTED_PAGES = METRICS.register(Counter("rag_ingested_pages", "PDF pages extracted."))
+EMBEDDED_CHUNKS = METRICS.register(Counter("rag_embedded_chunks", "Chunks embedded and upserted during ingestion."))
+QUERY_SECONDS = METRICS.register(Histogram("rag_query_seconds", "Seconds to answer a question.", ("endpoint",)))
+QUERY_STAGE_SECONDS = METRICS.register(Histogram("rag_query_stage_seconds", "Seconds a question spent in each stage.", ("stage",)))
+PROMPT_TOKENS = METRICS.register(Histogram("rag_prompt_tokens", "Estimated tokens of the prompts sent to the LLM.", buckets=TOKEN_BUCKETS))
+QUERIES_IN_FLIGHT = METRICS.register(Gauge("rag_queries_in_flight", "Questions being answered.", ("endpoint",)))
+QUERY_ERRORS = METRICS.register(Counter("rag_query_errors", "Questions that failed.", ("endpoint",)))
+COLD_START_SECONDS = METRICS.register(Gauge("rag_cold_start_seconds", "Seconds from import until serving requests (ready) and until warm-up finished (warm).", ("phase",)))
+TRACER = Tracer(TRACE_SAMPLE_RATE, TRACE_HISTORY)
+PROFILER = SamplingProfiler()
 
 def compute_md5(text: str) -> str:
     """Compute an MD5 hash of the given text."""
     return hashlib.md5(text.encode("utf-8")).hexdigest()
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extract text from PDF file page by page to reduce memory overhead."""
+def compute_file_md5(file_path: str) -> str:
+    """Compute an MD5 hash of a file without reading it into memory at once."""
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+def point_id(chunk_text: str, doc_id: Optional[str] = None) -> str:
+    """Qdrant point id for a chunk: its MD5 hash in the canonical UUID form Qdrant returns.
+
+    In shared collections the hash includes the document id, so documents
+    with identical passages keep separate points.
+    """
+    if doc_id is not None:
+        chunk_text = f"{doc_id}\0{chunk_text}"
+    return str(uuid.UUID(compute_md5(chunk_text)))
+
+def current_rss_bytes() -> int:
+    """Return the resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Not on Linux: fall back to the process-wide peak
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+class Sentence(NamedTuple):
+    text: str
+    page: int   # 1-based page number
+    start: int  # character offset in the extracted document text
+
+@dataclass
+class Chunk:
+    text: str
+    start_char: int
+    end_char: int
+    page_start: int
+    page_end: int
+
+    def payload(self) -> dict:
+        """Qdrant payload for this chunk."""
+        return {
+            "content": self.text,
+            "start_char": self.start_char,
+            "end_char": self.end_char,
+            "page_start": self.page_start,
+            "page_end": self.page_end,
+        }
+
+def extract_pages(reader: PdfReader, start: int, stop: int) -> List[Tuple[int, str, float]]:
+    """Extract pages [start, stop) and return (page number, text, seconds) for each."""
+    results = []
+    for index in range(start, stop):
+        page_start = time.perf_counter()
+        page_text = reader.pages[index].extract_text()
+        results.append((index + 1, page_text, time.perf_counter() - page_start))
+    return results
+
+def extract_page_range(pdf_path: str, start: int, stop: int) -> List[Tuple[int, str, float]]:
+    """Open the PDF by path and extract pages [start, stop). Runs in worker processes."""
+    return extract_pages(PdfReader(pdf_path), start, stop)
+
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+def get_extract_pool(workers: int = PDF_EXTRACT_WORKERS) -> ProcessPoolExecutor:
+    """Return the shared process pool used for PDF extraction, creating it on first use."""
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            _extract_pool = ProcessPoolExecutor(max_workers=workers)
+        return _extract_pool
+
+def iter_pdf_pages(pdf_path: str, workers: int = PDF_EXTRACT_WORKERS, timings: Optional[List[Tuple[int, float]]] = None) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text) for each non-empty PDF page without holding the whole document.
+
+    Files with at least PARALLEL_EXTRACT_MIN_PAGES pages are split into page
+    ranges that worker processes extract by path, with at most 2 * workers
+    ranges in flight so memory stays bounded; results are still yielded in
+    page order. Per-page extraction seconds are appended to timings.
+    """
+    futures = deque()
     try:
         logging.info(f"Extracting text from PDF: {pdf_path}")
         reader = PdfReader(pdf_path)
-        text_parts = []
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text_parts.append(page_text)
-        full_text = "\n".join(text_parts)
-        logging.info(f"Successfully extracted text from PDF: {pdf_path}")  # Corrected log message
-        return full_text
+        page_count = len(reader.pages)
+
+        if workers <= 1 or page_count < PARALLEL_EXTRACT_MIN_PAGES:
+            ranges = (extract_pages(reader, index, index + 1) for index in range(page_count))
+        else:
+            logging.info(f"Extracting {page_count} pages with {workers} worker processes")
+            pool = get_extract_pool(workers)
+
+            def parallel_ranges() -> Iterator[List[Tuple[int, str, float]]]:
+                for start in range(0, page_count, PAGES_PER_EXTRACT_TASK):
+                    futures.append(pool.submit(extract_page_range, pdf_path, start, min(start + PAGES_PER_EXTRACT_TASK, page_count)))
+                    if len(futures) >= 2 * workers:
+                        yield futures.popleft().result()
+                while futures:
+                    yield futures.popleft().result()
+
+            ranges = parallel_ranges()
+
+        for page_results in ranges:
+            for page_number, page_text, seconds in page_results:
+                if timings is not None:
+                    timings.append((page_number, seconds))
+                if page_text:
+                    yield page_number, page_text
+        logging.info(f"Successfully extracted text from PDF: {pdf_path}")
     except Exception as e:
         logging.error(f"Error extracting text from PDF {pdf_path}: {e}")
         raise
+    finally:
+        # Stop pending page ranges if the consumer gave up early
+        for future in futures:
+            future.cancel()
+
+EXTRACTION_CACHE = ExtractionCache(
+    EXTRACTION_CACHE_DIR, EXTRACTION_CACHE_MAX_MB * 1024 * 1024, f"PyPDF2 {PYPDF2_VERSION}",
+) if EXTRACTION_CACHE_ENABLED else None
+
+def extract_and_cache_pages(pdf_path: str, file_hash: str, timings: List[Tuple[int, float]]) -> Iterator[Tuple[int, str]]:
+    """Yield the pages of iter_pdf_pages and add them to the extraction cache once the whole file is through.
+
+    A consumer that stops early leaves the cache unchanged.
+    """
+    if EXTRACTION_CACHE is None:
+        yield from iter_pdf_pages(pdf_path, timings=timings)
+        return
+    before = len(timings)
+    with EXTRACTION_CACHE.writer(file_hash) as writer:
+        for page_number, page_text in iter_pdf_pages(pdf_path, timings=timings):
+            writer.add(page_number, page_text)
+            yield page_number, page_text
+        try:
+            writer.commit(len(timings) - before)
+        except Exception as e:
+            logging.error(f"Error caching the extracted text of {pdf_path}: {e}")
+
+def extract_text_from_pdf(pdf_path: str) -> str:
+    """Extract text from PDF file page by page to reduce memory overhead."""
+    return "\n".join(page_text for _, page_text in iter_pdf_pages(pdf_path))
+
+SPLITTER_ARGS = (SENTENCE_SPLITTER, NLTK_DATA_DIR or None, NLTK_DOWNLOAD)
 
 def split_text_into_sentences(text: str) -> List[str]:
-    """Splits a large text into sentences using NLTK."""
+    """Splits a large text into sentences with the configured splitter."""
+    try:
+        return get_sentence_splitter(*SPLITTER_ARGS).split(text)
+    except Exception as e:
+        logging.error(f"Error splitting text into sentences: {e}")
+        raise
+
+def iter_page_spans(pages: Iterable[Tuple[int, str]], min_parallel_pages: int = PARALLEL_SPLIT_MIN_PAGES) -> Iterator[Tuple[int, str, List[Tuple[int, int]]]]:
+    """Yield (page number, text, sentence spans) for every page, in order.
+
+    With a splitter that is slow enough to be worth it (Punkt), the first
+    min_parallel_pages pages are split in this process, so short documents
+    never wait on the pool, and later pages are split in batches on the
+    extraction pool while this process chunks and embeds the earlier ones,
+    with a bounded number of batches in flight.
+    """
+    splitter = get_sentence_splitter(*SPLITTER_ARGS)
+    parallel = splitter.parallel and min_parallel_pages > 0
+    pages = iter(pages)
+    serial = 0
+    for page_number, page_text in pages:
+        yield page_number, page_text, splitter.spans(page_text)
+        serial += 1
+        if parallel and serial >= min_parallel_pages:
+            break
+    else:
+        return
+
+    pool = get_extract_pool()
+    pending = deque()  # (batch of pages, future of their spans)
     try:
-        sentences = sent_tokenize(text)
-        return sentences
+        for batch in iter_batches(pages, PAGES_PER_SPLIT_TASK):
+            pending.append((batch, pool.submit(split_pages, [page_text for _, page_text in batch], *SPLITTER_ARGS)))
+            if len(pending) < 2 * PDF_EXTRACT_WORKERS:
+                continue
+            batch, future = pending.popleft()
+            for (page_number, page_text), spans in zip(batch, future.result()):
+                yield page_number, page_text, spans
+        while pending:
+            batch, future = pending.popleft()
+            for (page_number, page_text), spans in zip(batch, future.result()):
+                yield page_number, page_text, spans
+    finally:
+        # Stop pending batches if the consumer gave up early
+        for _, future in pending:
+            future.cancel()
+
+def iter_sentences(pages: Iterable[Tuple[int, str]]) -> Iterator[Sentence]:
+    """Yield sentences page by page with their page number and document offset."""
+    page_offset = 0
+    try:
+        for page_number, page_text, spans in iter_page_spans(pages):
+            for start, end in spans:
+                yield Sentence(page_text[start:end], page_number, page_offset + start)
+            # Pages are joined with a newline, as in extract_text_from_pdf
+            page_offset += len(page_text) + 1
     except Exception as e:
         logging.error(f"Error splitting text into sentences: {e}")
         raise
 
+def count_words(words: List[str]) -> List[int]:
+    """Size every word as one unit."""
+    return [1] * len(words)
+
+def iter_chunks(
+    sentences: Iterable[Sentence],
+    max_chunk_size: int = MAX_CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    length_function: Callable[[List[str]], List[int]] = count_words,
+) -> Iterator[Chunk]:
+    """Yield overlapping chunks as soon as each one is complete.
+
+    Words are kept in a deque with a running size, so every word is added and
+    removed once. Chunks break on sentence boundaries; a sentence that is
+    longer than max_chunk_size on its own is split between words.
+    """
+    if chunk_overlap >= max_chunk_size:
+        raise ValueError("chunk_overlap must be smaller than max_chunk_size")
+
+    window = deque()  # (word, size, page, start_char, end_char)
+    window_size = 0
+    new_words = 0  # words added since the last emitted chunk
+
+    def emit() -> Chunk:
+        nonlocal window_size, new_words
+        chunk = Chunk(
+            text=" ".join(word[0] for word in window),
+            start_char=window[0][3],
+            end_char=window[-1][4],
+            page_start=window[0][2],
+            page_end=window[-1][2],
+        )
+        # Keep the last 'chunk_overlap' units as the start of the next chunk
+        while window and window_size > chunk_overlap:
+            window_size -= window.popleft()[1]
+        new_words = 0
+        return chunk
+
+    for sentence in sentences:
+        matches = list(re.finditer(r"\S+", sentence.text))
+        if not matches:
+            continue
+        sizes = length_function([m.group() for m in matches])
+        if new_words and window_size + sum(sizes) > max_chunk_size:
+            yield emit()
+        for match, size in zip(matches, sizes):
+            if new_words and window_size + size > max_chunk_size:
+                yield emit()
+            window.append((match.group(), size, sentence.page, sentence.start + match.start(), sentence.start + match.end()))
+            window_size += size
+            new_words += 1
+    if new_words:
+        yield emit()
+
 def chunk_text(sentences: List[str], max_chunk_size: int = MAX_CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[str]:
-    """Chunks the text into smaller parts based on token count and overlap."""
-    chunks = []
-    current_chunk = ""
+    """Chunks the text into smaller parts based on word count and overlap."""
+    positioned = []
+    offset = 0
     for sentence in sentences:
-        # Estimate words in the sentence
-        word_count = len(sentence.split())
-        if len(current_chunk.split()) + word_count > max_chunk_size:
-            chunks.append(current_chunk)
-            # Implement overlap by taking the last 'chunk_overlap' words
-            overlap_words = current_chunk.split()[-chunk_overlap:]
-            current_chunk = " ".join(overlap_words) + " " + sentence
-        else:
-            current_chunk += " " + sentence
-    if current_chunk:
-        chunks.append(current_chunk)
-    return chunks
+        positioned.append(Sentence(sentence, 1, offset))
+        offset += len(sentence) + 1
+    return [chunk.text for chunk in iter_chunks(positioned, max_chunk_size, chunk_overlap)]
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[List]:
+    """Group an iterable into lists of at most batch_size items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def load_sentence_transformer(model_name: str) -> "SentenceTransformer":
+    """Load an embedding model; sentence-transformers (and torch) are imported on the first call."""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+class EmbeddingModelRegistry:
+    """Process-wide registry that loads each SentenceTransformer once and keeps it warm."""
+
+    def __init__(self, memory_budget_mb: int = EMBEDDING_MODEL_MEMORY_BUDGET_MB, idle_timeout: int = EMBEDDING_MODEL_IDLE_TIMEOUT):
+        self.memory_budget_bytes = memory_budget_mb * 1024 * 1024
+        self.idle_timeout = idle_timeout
+        self._models = OrderedDict()  # model name -> SentenceTransformer, least recently used first
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    @staticmethod
+    def _model_size_bytes(model: "SentenceTransformer") -> int:
+        """Estimate the resident memory of a model from its parameters and buffers."""
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    def _lookup(self, model_name: str):
+        """Return an already loaded model and mark it as used. Caller holds the lock."""
+        model = self._models.get(model_name)
+        if model is not None:
+            self._models.move_to_end(model_name)
+            self._stats[model_name]["hits"] += 1
+            self._stats[model_name]["last_used"] = time.time()
+        return model
+
+    def get(self, model_name: str) -> "SentenceTransformer":
+        """Return a loaded model, loading it on first use."""
+        with self._lock:
+            model = self._lookup(model_name)
+            if model is not None:
+                return model
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+
+        # Only one thread loads a given model; the others wait and reuse it
+        with load_lock:
+            with self._lock:
+                model = self._lookup(model_name)
+                if model is not None:
+                    return model
+
+            logging.info(f"Loading embedding model: {model_name}")
+            start = time.perf_counter()
+            model = load_sentence_transformer(model_name)
+            load_seconds = time.perf_counter() - start
+            size_bytes = self._model_size_bytes(model)
+            logging.info(f"Loaded embedding model {model_name} in {load_seconds:.2f}s ({size_bytes / 1024 / 1024:.1f} MB)")
+
+            with self._lock:
+                previous = self._stats.get(model_name, {})
+                self._models[model_name] = model
+                self._stats[model_name] = {
+                    "load_seconds": round(load_seconds, 3),
+                    "resident_bytes": size_bytes,
+                    "loads": previous.get("loads", 0) + 1,
+                    "hits": previous.get("hits", 0),
+                    "last_used": time.time(),
+                }
+                self._evict(keep=model_name)
+            return model
+
+    def preload(self, model_names: Iterable[str]):
+        """Load the given models ahead of the first request."""
+        for model_name in model_names:
+            try:
+                self.get(model_name)
+            except Exception as e:
+                logging.error(f"Error preloading embedding model {model_name}: {e}")
+
+    def _evict(self, keep: str = None):
+        """Drop idle models and least recently used models above the memory budget. Caller holds the lock."""
+        now = time.time()
+        for name in list(self._models):
+            if name != keep and now - self._stats[name]["last_used"] > self.idle_timeout:
+                self._unload(name, reason="idle")
+        for name in list(self._models):
+            if self._resident_bytes() <= self.memory_budget_bytes:
+                break
+            if name != keep:
+                self._unload(name, reason="memory budget")
+
+    def _unload(self, model_name: str, reason: str):
+        self._models.pop(model_name, None)
+        logging.info(f"Evicted embedding model {model_name} ({reason})")
+
+    def _resident_bytes(self) -> int:
+        return sum(self._stats[name]["resident_bytes"] for name in self._models)
+
+    def evict_idle(self):
+        """Drop models that have not been used within the idle timeout."""
+        with self._lock:
+            self._evict()
+
+    def stats(self) -> Dict:
+        """Return load-time and resident-memory stats for every model seen so far."""
+        with self._lock:
+            return {
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "resident_bytes": self._resident_bytes(),
+                "models": {
+                    name: dict(stat, loaded=name in self._models)
+                    for name, stat in self._stats.items()
+                },
+            }
+
+EMBEDDING_MODELS = EmbeddingModelRegistry()
+
+ANSWER_CACHE = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, SEMANTIC_CACHE_THRESHOLD) if ANSWER_CACHE_ENABLED else None
+EMBEDDING_CACHE = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_MB * 1024 * 1024) if EMBEDDING_CACHE_ENABLED else None
+SESSIONS = ChatSessionStore(SESSION_DB_PATH, SESSION_TTL, QUERY_REWRITE_CACHE_SIZE, SESSION_WARM_MAX)
+
+def invalidate_answers(collection_name: str):
+    """Drop cached answers and chunks kept by chat sessions about a collection whose content changes."""
+    if ANSWER_CACHE is not None:
+        ANSWER_CACHE.invalidate(collection_name)
+    SESSIONS.invalidate(collection_name)
 
 def get_embedding(text: str, embedding_model_name: str) -> List[float]:
     """Generate embeddings for the given text using SentenceTransformer."""
+    return embed_texts([text], embedding_model_name)[0].tolist()
+
+def embed_texts(texts: List[str], embedding_model_name: str, batch_size: int = EMBEDDING_BATCH_SIZE, normalize: bool = NORMALIZE_EMBEDDINGS) -> np.ndarray:
+    """Encode texts in batches and return a contiguous float32 matrix with one row per text.
+
+    Vectors are looked up in the embedding cache first, so only texts that
+    were never encoded with this model are passed to it.
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
     try:
-        model = SentenceTransformer(embedding_model_name)
-        embedding = model.encode(text).tolist()
-        return embedding
+        cache_key = f"{embedding_model_name}#normalized" if normalize else embedding_model_name
+        hashes = [compute_md5(text) for text in texts]
+        cached = EMBEDDING_CACHE.get_many(cache_key, hashes) if EMBEDDING_CACHE is not None else {}
+
+        missing = [i for i, text_hash in enumerate(hashes) if text_hash not in cached]
+        encoded = None
+        if missing:
+            model = EMBEDDING_MODELS.get(embedding_model_name)
+            encoded = model.encode(
+                [texts[i] for i in missing],
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=normalize,
+                show_progress_bar=False,
+            )
+            encoded = np.ascontiguousarray(encoded, dtype=np.float32)
+            if EMBEDDING_CACHE is not None:
+                EMBEDDING_CACHE.put_many(cache_key, [(hashes[i], vector) for i, vector in zip(missing, encoded)])
+            if len(missing) == len(texts):
+                return encoded
+
+        vectors = np.empty((len(texts), len(next(iter(cached.values())))), dtype=np.float32)
+        for i, text_hash in enumerate(hashes):
+            if text_hash in cached:
+                vectors[i] = cached[text_hash]
+        if encoded is not None:
+            vectors[missing] = encoded
+        return vectors
     except Exception as e:
-        logging.error(f"Error generating embedding for text: {e}")
+        logging.error(f"Error generating embeddings for {len(texts)} texts: {e}")
         raise
 
-def initialize_qdrant_client(qdrant_cloud_url: str, qdrant_api_key: str):
+# One thread encodes the chunks of all ingestions, which queue their batches and keep chunking meanwhile
+INGEST_EMBED_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-embed")
+INGEST_BATCHER = ChunkEmbeddingBatcher(embed_texts, INGEST_EMBED_EXECUTOR, max_batch_size=INGEST_EMBED_BATCH_SIZE)
+
+def get_chunk_sizing(embedding_model_name: str) -> Tuple[int, int, Callable[[List[str]], List[int]]]:
+    """Return (max chunk size, overlap, length function) for the configured CHUNK_SIZE_UNIT.
+
+    With token sizing, chunks are measured with the embedding model's own
+    tokenizer and capped at its max sequence length so they are never
+    truncated when encoded.
+    """
+    if CHUNK_SIZE_UNIT != "tokens":
+        return MAX_CHUNK_SIZE, CHUNK_OVERLAP, count_words
+
+    model = EMBEDDING_MODELS.get(embedding_model_name)
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        logging.warning(f"Embedding model {embedding_model_name} has no tokenizer, chunking by words.")
+        return MAX_CHUNK_SIZE, CHUNK_OVERLAP, count_words
+
+    max_chunk_size = MAX_CHUNK_SIZE
+    if getattr(model, "max_seq_length", None):
+        max_chunk_size = min(max_chunk_size, model.max_seq_length - 2)  # Room for [CLS] and [SEP]
+    chunk_overlap = min(CHUNK_OVERLAP, max_chunk_size // 4)
+
+    def count_tokens(words: List[str]) -> List[int]:
+        return [len(ids) for ids in tokenizer(words, add_special_tokens=False)["input_ids"]]
+
+    return max_chunk_size, chunk_overlap, count_tokens
+
+class ClientPool:
+    """Keeps one client per settings key, built on first use and reused afterwards."""
+
+    def __init__(self, name: str, factory: Callable, close: Optional[Callable] = None):
+        self.name = name
+        self._factory = factory
+        self._close = close
+        self._clients = {}
+        self._retired = []  # (monotonic time dropped, client)
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple):
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                logging.info(f"Creating {self.name} client")
+                client = self._factory(*key)
+                self._clients[key] = client
+            return client
+
+    def retain(self, keys: Iterable[Tuple]):
+        """Drop clients built for settings other than keys.
+
+        Dropped clients are not closed here because in-flight requests or
+        ingestion jobs may still hold them; close_retired closes them once
+        they have been out of use for a while, and close_all at shutdown.
+        """
+        keys = set(keys)
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key in self._clients if key not in keys]:
+                logging.info(f"Dropping {self.name} client for outdated settings")
+                self._retired.append((now, self._clients.pop(key)))
+
+    async def close_retired(self, grace: float):
+        """Close clients dropped at least grace seconds ago."""
+        cutoff = time.monotonic() - grace
+        with self._lock:
+            clients = [client for dropped, client in self._retired if dropped <= cutoff]
+            self._retired = [(dropped, client) for dropped, client in self._retired if dropped > cutoff]
+        await self._close_clients(clients)
+
+    async def close_all(self):
+        with self._lock:
+            clients = list(self._clients.values()) + [client for _, client in self._retired]
+            self._clients.clear()
+            self._retired.clear()
+        await self._close_clients(clients)
+
+    async def _close_clients(self, clients: List):
+        if self._close is not None:
+            for client in clients:
+                try:
+                    result = self._close(client)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    logging.error(f"Error closing {self.name} client: {e}")
+
+def create_qdrant_client(qdrant_cloud_url: str, qdrant_api_key: str) -> "QdrantClient":
     """Initialize and return a Qdrant client."""
     try:
+        from qdrant_client import QdrantClient
         client = QdrantClient(
             url=qdrant_cloud_url,
             api_key=qdrant_api_key,
+            prefer_grpc=QDRANT_PREFER_GRPC,
+            grpc_port=QDRANT_GRPC_PORT,
         )
         return client
     except Exception as e:
         logging.error(f"Error initializing Qdrant client: {e}")
         raise
 
-def create_collection(client: QdrantClient, collection_name: str, embedding_size: int):
-    """Create a collection in Qdrant if it doesn't exist."""
+def create_async_qdrant_client(qdrant_cloud_url: str, qdrant_api_key: str) -> "AsyncQdrantClient":
+    """Initialize and return an async Qdrant client for the query path."""
     try:
-        client.recreate_collection(
-            collection_name=collection_name,
-            vectors_config=VectorParams(size=embedding_size, distance=Distance.COSINE),
+        from qdrant_client import AsyncQdrantClient
+        return AsyncQdrantClient(
+            url=qdrant_cloud_url,
+            api_key=qdrant_api_key,
+            prefer_grpc=QDRANT_PREFER_GRPC,
+            grpc_port=QDRANT_GRPC_PORT,
         )
-        logging.info(f"Collection '{collection_name}' created or already exists.")
     except Exception as e:
-        logging.error(f"Error creating Qdrant collection: {e}")
+        logging.error(f"Error initializing async Qdrant client: {e}")
         raise
 
-async def process_and_upsert_pdf(file_path: str, collection_name: str, qdrant_cloud_url: str, qdrant_api_key: str, embedding_model: str):
-    """Process the PDF, chunk text, generate embeddings, and upsert to Qdrant."""
+def create_llm(groq_api_key: str, llm_model: Optional[str]) -> "ChatGroq":
+    """Initialize and return a Groq chat model."""
+    from langchain_groq import ChatGroq
+    if llm_model:
+        return ChatGroq(temperature=0.0, groq_api_key=groq_api_key, model_name=llm_model)
+    return ChatGroq(temperature=0.0, groq_api_key=groq_api_key)
+
+QDRANT_CLIENTS = ClientPool("Qdrant", create_qdrant_client, close=lambda client: client.close())
+ASYNC_QDRANT_CLIENTS = ClientPool("async Qdrant", create_async_qdrant_client, close=lambda client: client.close())
+LLM_CLIENTS = ClientPool("Groq", create_llm)
+
+def initialize_qdrant_client(qdrant_cloud_url: str, qdrant_api_key: str) -> "QdrantClient":
+    """Return the pooled Qdrant client for the given settings."""
+    return QDRANT_CLIENTS.get((qdrant_cloud_url, qdrant_api_key))
+
+LOCAL_VECTOR_STORE = LocalVectorStore(
+    LOCAL_VECTOR_STORE_DIR, LOCAL_ANN_THRESHOLD, VECTOR_QUANTIZATION, QUANTIZATION_OVERSAMPLING, QUANTIZATION_RESCORE,
+) if VECTOR_STORE == "local" else None
+VECTOR_REDUCERS = VectorReducerStore(VECTOR_REDUCERS_DIR)
+LEXICAL_INDEXES = LexicalIndexStore(LEXICAL_INDEX_DIR) if HYBRID_SEARCH else None
+
+def get_llm(groq_api_key: str, llm_model: Optional[str] = None) -> "ChatGroq":
+    """Return the pooled Groq chat model for the given settings."""
+    return LLM_CLIENTS.get((groq_api_key, llm_model))
+
+def get_vector_store(qdrant_cloud_url: str, qdrant_api_key: str) -> VectorStore:
+    """Return the configured vector store: the local one, or Qdrant through the pooled client."""
+    if LOCAL_VECTOR_STORE is not None:
+        return LOCAL_VECTOR_STORE
+    return QdrantVectorStore(
+        initialize_qdrant_client(qdrant_cloud_url, qdrant_api_key),
+        batch_size=BATCH_SIZE,
+        page_size=SCROLL_PAGE_SIZE,
+        async_client=ASYNC_QDRANT_CLIENTS.get((qdrant_cloud_url, qdrant_api_key)),
+        quantization=VECTOR_QUANTIZATION,
+        oversampling=QUANTIZATION_OVERSAMPLING,
+        rescore=QUANTIZATION_RESCORE,
+    )
+
+def stored_vector_size(embedding_size: int) -> int:
+    """Dimensions of the vectors stored for an embedding model, after any configured reduction."""
+    if VECTOR_REDUCTION and 0 < VECTOR_DIMENSIONS < embedding_size:
+        return VECTOR_DIMENSIONS
+    return embedding_size
+
+def storage_settings() -> str:
+    """Vector storage settings recorded with an ingestion, so changing them rebuilds collections."""
+    if VECTOR_QUANTIZATION == "none" and not VECTOR_REDUCTION:
+        return ""
+    return f"|{VECTOR_QUANTIZATION}|{VECTOR_REDUCTION}:{VECTOR_DIMENSIONS}"
+
+def splitter_settings() -> str:
+    """The sentence splitter in use, recorded with an ingestion unless it is Punkt, so other boundaries re-chunk collections."""
+    name = get_sentence_splitter(*SPLITTER_ARGS).name
+    return "" if name == "nltk" else f"|splitter:{name}"
+
+def get_ingestion_record(collection_name: str) -> Optional[Dict]:
+    """Return the file hash and settings of the last completed ingestion into a collection."""
+    with sqlite3.connect(INGESTION_DB_PATH) as conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingestions ("
+            "collection_name TEXT PRIMARY KEY, file_hash TEXT, embedding_model TEXT, chunking TEXT, updated_at REAL)"
+        )
+        row = conn.execute(
+            "SELECT file_hash, embedding_model, chunking FROM ingestions WHERE collection_name = ?",
+            (collection_name,),
+        ).fetchone()
+    if row is None:
+        return None
+    return {"file_hash": row[0], "embedding_model": row[1], "chunking": row[2]}
+
+def clear_ingestion_record(collection_name: str):
+    """Forget the last ingestion while a collection is being modified, so a failed job is never skipped later."""
+    get_ingestion_record(collection_name)  # Ensures the table exists
+    with sqlite3.connect(INGESTION_DB_PATH) as conn:
+        conn.execute("DELETE FROM ingestions WHERE collection_name = ?", (collection_name,))
+
+def ingestion_key(collection_name: str, doc_id: Optional[str]) -> str:
+    """Ingestion record key: the collection, or collection/document in shared collections."""
+    return collection_name if doc_id is None else f"{collection_name}/{doc_id}"
+
+def ingestion_keys(collection_name: str) -> List[str]:
+    """Ingestion record keys of a collection: its own, or those of the documents of a shared collection."""
+    get_ingestion_record(collection_name)  # Ensures the table exists
+    with sqlite3.connect(INGESTION_DB_PATH) as conn:
+        rows = conn.execute(
+            "SELECT collection_name FROM ingestions WHERE collection_name = ? OR substr(collection_name, 1, ?) = ?",
+            (collection_name, len(collection_name) + 1, f"{collection_name}/"),
+        ).fetchall()
+    return [key for (key,) in rows]
+
+def collection_models(collection_name: str, exclude_key: Optional[str] = None) -> Set[str]:
+    """Embedding models a collection's vectors were made with: the one recorded when it was created, and those of its ingestion records other than exclude_key."""
+    get_ingestion_record(collection_name)  # Ensures the table exists
+    with sqlite3.connect(INGESTION_DB_PATH) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS collection_models (collection_name TEXT PRIMARY KEY, embedding_model TEXT)")
+        models = {model for model, in conn.execute(
+            "SELECT embedding_model FROM collection_models WHERE collection_name = ?", (collection_name,)
+        )}
+        models.update(model for model, in conn.execute(
+            "SELECT embedding_model FROM ingestions WHERE (collection_name = ? OR substr(collection_name, 1, ?) = ?) AND collection_name != ?",
+            (collection_name, len(collection_name) + 1, f"{collection_name}/", exclude_key or ""),
+        ))
+    return models
+
+def save_collection_model(collection_name: str, embedding_model: str):
+    """Remember the embedding model of a collection's vectors, so documents added later must use it too."""
+    with sqlite3.connect(INGESTION_DB_PATH) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS collection_models (collection_name TEXT PRIMARY KEY, embedding_model TEXT)")
+        conn.execute("INSERT OR REPLACE INTO collection_models (collection_name, embedding_model) VALUES (?, ?)", (collection_name, embedding_model))
+
+def list_documents(collection_name: str) -> List[Dict]:
+    """Documents ingested into a collection, from the ingestion records."""
+    get_ingestion_record(collection_name)  # Ensures the table exists
+    with sqlite3.connect(INGESTION_DB_PATH) as conn:
+        rows = conn.execute(
+            "SELECT collection_name, embedding_model, updated_at FROM ingestions "
+            "WHERE collection_name = ? OR substr(collection_name, 1, ?) = ? ORDER BY updated_at",
+            (collection_name, len(collection_name) + 1, f"{collection_name}/"),
+        ).fetchall()
+    return [
+        {"doc_id": key.split("/", 1)[1] if "/" in key else key, "embedding_model": model, "updated_at": updated_at}
+        for key, model, updated_at in rows
+    ]
+
+def save_ingestion_record(collection_name: str, file_hash: str, embedding_model: str, chunking: str):
+    """Remember what was ingested into a collection so unchanged re-uploads can be skipped."""
+    with sqlite3.connect(INGESTION_DB_PATH) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO ingestions (collection_name, file_hash, embedding_model, chunking, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (collection_name, file_hash, embedding_model, chunking, time.time()),
+        )
+
+COLLECTION_LOCKS: Dict[str, threading.Lock] = {}
+COLLECTION_LOCKS_GUARD = threading.Lock()
+DOCUMENT_LOCKS: Dict[str, threading.Lock] = {}
+
+def collection_lock(collection_name: str) -> threading.Lock:
+    """Lock serializing ingestion into one collection, so documents of a shared collection do not interleave."""
+    with COLLECTION_LOCKS_GUARD:
+        return COLLECTION_LOCKS.setdefault(collection_name, threading.Lock())
+
+def document_lock(record_key: str) -> threading.Lock:
+    """Lock held for a document's whole ingestion, so two uploads of one document never diff against the same stored chunks."""
+    with COLLECTION_LOCKS_GUARD:
+        return DOCUMENT_LOCKS.setdefault(record_key, threading.Lock())
+
+# Ingestions running at once, counting each document of a bulk upload
+INGESTION_SLOTS = threading.BoundedSemaphore(INGESTION_WORKERS)
+
+def acquire_ingestion_slot(job: Optional[IngestionJob]):
+    """Wait for one of the INGESTION_WORKERS slots, giving up if the job is cancelled meanwhile."""
+    while not INGESTION_SLOTS.acquire(timeout=0.5):
+        if job is not None:
+            job.check_cancelled()
+
+def process_and_upsert_pdf(file_path: str, collection_name: str, qdrant_cloud_url: str, qdrant_api_key: str, embedding_model: str, job: Optional[IngestionJob] = None, doc_id: Optional[str] = None, shared: bool = False) -> Dict:
+    """Ingest a PDF into a collection; see ingest_pdf.
+
+    At most INGESTION_WORKERS documents are ingested at once, including
+    those of bulk uploads, and one document only by one job at a time. The
+    ingestion is timed in the metrics and, if sampled, traced.
+    """
+    acquire_ingestion_slot(job)
+    try:
+        with document_lock(ingestion_key(collection_name, doc_id if shared else None)):
+            start = time.perf_counter()
+            status = "failed"
+            with TRACER.trace("ingestion", file=os.path.basename(file_path), collection_name=collection_name, doc_id=doc_id or collection_name) as trace:
+                try:
+                    report = ingest_pdf(file_path, collection_name, qdrant_cloud_url, qdrant_api_key, embedding_model, job, doc_id, shared)
+                    status = "skipped" if report.get("skipped") else "completed"
+                    if trace is not None:
+                        report["trace_id"] = trace.id
+                    return report
+                except JobCancelled:
+                    status = "cancelled"
+                    raise
+                finally:
+                    INGESTION_SECONDS.observe(time.perf_counter() - start, status)
+    finally:
+        INGESTION_SLOTS.release()
+
+def ingest_pdf(file_path: str, collection_name: str, qdrant_cloud_url: str, qdrant_api_key: str, embedding_model: str, job: Optional[IngestionJob] = None, doc_id: Optional[str] = None, shared: bool = False) -> Dict:
+    """Stream the PDF through chunking, embedding and upsert to Qdrant one batch at a time.
+
+    This is blocking work and runs on the ingestion job queue's worker threads.
+    When a job is given, its progress is updated after every batch and
+    cancellation is checked between batches. With hybrid search, the
+    collection's BM25 index is updated alongside it.
+
+    With shared set, the PDF is the document doc_id of a shared collection:
+    only its own points are diffed, replaced or deleted. A collection is
+    never recreated while it holds other documents.
+
+    Ingestions into one collection hold its lock. In a shared collection the
+    lock is released once the collection is set up, so several documents
+    are extracted, embedded and upserted in parallel; their BM25 updates are
+    applied at the end, one document at a time.
+    """
+    lexical = None
+    replace_lexical = False
+    doc_id = doc_id if shared and doc_id else collection_name
+    record_key = ingestion_key(collection_name, doc_id if shared else None)
+    lock = collection_lock(collection_name)
+    lock.acquire()
     try:
-        logging.info(f"Processing PDF: {file_path}, Collection: {collection_name}")
+        logging.info(f"Processing PDF: {file_path}, Collection: {collection_name}, Document: {doc_id}")
+        upload_time = time.time()
+        start = time.perf_counter()
+        peak_rss = current_rss_bytes()
+
+        # Pages -> sentences -> chunks are generators, so only one embedding batch is in memory at a time
+        max_chunk_size, chunk_overlap, length_function = get_chunk_sizing(embedding_model)
+        chunking = f"{CHUNK_SIZE_UNIT}:{max_chunk_size}:{chunk_overlap}{splitter_settings()}{storage_settings()}"
+        file_hash = compute_file_md5(file_path)
+
+        # Qdrant or the local vector store
+        store = get_vector_store(qdrant_cloud_url, qdrant_api_key)
+
+        # Create the collection up front, or keep it for an incremental update
+        embedding_size = EMBEDDING_MODELS.get(embedding_model).get_sentence_embedding_dimension()
+        previous = get_ingestion_record(record_key)
+        same_settings = previous is not None and previous["embedding_model"] == embedding_model and previous["chunking"] == chunking
+        vector_size = stored_vector_size(embedding_size)
+        collection_matches = store.collection_matches(collection_name, vector_size)
+        doc_filter = doc_id if shared else None
+        if shared and collection_matches:
+            # Vectors of another model of the same size would land in the collection unnoticed
+            other_models = collection_models(collection_name, record_key) - {embedding_model}
+            if other_models and any(key != record_key for key in ingestion_keys(collection_name)):
+                raise ValueError(
+                    f"Collection '{collection_name}' holds documents embedded with {', '.join(sorted(other_models))}, not {embedding_model}"
+                )
+            if other_models:
+                collection_matches = False  # Nothing but this document is in it, so it is recreated for the new model
+        if INCREMENTAL_INGESTION and same_settings and collection_matches:
+            lexical = LEXICAL_INDEXES.get(collection_name) if LEXICAL_INDEXES is not None else None
+            unindexed = lexical is not None and not lexical.point_ids(doc_filter)
+            if previous["file_hash"] == file_hash and not unindexed:
+                logging.info(f"PDF unchanged since last ingestion, skipping: {file_path}")
+                return {"collection_name": collection_name, "doc_id": doc_id, "skipped": True, "seconds": round(time.perf_counter() - start, 3)}
+            stored = {
+                chunk_id: tuple(payload.get(field) for field in POSITION_FIELDS)
+                for chunk_id, payload in store.get_payloads(collection_name, POSITION_FIELDS, doc_filter).items()
+            }
+            logging.info(f"Incremental update of collection '{collection_name}' with {len(stored)} stored chunks")
+        elif shared and collection_matches:
+            # Replace this document's points and keep the other documents
+            lexical = LEXICAL_INDEXES.get(collection_name) if LEXICAL_INDEXES is not None else None
+            store.create_payload_indexes(collection_name)
+            previous_ids = list(store.get_payloads(collection_name, [], doc_id))
+            if previous_ids:
+                store.delete(collection_name, previous_ids)
+            replace_lexical = True
+            stored = {}
+        else:
+            if any(key != record_key for key in ingestion_keys(collection_name)):
+                if shared:
+                    raise ValueError(f"Collection '{collection_name}' holds other documents embedded with a different model")
+                raise ValueError(f"Collection '{collection_name}' holds other documents; upload into it as a shared collection")
+            store.create_collection(collection_name, vector_size)
+            stored = {}
+            if LEXICAL_INDEXES is not None:
+                lexical = LEXICAL_INDEXES.create(collection_name)
+            VECTOR_REDUCERS.put(collection_name, None)
+            if vector_size < embedding_size:
+                VECTOR_REDUCERS.put(collection_name, VectorReducer(VECTOR_REDUCTION, vector_size))
+        save_collection_model(collection_name, embedding_model)
+        clear_ingestion_record(record_key)
+        invalidate_answers(collection_name)
+
+        # A new PCA reducer is fitted on the first vectors; their upserts wait until then
+        reducer = VECTOR_REDUCERS.get(collection_name)
+        held_back = []
+
+        # From here on a shared-collection document only touches its own points, unless it still has to fit the reducer
+        if shared and (reducer is None or reducer.fitted):
+            lock.release()
+            lock = None
+
+        def upsert(ids: List[str], vectors: np.ndarray, payloads: List[dict]):
+            if reducer is None:
+                store.upsert(collection_name, ids, vectors, payloads)
+                return
+            held_back.append((ids, vectors, payloads))
+            if reducer.fitted or sum(len(batch[0]) for batch in held_back) >= PCA_FIT_SAMPLES:
+                flush_upserts()
 
-        # Extract text
-        text = extract_text_from_pdf(file_path)
+        def flush_upserts():
+            if held_back and not reducer.fitted:
+                reducer.fit(np.concatenate([vectors for _, vectors, _ in held_back]))
+                VECTOR_REDUCERS.put(collection_name, reducer)
+            for ids, vectors, payloads in held_back:
+                store.upsert(collection_name, ids, reducer.transform(vectors), payloads)
+            held_back.clear()
 
-        # Split into sentences
-        sentences = split_text_into_sentences(text)
+        # Time spent pulling from each generator is charged to its own stage
+        stages = StageTimer()
+        page_timings = []
+        # A file extracted before, e.g. for other chunk sizes or another embedding model, is not parsed again
+        cached_pages = EXTRACTION_CACHE.get(file_hash) if EXTRACTION_CACHE is not None else None
+        if cached_pages is not None:
+            logging.info(f"Reusing the extracted text of {file_path} ({cached_pages.page_count} pages)")
+            pages = stages.iterate(cached_pages, "extract")
+        else:
+            pages = stages.iterate(extract_and_cache_pages(file_path, file_hash, page_timings), "extract")
+        sentences = stages.iterate(iter_sentences(pages), "split")
+        chunks = stages.iterate(iter_chunks(sentences, max_chunk_size, chunk_overlap, length_function), "chunk")
+
+        def page_count() -> int:
+            return cached_pages.page_count if cached_pages is not None else len(page_timings)
+
+        total_chunks = 0
+        embedded_chunks = 0
+        seen_ids = set()
+        lexical_ids, lexical_texts = [], []
+        # The batch being encoded while the next one is extracted and chunked: (future, ids, payloads)
+        encoding = None
+
+        def finish_encoding():
+            nonlocal encoding, embedded_chunks
+            if encoding is None:
+                return
+            future, ids, payloads = encoding
+            encoding = None
+            with stages.stage("embed"):
+                vectors = future.result()
+            with stages.stage("upsert"):
+                upsert(ids, vectors, payloads)
+            embedded_chunks += len(ids)
+            if job is not None:
+                job.update(pages_parsed=page_count(), chunks_embedded=embedded_chunks, points_upserted=embedded_chunks)
 
-        # Chunk the sentences
-        chunks = chunk_text(sentences)
+        for chunk_batch in iter_batches(chunks, EMBEDDING_BATCH_SIZE):
+            if job is not None:
+                job.check_cancelled()
 
-        # Initialize Qdrant client
-        client = initialize_qdrant_client(qdrant_cloud_url, qdrant_api_key)
+            # Only embed chunks that are not already stored; stored ones may just have moved
+            new_chunks = []
+            moved_chunks = []
+            unindexed_chunks = []
+            for chunk in chunk_batch:
+                chunk_id = point_id(chunk.text, doc_id if shared else None)
+                if chunk_id in seen_ids:
+                    continue
+                seen_ids.add(chunk_id)
+                if chunk_id not in stored:
+                    new_chunks.append((chunk_id, chunk))
+                elif stored[chunk_id] != tuple(getattr(chunk, field) for field in POSITION_FIELDS):
+                    moved_chunks.append((chunk_id, chunk))
+                # Stored chunks missing from the BM25 index, e.g. ingested before hybrid search was enabled
+                if chunk_id in stored and lexical is not None and chunk_id not in lexical:
+                    unindexed_chunks.append((chunk_id, chunk))
 
-        # Determine embedding size
-        sample_embedding = get_embedding(chunks[0], embedding_model)  # Get one sample embedding
-        embedding_size = len(sample_embedding)
+            if new_chunks:
+                finish_encoding()
+                ids = [chunk_id for chunk_id, _ in new_chunks]
+                payloads = [{**chunk.payload(), "doc_id": doc_id, "upload_time": upload_time} for _, chunk in new_chunks]
+                encoding = (INGEST_BATCHER.submit([chunk.text for _, chunk in new_chunks], embedding_model), ids, payloads)
+            if lexical is not None:
+                lexical_ids.extend(chunk_id for chunk_id, _ in new_chunks + unindexed_chunks)
+                lexical_texts.extend(chunk.text for _, chunk in new_chunks + unindexed_chunks)
+            if moved_chunks:
+                with stages.stage("upsert"):
+                    store.set_payloads(collection_name, [
+                        (chunk_id, {field: getattr(chunk, field) for field in POSITION_FIELDS})
+                        for chunk_id, chunk in moved_chunks
+                    ])
 
-        # Create collection
-        create_collection(client, collection_name, embedding_size)
+            total_chunks += len(chunk_batch)
+            peak_rss = max(peak_rss, current_rss_bytes())
+            if job is not None:
+                job.update(pages_parsed=page_count(), chunks_embedded=embedded_chunks, points_upserted=embedded_chunks)
+        finish_encoding()
 
-        # Prepare points for Qdrant
-        points = []
-        for chunk in chunks:
-            chunk_id = compute_md5(chunk)
-            embedding = get_embedding(chunk, embedding_model)
-            point = PointStruct(id=chunk_id, vector=embedding, payload={"content": chunk})
-            points.append(point)
+        if reducer is not None:
+            with stages.stage("upsert"):
+                flush_upserts()
 
-        # Upsert points in batches
-        for i in range(0, len(points), BATCH_SIZE):
-            batch = points[i:i + BATCH_SIZE]
-            client.upsert(collection_name=collection_name, points=batch, wait=True)  # Ensure upsert completes
-            logging.info(f"Upserted batch {i // BATCH_SIZE + 1} of {len(points) // BATCH_SIZE + 1} to Qdrant.")
+        # Remove chunks that no longer occur in the document
+        vanished_ids = [chunk_id for chunk_id in stored if chunk_id not in seen_ids]
+        if vanished_ids:
+            with stages.stage("upsert"):
+                store.delete(collection_name, vanished_ids)
+            logging.info(f"Deleted {len(vanished_ids)} vanished chunks from collection '{collection_name}'")
+        if lexical is not None:
+            # One document's BM25 changes are committed together, without pending changes of others in between
+            with stages.stage("index"), lexical.lock:
+                try:
+                    if replace_lexical:
+                        lexical.remove(lexical.point_ids(doc_id))
+                    lexical.add(lexical_ids, lexical_texts, group=doc_id)
+                    lexical.remove([chunk_id for chunk_id in lexical.point_ids(doc_filter) if chunk_id not in seen_ids])
+                    lexical.commit()
+                except Exception:
+                    lexical.rollback()
+                    raise
 
-        logging.info(f"PDF processing and upsert completed for: {file_path}")
+        if total_chunks == 0:
+            logging.warning(f"No text could be extracted from PDF: {file_path}")
+
+        save_ingestion_record(record_key, file_hash, embedding_model, chunking)
+        # Answers given while the collection was changing are stale as well
+        invalidate_answers(collection_name)
+        if job is not None:
+            job.update(pages_parsed=page_count())
+
+        stages.observe(INGESTION_STAGE_SECONDS)
+        for _, seconds in page_timings:
+            PAGE_EXTRACT_SECONDS.observe(seconds)
+        INGESTED_PAGES.inc(len(page_timings))
+        EMBEDDED_CHUNKS.inc(embedded_chunks)
+
+        report = {
+            "collection_name": collection_name,
+            "doc_id": doc_id,
+            "pages": page_count(),
+            "extraction_cached": cached_pages is not None,
+            "extract_seconds": round(sum(seconds for _, seconds in page_timings), 3),
+            "stage_seconds": {stage: round(seconds, 3) for stage, seconds in stages.seconds.items()},
+            "slowest_pages": sorted(page_timings, key=lambda timing: timing[1], reverse=True)[:5],
+            "chunks": total_chunks,
+            "chunks_embedded": embedded_chunks,
+            "chunks_deleted": len(vanished_ids),
+            "seconds": round(time.perf_counter() - start, 3),
+            "peak_rss_bytes": peak_rss,
+        }
+        logging.info(f"PDF processing and upsert completed for: {file_path} ({total_chunks} chunks, peak RSS {peak_rss / 1024 / 1024:.1f} MB)")
+        return report
 
     except Exception as e:
         logging.error(f"Error processing and upserting PDF: {e}")
         raise
+    finally:
+        if lock is not None:
+            lock.release()
+
+INGESTION_JOBS = JobQueue(max_workers=INGESTION_WORKERS, max_pending=INGESTION_QUEUE_SIZE)
+
+COLD_START = {"ready_seconds": None, "warm_seconds": None}
+_warmup_tasks = set()
+
+def record_cold_start(phase: str):
+    seconds = time.perf_counter() - IMPORT_STARTED
+    COLD_START[f"{phase}_seconds"] = round(seconds, 3)
+    COLD_START_SECONDS.set(seconds, phase)
+
+async def finish_warmup(pending):
+    """Wait for warm-up work that outlasted the cold-start budget."""
+    for result in await asyncio.gather(*pending, return_exceptions=True):
+        if isinstance(result, Exception):
+            logging.error(f"Error warming up in the background: {result}")
+    record_cold_start("warm")
+    logging.info(f"Warm-up finished {COLD_START['warm_seconds']:.2f}s after start")
+
+@app.on_event("startup")
+async def preload_embedding_models():
+    """Warm up the sentence splitter, embedding models and reranker before serving requests.
+
+    Requests are served once warm-up is done or COLD_START_BUDGET_SECONDS
+    after import, whichever comes first; the rest of the warm-up carries
+    on in the background.
+    """
+    loop = asyncio.get_running_loop()
+    warmups = [loop.run_in_executor(None, get_sentence_splitter, *SPLITTER_ARGS)]
+    if PRELOAD_EMBEDDING_MODELS:
+        warmups.append(loop.run_in_executor(None, EMBEDDING_MODELS.preload, PRELOAD_EMBEDDING_MODELS))
+    if RERANKER is not None:
+        # Loading on the first question would blow its latency budget
+        warmups.append(loop.run_in_executor(RERANK_EXECUTOR, RERANKER.load))
+
+    remaining = COLD_START_BUDGET_SECONDS - (time.perf_counter() - IMPORT_STARTED)
+    done, pending = await asyncio.wait(warmups, timeout=max(remaining, 0))
+    record_cold_start("ready")
+    for future in done:
+        future.result()
+    if pending:
+        logging.warning(
+            f"Cold-start budget of {COLD_START_BUDGET_SECONDS:g}s used up after {COLD_START['ready_seconds']:.2f}s; "
+            f"serving requests while {len(pending)} warm-up tasks finish in the background"
+        )
+        task = asyncio.create_task(finish_warmup(pending))
+        _warmup_tasks.add(task)
+        task.add_done_callback(_warmup_tasks.discard)
+    else:
+        record_cold_start("warm")
+        logging.info(f"Ready {COLD_START['ready_seconds']:.2f}s after start")
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    """Stop the background workers and close pooled clients and caches."""
+    INGESTION_JOBS.shutdown()
+    PROFILER.stop()
+    await QUERY_BATCHER.stop()
+    QUERY_EXECUTOR.shutdown(wait=False)
+    RERANK_EXECUTOR.shutdown(wait=False)
+    INGEST_EMBED_EXECUTOR.shutdown(wait=False)
+    await QDRANT_CLIENTS.close_all()
+    await ASYNC_QDRANT_CLIENTS.close_all()
+    await LLM_CLIENTS.close_all()
+    if LOCAL_VECTOR_STORE is not None:
+        LOCAL_VECTOR_STORE.close()
+    if EMBEDDING_CACHE is not None:
+        EMBEDDING_CACHE.close()
+    SESSIONS.close()
+    if _extract_pool is not None:
+        _extract_pool.shutdown(cancel_futures=True)
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    return {"status": "ok"}
+    """Health check endpoint; warm is false while models are still loading in the background."""
+    return {"status": "ok", "cold_start_seconds": COLD_START["ready_seconds"], "warm": COLD_START["warm_seconds"] is not None}
+
+@app.get("/embedding-models")
+async def embedding_model_stats():
+    """Report load time and resident memory of the registered embedding models."""
+    EMBEDDING_MODELS.evict_idle()
+    return {
+        **EMBEDDING_MODELS.stats(),
+        "query_batching": QUERY_BATCHER.stats(),
+        "ingestion_batching": INGEST_BATCHER.stats(),
+        "reranker": RERANKER.stats() if RERANKER is not None else {"enabled": False},
+    }
+
+@app.get("/embedding-cache")
+async def embedding_cache_stats():
+    """Report hit rate and size of the persistent embedding cache."""
+    if EMBEDDING_CACHE is None:
+        return {"enabled": False}
+    return {"enabled": True, **EMBEDDING_CACHE.stats()}
+
+@app.get("/extraction-cache")
+async def extraction_cache_stats():
+    """Report hit rate and size of the cache of extracted PDF text."""
+    if EXTRACTION_CACHE is None:
+        return {"enabled": False}
+    return {"enabled": True, **EXTRACTION_CACHE.stats()}
+
+def validate_collection_name(name: str, what: str = "collection name"):
+    """Raise a 400 for an empty name or one with path separators, '..' or NUL.
+
+    Anything else is accepted; the local stores map names to safe
+    directory names themselves.
+    """
+    if not name.strip() or any(part in name for part in ("/", "\\", "..", "\0")):
+        raise HTTPException(status_code=400, detail=f"Invalid {what} {name!r}: it must not be empty or contain '/', '\\', '..' or NUL.")
+
+def get_upload_settings() -> Tuple[str, str, str]:
+    """Return the Qdrant URL, API key and embedding model, raising an HTTP error if any needed one is missing."""
+    settings = MODEL_CONFIG.get("settings")
+    if not settings:
+        raise HTTPException(status_code=500, detail="Settings not configured.")
+
+    qdrant_cloud_url = settings.get("qdrant_cloud_url")
+    qdrant_api_key = settings.get("qdrant_api_key")
+    embedding_model = settings.get("embedding_model")
+
+    qdrant_settings = [qdrant_cloud_url, qdrant_api_key] if LOCAL_VECTOR_STORE is None else []
+    if not all([*qdrant_settings, embedding_model]):
+        raise HTTPException(status_code=500, detail="Missing Qdrant or embedding settings.")
+    return qdrant_cloud_url, qdrant_api_key, embedding_model
 
 @app.post("/upload-pdf")
-async def upload_pdf(file: UploadFile = File(...), background_tasks: BackgroundTasks = None):
-    """Upload a PDF file, process it, and store it in Qdrant."""
-    try:
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+async def upload_pdf(file: UploadFile = File(...), collection_name: Optional[str] = Form(None)):
+    """Upload a PDF file and queue it for processing into Qdrant.
 
-        collection_name = os.path.splitext(file.filename)[0]
-        settings = MODEL_CONFIG.get("settings")
-        if not settings:
-            raise HTTPException(status_code=500, detail="Settings not configured.")
+    Each file gets its own collection unless a shared collection is given
+    (or SHARED_COLLECTION is set); the file name then identifies the
+    document within it. The upload is spooled to a path of its own, so
+    uploads with the same name never overwrite a file a job still reads,
+    and removed once the job is done.
+    """
+    file_path = None
+    try:
+        qdrant_cloud_url, qdrant_api_key, embedding_model = get_upload_settings()
 
-        qdrant_cloud_url = settings.get("qdrant_cloud_url")
-        qdrant_api_key = settings.get("qdrant_api_key")
-        embedding_model = settings.get("embedding_model")
+        filename = os.path.basename(file.filename or "")
+        doc_id = os.path.splitext(filename)[0]
+        shared = bool(collection_name or SHARED_COLLECTION)
+        collection_name = collection_name or SHARED_COLLECTION or doc_id
+        validate_collection_name(doc_id, "file name")
+        validate_collection_name(collection_name)
 
-        if not all([qdrant_cloud_url, qdrant_api_key, embedding_model]):
-            raise HTTPException(status_code=500, detail="Missing Qdrant or embedding settings.")
+        file_path = os.path.join(INCOMING_UPLOAD_DIR, f"{uuid.uuid4().hex}.pdf")
+        await asyncio.to_thread(copy_and_hash, file.file, file_path)
 
-        # Use BackgroundTasks to avoid blocking the response
-        background_tasks.add_task(process_and_upsert_pdf, file_path, collection_name, qdrant_cloud_url, qdrant_api_key, embedding_model)
+        # Run ingestion on the job queue's worker threads so the event loop keeps serving requests
+        job = IngestionJob({"filename": filename, "collection_name": collection_name, "doc_id": doc_id})
+        INGESTION_JOBS.submit(job, lambda job: process_and_upsert_pdf(
+            file_path, collection_name, qdrant_cloud_url, qdrant_api_key, embedding_model, job=job, doc_id=doc_id, shared=shared),
+            cleanup=lambda: os.remove(file_path))
 
-        return JSONResponse(content={"message": "File uploaded. PDF processing started in the background."})
+        return JSONResponse(content={
+            "message": "File uploaded. PDF processing started in the background.",
+            "job_id": job.id,
+            "collection_name": collection_name,
+            "doc_id": doc_id,
+        })
 
+    except HTTPException:
+        raise
+    except QueueFull as e:
+        logging.warning(f"Rejected upload of {file.filename}: {e}")
+        os.remove(file_path)
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         logging.error(f"Error during file upload and processing setup: {e}")
+        if file_path is not None and os.path.exists(file_path):
+            os.remove(file_path)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/query")
-async def query_qdrant(query_request: QueryRequest):
-    """Query Qdrant database and get an answer using LLM."""
+def find_ingested_copies(file_hashes: Iterable[str], embedding_model: str) -> Dict[str, List[str]]:
+    """Ingestion record keys of files already ingested with this embedding model, by file hash."""
+    get_ingestion_record("")  # Ensures the table exists
+    file_hashes = list(set(file_hashes))
+    copies: Dict[str, List[str]] = {}
+    with sqlite3.connect(INGESTION_DB_PATH) as conn:
+        for start in range(0, len(file_hashes), 500):
+            batch = file_hashes[start:start + 500]
+            rows = conn.execute(
+                f"SELECT file_hash, collection_name FROM ingestions WHERE embedding_model = ? AND file_hash IN ({','.join('?' * len(batch))})",
+                [embedding_model, *batch],
+            ).fetchall()
+            for file_hash, key in rows:
+                copies.setdefault(file_hash, []).append(key)
+    return copies
+
+def plan_bulk_ingestion(files: List[SpooledFile], collection_name: Optional[str], embedding_model: str) -> Tuple[List[Dict], List[Dict]]:
+    """Decide which spooled PDFs to ingest into which collection, and which are duplicates.
+
+    A file is a duplicate if the same content came earlier in the upload,
+    or was already ingested with the same embedding model under another
+    name: into the same shared collection, or as its own collection.
+    Two different files with the same name cannot both be ingested, so the
+    later one is reported as a duplicate name.
+    """
+    copies = find_ingested_copies([file.file_hash for file in files], embedding_model)
+    documents, duplicates = [], []
+    seen_hashes, seen_names = {}, set()
+    for file in files:
+        doc_id = os.path.splitext(file.name)[0]
+        target = collection_name or doc_id
+        own_key = ingestion_key(target, doc_id if collection_name else None)
+        if file.file_hash in seen_hashes:
+            duplicates.append({"filename": file.name, "duplicate_of": seen_hashes[file.file_hash]})
+            continue
+        if doc_id in seen_names:
+            duplicates.append({"filename": file.name, "duplicate_of": doc_id, "reason": "duplicate name with different content"})
+            continue
+        existing = [
+            key for key in copies.get(file.file_hash, [])
+            if key != own_key and (key.startswith(f"{collection_name}/") if collection_name else "/" not in key)
+        ]
+        if existing:
+            duplicates.append({"filename": file.name, "duplicate_of": existing[0], "reason": "already ingested"})
+            continue
+        seen_hashes[file.file_hash] = doc_id
+        seen_names.add(doc_id)
+        documents.append({
+            "filename": file.name, "path": file.path, "doc_id": doc_id, "collection_name": target,
+            "shared": bool(collection_name), "size": file.size,
+        })
+    return documents, duplicates
+
+def ingest_bulk(documents: List[Dict], spool_dir: str, qdrant_cloud_url: str, qdrant_api_key: str, embedding_model: str, job: IngestionJob) -> Dict:
+    """Ingest the documents of a bulk upload on a pool of BULK_INGESTION_WORKERS threads.
+
+    Each document still takes one of the INGESTION_WORKERS slots, so bulk
+    uploads and single uploads together never ingest more documents at once.
+
+    Each document runs as a sub-job of the bulk job, so cancelling the bulk
+    job stops all of them. The spooled files are removed afterwards.
+    """
+    start = time.perf_counter()
+    totals = {"completed": 0, "skipped": 0, "failed": 0, "cancelled": 0, "pages": 0, "chunks": 0, "chunks_embedded": 0}
+    results = []
+    lock = threading.Lock()
+
+    def ingest_document(document: Dict) -> Dict:
+        subjob = job.subjob({"filename": document["filename"], "collection_name": document["collection_name"], "doc_id": document["doc_id"]})
+        result = {"filename": document["filename"], "collection_name": document["collection_name"], "doc_id": document["doc_id"]}
+        try:
+            subjob.check_cancelled()
+            report = process_and_upsert_pdf(document["path"], document["collection_name"], qdrant_cloud_url, qdrant_api_key,
+                                            embedding_model, job=subjob, doc_id=document["doc_id"], shared=document["shared"])
+            result.update(report, status="skipped" if report.get("skipped") else "completed")
+        except JobCancelled:
+            result["status"] = "cancelled"
+        except Exception as e:
+            result.update(status="failed", error=str(e))
+        return result
+
+    def record(result: Dict):
+        with lock:
+            results.append(result)
+            totals[result["status"]] += 1
+            totals["pages"] += result.get("pages", 0)
+            totals["chunks"] += result.get("chunks", 0)
+            totals["chunks_embedded"] += result.get("chunks_embedded", 0)
+            elapsed = time.perf_counter() - start
+            job.update(
+                documents_total=len(documents),
+                documents_done=len(results),
+                **{f"documents_{status}": totals[status] for status in ("completed", "skipped", "failed", "cancelled")},
+                pages_parsed=totals["pages"],
+                chunks_embedded=totals["chunks_embedded"],
+                points_upserted=totals["chunks_embedded"],
+                pages_per_second=round(totals["pages"] / elapsed, 2),
+                chunks_per_second=round(totals["chunks"] / elapsed, 2),
+            )
+
+    try:
+        workers = min(BULK_INGESTION_WORKERS, INGESTION_WORKERS)
+        logging.info(f"Bulk ingestion of {len(documents)} documents with {workers} workers")
+        job.update(documents_total=len(documents), documents_done=0)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-ingest") as pool:
+            for future in as_completed([pool.submit(ingest_document, document) for document in documents]):
+                record(future.result())
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    seconds = time.perf_counter() - start
+    logging.info(f"Bulk ingestion finished: {totals['completed']} ingested, {totals['skipped']} unchanged, "
+                 f"{totals['failed']} failed in {seconds:.1f}s ({totals['pages'] / seconds:.1f} pages/s)")
+    job.check_cancelled()
+    return {
+        **totals,
+        "documents": len(documents),
+        "seconds": round(seconds, 3),
+        "pages_per_second": round(totals["pages"] / seconds, 2),
+        "chunks_per_second": round(totals["chunks"] / seconds, 2),
+        "results": sorted(results, key=lambda result: result["filename"]),
+    }
+
+@app.post("/upload-pdfs")
+async def upload_pdfs(files: List[UploadFile] = File(...), collection_name: Optional[str] = Form(None)):
+    """Upload many PDFs, or zip/tar archives of PDFs, and ingest them in parallel as one background job.
+
+    Uploads and archive members are spooled to disk block by block and
+    deduplicated by content hash. Each PDF gets its own collection unless a
+    shared collection is given (or SHARED_COLLECTION is set). The job's
+    progress reports aggregate pages/s and chunks/s.
+    """
     try:
-        query = query_request.query
-        collection_name = query_request.collection_name
+        qdrant_cloud_url, qdrant_api_key, embedding_model = get_upload_settings()
+        collection_name = collection_name or SHARED_COLLECTION or None
+        if collection_name is not None:
+            validate_collection_name(collection_name)
+
+        spool_dir = os.path.join(BULK_UPLOAD_DIR, uuid.uuid4().hex)
+        spooled, rejected = await asyncio.to_thread(spool_uploads, [(file.filename, file.file) for file in files], spool_dir, BULK_MAX_FILES)
+        valid = []
+        for file in spooled:
+            try:
+                validate_collection_name(os.path.splitext(file.name)[0], "file name")
+                valid.append(file)
+            except HTTPException as e:
+                rejected.append({"filename": file.name, "reason": e.detail})
+        spooled = valid
+        documents, duplicates = await asyncio.to_thread(plan_bulk_ingestion, spooled, collection_name, embedding_model)
+        response = {
+            "collection_name": collection_name,
+            "documents": [{key: document[key] for key in ("filename", "collection_name", "doc_id")} for document in documents],
+            "duplicates": duplicates,
+            "rejected": rejected,
+        }
+        if not documents:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+            return JSONResponse(content={"message": "No new PDFs to process.", "job_id": None, **response})
+
+        job = IngestionJob({"filename": f"{len(documents)} files", "collection_name": collection_name, "bulk": True})
+        try:
+            INGESTION_JOBS.submit(job, lambda job: ingest_bulk(documents, spool_dir, qdrant_cloud_url, qdrant_api_key, embedding_model, job))
+        except QueueFull:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+            raise
+
+        return JSONResponse(content={
+            "message": f"{len(documents)} PDFs uploaded. Processing started in the background.",
+            "job_id": job.id,
+            **response,
+        })
+
+    except HTTPException:
+        raise
+    except QueueFull as e:
+        logging.warning(f"Rejected bulk upload of {len(files)} files: {e}")
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error during bulk upload: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        settings = MODEL_CONFIG.get("settings")
-        if not settings:
-            raise HTTPException(status_code=500, detail="Settings not configured.")
+@app.get("/collections/{collection_name}/documents")
+async def get_documents(collection_name: str):
+    """List the documents ingested into a collection."""
+    return {"collection_name": collection_name, "documents": list_documents(collection_name)}
 
-        qdrant_cloud_url = settings.get("qdrant_cloud_url")
-        qdrant_api_key = settings.get("qdrant_api_key")
-        embedding_model = settings.get("embedding_model")
-        groq_api_key = settings.get("groq_api_key")
+@app.get("/jobs")
+async def list_jobs():
+    """List recent ingestion jobs with queue occupancy."""
+    return {
+        "running": INGESTION_JOBS.running(),
+        "queued": INGESTION_JOBS.pending(),
+        "jobs": [job.to_dict() for job in INGESTION_JOBS.list()],
+    }
 
-        if not all([qdrant_cloud_url, qdrant_api_key, embedding_model, groq_api_key]):
-            raise HTTPException(status_code=500, detail="Missing Qdrant, embedding, or Groq settings.")
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Return the status and progress of an ingestion job."""
+    job = INGESTION_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
 
-        client = initialize_qdrant_client(qdrant_cloud_url, qdrant_api_key)
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running ingestion job."""
+    job = INGESTION_JOBS.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
 
-        # Generate embedding for the query
-        query_embedding = get_embedding(query, embedding_model)
+def get_query_settings() -> Dict:
+    """Return the saved settings, raising an HTTP error if anything needed for a query is missing."""
+    settings = MODEL_CONFIG.get("settings")
+    if not settings:
+        raise HTTPException(status_code=500, detail="Settings not configured.")
 
-        # Search Qdrant
-        search_result = client.search(
-            collection_name=collection_name,
-            query_vector=query_embedding,
-            limit=5  # Adjust the limit as needed
+    qdrant_settings = [settings.get("qdrant_cloud_url"), settings.get("qdrant_api_key")] if LOCAL_VECTOR_STORE is None else []
+    if not all([*qdrant_settings, settings.get("embedding_model"), settings.get("groq_api_key")]):
+        raise HTTPException(status_code=500, detail="Missing Qdrant, embedding, or Groq settings.")
+    return settings
+
+def query_scope(query_request: QueryRequest) -> Tuple[Tuple[str, ...], Optional[Tuple[str, ...]]]:
+    """The collections a question searches and its document filter, also used as the answer cache scope."""
+    collection_names = list(query_request.collection_names or [])
+    if query_request.collection_name:
+        collection_names.insert(0, query_request.collection_name)
+    if not collection_names:
+        raise HTTPException(status_code=400, detail="Give collection_name or collection_names.")
+    for collection_name in collection_names:
+        validate_collection_name(collection_name)
+    doc_ids = tuple(sorted(set(query_request.doc_ids))) if query_request.doc_ids else None
+    return tuple(sorted(set(collection_names))), doc_ids
+
+def require_session(session_id: Optional[str]):
+    """Raise a 404 for an unknown or expired chat session."""
+    if session_id is not None and not SESSIONS.exists(session_id):
+        raise HTTPException(status_code=404, detail="Chat session not found.")
+
+QUERY_EXECUTOR = ThreadPoolExecutor(max_workers=QUERY_EMBED_WORKERS, thread_name_prefix="query-embed")
+
+QUERY_BATCHER = EmbeddingBatcher(
+    embed_texts,
+    QUERY_EXECUTOR,
+    max_batch_size=QUERY_BATCH_SIZE,
+    max_wait=QUERY_BATCH_WAIT_MS / 1000,
+    max_queue_size=QUERY_BATCH_QUEUE_SIZE,
+    max_concurrent_batches=QUERY_EMBED_WORKERS,
+)
+
+RERANK_WORKERS = 2
+RERANKER = CrossEncoderReranker(
+    RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_BUDGET_MS / 1000, max_in_flight=RERANK_WORKERS,
+) if RERANK_ENABLED else None
+RERANK_EXECUTOR = ThreadPoolExecutor(max_workers=RERANK_WORKERS, thread_name_prefix="rerank")
+
+async def embed_query(query: str, settings: Dict) -> np.ndarray:
+    """Generate the embedding of a question, batched with concurrent questions on the query executor."""
+    with timed(QUERY_STAGE_SECONDS, "embed"):
+        return await QUERY_BATCHER.embed(query, settings["embedding_model"])
+
+async def retrieve(scope: Tuple, query: str, query_vector: np.ndarray, settings: Dict, session_id: Optional[str] = None) -> List[SearchHit]:
+    """Return the chunks of the searched collections most relevant to the question.
+
+    With reranking enabled, a larger candidate pool is retrieved and the
+    cross-encoder keeps the best few, so the prompt gets fewer, better chunks.
+    Questions of a chat session may be answered from the chunks retrieved
+    for an earlier turn instead of searching again.
+    """
+    limit = RERANK_CANDIDATES if RERANKER is not None else 5  # Adjust the limit as needed
+    if session_id is not None:
+        candidates = await session_candidates(session_id, scope, query, query_vector, settings, limit)
+    else:
+        with timed(QUERY_STAGE_SECONDS, "search"):
+            candidates = await search_collections(scope, query, query_vector, settings, limit=limit)
+    if RERANKER is None:
+        return candidates
+    with timed(QUERY_STAGE_SECONDS, "rerank"):
+        order = await RERANKER.rerank(query, [hit.payload["content"] for hit in candidates], RERANK_TOP_K, RERANK_EXECUTOR)
+    return [candidates[i] for i in order]
+
+_session_tasks = set()
+
+async def session_candidates(session_id: str, scope: Tuple, query: str, query_vector: np.ndarray, settings: Dict, limit: int) -> List[SearchHit]:
+    """The best chunks for a question of a chat session, best first.
+
+    Follow-ups are ranked against the chunks kept from the session's last
+    search, as long as those still fit the question (SESSION_REUSE_RATIO).
+    Otherwise the collections are searched for a larger pool, which is kept
+    for the next turns together with the chunks' embeddings; those come
+    from the embedding cache where possible and are looked up while the
+    LLM answers.
+    """
+    with timed(QUERY_STAGE_SECONDS, "session_candidates"):
+        ranked = SESSIONS.rank_candidates(session_id, scope, settings["embedding_model"], query_vector, SESSION_REUSE_RATIO)
+    if ranked is not None:
+        return ranked[:limit]
+
+    with timed(QUERY_STAGE_SECONDS, "search"):
+        pool = await search_collections(scope, query, query_vector, settings, limit=max(limit, SESSION_CANDIDATES))
+    task = asyncio.create_task(keep_session_candidates(session_id, scope, pool, query_vector, settings["embedding_model"]))
+    _session_tasks.add(task)
+    task.add_done_callback(_session_tasks.discard)
+    return pool[:limit]
+
+async def keep_session_candidates(session_id: str, scope: Tuple, hits: List[SearchHit], query_vector: np.ndarray, embedding_model: str):
+    """Embed a session's retrieved chunks and keep them for its follow-ups."""
+    try:
+        vectors = await asyncio.get_running_loop().run_in_executor(
+            QUERY_EXECUTOR, embed_texts, [hit.payload.get("content", "") for hit in hits], embedding_model,
         )
+        SESSIONS.keep_candidates(session_id, scope, embedding_model, hits, vectors, query_vector)
+    except Exception as e:
+        logging.error(f"Error keeping the retrieved chunks of chat session {session_id}: {e}")
+
+REWRITE_PROMPT = (
+    "Given the conversation below and a follow-up question, rewrite the follow-up question as a standalone question "
+    "that can be understood without the conversation. Reply with the standalone question only.\n"
+    "Conversation:\n{history}\nFollow-up question: {question}\nStandalone question:"
+)
 
-        # Extract context from search results
-        context = "\n".join([hit.payload["content"] for hit in search_result])
+async def session_question(session_id: Optional[str], question: str, scope: Tuple, settings: Dict) -> Tuple[str, str]:
+    """Return the standalone question to retrieve and answer with, and the conversation history for the prompt.
 
-        # Initialize Groq LLM
-        llm = ChatGroq(temperature=0.0, groq_api_key=groq_api_key)
+    Without a session, or on its first turn, the question is used as is.
+    Follow-ups are condensed by the LLM from the last SESSION_HISTORY_TURNS
+    turns. Rewrites are cached by scope, LLM model, the earlier standalone
+    questions and the follow-up; the earlier answers are left out of the
+    key because the same standalone questions get the same answers.
+    """
+    if session_id is None:
+        return question, ""
+    turns = await asyncio.to_thread(SESSIONS.turns, session_id, SESSION_HISTORY_TURNS)
+    if not turns:
+        return question, ""
+    history = format_history(turns, SESSION_HISTORY_TOKENS)
 
-        # Create prompt
-        prompt = f"You are a helpful AI assistant. Use the following context to answer the question. \nContext: {context}\nQuestion: {query}"
+    key = compute_md5(json.dumps([scope, settings.get("llm_model"), [turn.standalone_question for turn in turns], question]))
+    standalone = await asyncio.to_thread(SESSIONS.get_rewrite, key)
+    if standalone is None:
+        llm = get_llm(settings["groq_api_key"], settings.get("llm_model"))
+        with timed(QUERY_STAGE_SECONDS, "rewrite"):
+            standalone = (await llm.ainvoke(REWRITE_PROMPT.format(history=history, question=question))).content.strip() or question
+        await asyncio.to_thread(SESSIONS.put_rewrite, key, standalone)
+    return standalone, history
 
-        # Get answer from LLM
-        answer = llm.invoke(prompt).content
+async def search_collections(scope: Tuple, query: str, query_vector: np.ndarray, settings: Dict, limit: int) -> List[SearchHit]:
+    """Search every collection of the scope concurrently and merge their hits by score."""
+    collection_names, doc_ids = scope
+    results = await asyncio.gather(*[
+        search_candidates(collection_name, query, query_vector, settings, limit, doc_ids)
+        for collection_name in collection_names
+    ])
+    hits = []
+    for collection_name, collection_hits in zip(collection_names, results):
+        for hit in collection_hits:
+            hit.collection_name = collection_name
+            hits.append(hit)
+    if len(results) == 1:
+        return hits
+    return sorted(hits, key=lambda hit: hit.score, reverse=True)[:limit]
 
-        return JSONResponse(content={"answer": answer})
+async def search_candidates(collection_name: str, query: str, query_vector: np.ndarray, settings: Dict, limit: int, doc_ids: Optional[Tuple[str, ...]] = None) -> List[SearchHit]:
+    """Return the chunks of the collection closest to the question, in retrieval order.
 
+    With hybrid search, vector search and BM25 run concurrently and their
+    rankings are fused with reciprocal-rank fusion, so exact part numbers
+    and error codes are found even when their embeddings are not close.
+    The hits' scores are then RRF scores.
+    """
+    store = get_vector_store(settings["qdrant_cloud_url"], settings["qdrant_api_key"])
+    doc_ids = list(doc_ids) if doc_ids is not None else None
+    reducer = VECTOR_REDUCERS.get(collection_name)
+    if reducer is not None and reducer.fitted:
+        query_vector = reducer.transform(query_vector)
+    if LEXICAL_INDEXES is None:
+        return await store.asearch(collection_name, query_vector, limit=limit, doc_ids=doc_ids)
+
+    dense_hits, lexical_hits = await asyncio.gather(
+        store.asearch(collection_name, query_vector, limit=HYBRID_CANDIDATES, doc_ids=doc_ids),
+        asyncio.to_thread(LEXICAL_INDEXES.search, collection_name, query, HYBRID_CANDIDATES, doc_ids),
+    )
+    fused = reciprocal_rank_fusion([[hit.id for hit in dense_hits], [chunk_id for chunk_id, _ in lexical_hits]], k=RRF_K)[:limit]
+
+    # Chunks found only by BM25 still need their payloads
+    payloads = {hit.id: hit.payload for hit in dense_hits}
+    missing = [chunk_id for chunk_id, _ in fused if chunk_id not in payloads]
+    if missing:
+        payloads.update(await store.afetch(collection_name, missing))
+    return [SearchHit(chunk_id, score, payloads[chunk_id]) for chunk_id, score in fused if chunk_id in payloads]
+
+async def find_cached_answer(query: str, scope: Tuple, settings: Dict) -> Tuple[Optional[CachedAnswer], Optional[np.ndarray]]:
+    """Look a question up in the answer cache, exactly first and then by similarity.
+
+    Also returns the query embedding if it had to be computed, so a miss
+    does not embed the question twice.
+    """
+    if ANSWER_CACHE is None:
+        return None, None
+    cached = ANSWER_CACHE.get_exact(scope, query, settings.get("llm_model"))
+    if cached is not None:
+        return cached, None
+    query_vector = await embed_query(query, settings)
+    return ANSWER_CACHE.get_similar(scope, query_vector, settings.get("llm_model"), settings["embedding_model"]), query_vector
+
+def cache_answer(query: str, scope: Tuple, settings: Dict, query_vector: np.ndarray, answer: str, sources: List[Dict], history: str = ""):
+    """Remember an answer for repeated and near-duplicate questions.
+
+    Answers written with a chat session's history in the prompt are not
+    cached, since the cache is keyed by the question alone and they would be
+    served to other conversations.
+    """
+    if ANSWER_CACHE is not None and not history:
+        ANSWER_CACHE.put(scope, query, settings.get("llm_model"), settings["embedding_model"], query_vector, answer, sources)
+
+def context_token_budget(query: str, llm_model: Optional[str]) -> int:
+    """Tokens available for retrieved context with the given model."""
+    window = LLM_CONTEXT_WINDOWS.get(llm_model, DEFAULT_CONTEXT_WINDOW)
+    return max(0, min(CONTEXT_TOKEN_BUDGET, window - ANSWER_TOKEN_RESERVE - estimate_tokens(query)))
+
+def build_prompt(query: str, hits: List[SearchHit], llm_model: Optional[str] = None, history: str = "") -> Tuple[str, List[SearchHit]]:
+    """Build the LLM prompt from the retrieved chunks and return it with the chunks it uses.
+
+    Overlapping chunks are merged and the context is packed by relevance
+    into the model's token budget, less the conversation history of a chat
+    session. Each passage is headed by its document and pages, which the
+    model is asked to cite.
+    """
+    with timed(QUERY_STAGE_SECONDS, "prompt"):
+        chunks = [{**hit.payload, "collection_name": hit.collection_name} for hit in hits]
+        context, used = assemble_context(chunks, context_token_budget(f"{history}\n{query}", llm_model), cite_pages=True)
+        conversation = f"\nConversation so far:\n{history}" if history else ""
+        prompt = (
+            "You are a helpful AI assistant. Use the following context to answer the question. "
+            "Cite the pages you use, e.g. (p. 3). \n"
+            f"Context: {context}{conversation}\nQuestion: {query}"
+        )
+    PROMPT_TOKENS.observe(estimate_tokens(prompt))
+    return prompt, [hits[i] for i in used]
+
+def hit_sources(hits: List[SearchHit]) -> List[Dict]:
+    """Metadata about the retrieved chunks that is returned to the client."""
+    return [
+        {
+            "id": hit.id,
+            "score": hit.score,
+            "collection_name": hit.collection_name,
+            "doc_id": hit.payload.get("doc_id"),
+            "page_start": hit.payload.get("page_start"),
+            "page_end": hit.payload.get("page_end"),
+        }
+        for hit in hits
+    ]
+
+def cite_pages(sources: List[Dict]) -> List[Dict]:
+    """The pages an answer's context came from, per document, in order of relevance."""
+    citations = {}
+    for source in sources:
+        page_start = source.get("page_start")
+        if page_start is None:
+            continue
+        pages = citations.setdefault((source.get("collection_name"), source.get("doc_id")), set())
+        pages.update(range(page_start, (source.get("page_end") or page_start) + 1))
+    return [
+        {"collection_name": collection_name, "doc_id": doc_id, "pages": sorted(pages)}
+        for (collection_name, doc_id), pages in citations.items()
+    ]
+
+def sse_event(event: str, data) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/query")
+async def query_qdrant(query_request: QueryRequest):
+    """Query Qdrant database and get an answer using LLM.
+
+    Searches one collection, or several at once with collection_names,
+    optionally restricted to the documents in doc_ids. With a session_id,
+    the question is read as a follow-up in that chat session and the turn
+    is recorded. The answer comes with the retrieved chunks it was given
+    and the pages of each document they span. With trace set, the timed
+    stages of the question are returned alongside the answer.
+    """
+    scope = query_scope(query_request)
+    session_id = query_request.session_id
+    require_session(session_id)
+    start = time.perf_counter()
+    with QUERIES_IN_FLIGHT.track("query"), TRACER.trace("query", force=query_request.trace, collection_names=list(scope[0])) as trace:
+        try:
+            settings = get_query_settings()
+            query, history = await session_question(session_id, query_request.query, scope, settings)
+
+            # Repeated and near-duplicate questions are answered from the cache
+            cached, query_vector = await find_cached_answer(query, scope, settings)
+            if cached is not None:
+                answer, sources = cached.answer, cached.sources
+            else:
+                if query_vector is None:
+                    query_vector = await embed_query(query, settings)
+
+                hits = await retrieve(scope, query, query_vector, settings, session_id)
+                prompt, hits = build_prompt(query, hits, settings.get("llm_model"), history)
+
+                # Reuse the Groq LLM client for these settings
+                llm = get_llm(settings["groq_api_key"], settings.get("llm_model"))
+
+                # Get answer from LLM without blocking other requests
+                with timed(QUERY_STAGE_SECONDS, "llm"):
+                    answer = (await llm.ainvoke(prompt)).content
+                sources = hit_sources(hits)
+                cache_answer(query, scope, settings, query_vector, answer, sources, history)
+            if session_id is not None:
+                await asyncio.to_thread(SESSIONS.add_turn, session_id, query_request.query, query, answer, sources)
+            if trace is not None:
+                trace.attributes["cached"] = cached is not None
+
+        except Exception as e:
+            QUERY_ERRORS.inc(1, "query")
+            logging.error(f"Error during query and LLM inference: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            QUERY_SECONDS.observe(time.perf_counter() - start, "query")
+
+    content = {"answer": answer, "citations": cite_pages(sources), "sources": sources}
+    if session_id is not None:
+        content["standalone_query"] = query
+    if query_request.trace:
+        content["trace"] = trace.to_dict()
+    return JSONResponse(content=content)
+
+@app.post("/query/stream")
+async def query_qdrant_stream(query_request: QueryRequest):
+    """Like /query, but stream server-sent events: the retrieved sources first, then the answer token by token.
+
+    The question counts as in flight until its last event is sent, and is
+    recorded as a turn of its chat session once the answer is complete.
+    """
+    scope = query_scope(query_request)
+    session_id = query_request.session_id
+    require_session(session_id)
+    start = time.perf_counter()
+    QUERIES_IN_FLIGHT.inc(1, "stream")
+    try:
+        settings = get_query_settings()
+        query, history = await session_question(session_id, query_request.query, scope, settings)
+        cached, query_vector = await find_cached_answer(query, scope, settings)
+        if cached is None:
+            if query_vector is None:
+                query_vector = await embed_query(query, settings)
+            hits = await retrieve(scope, query, query_vector, settings, session_id)
+            prompt, hits = build_prompt(query, hits, settings.get("llm_model"), history)
+            llm = get_llm(settings["groq_api_key"], settings.get("llm_model"))
     except Exception as e:
-        logging.error(f"Error during query and LLM inference: {e}")
+        QUERIES_IN_FLIGHT.dec(1, "stream")
+        QUERY_ERRORS.inc(1, "stream")
+        QUERY_SECONDS.observe(time.perf_counter() - start, "stream")
+        logging.error(f"Error during query retrieval: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    def finish():
+        QUERIES_IN_FLIGHT.dec(1, "stream")
+        QUERY_SECONDS.observe(time.perf_counter() - start, "stream")
+
+    async def record_turn(answer: str, sources: List[Dict]):
+        if session_id is not None:
+            await asyncio.to_thread(SESSIONS.add_turn, session_id, query_request.query, query, answer, sources)
+
+    async def cached_events() -> AsyncIterator[str]:
+        try:
+            yield sse_event("sources", cached.sources)
+            yield sse_event("token", {"text": cached.answer})
+            await record_turn(cached.answer, cached.sources)
+            yield sse_event("done", {"citations": cite_pages(cached.sources)})
+        finally:
+            finish()
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            sources = hit_sources(hits)
+            yield sse_event("sources", sources)
+            llm_start = time.perf_counter()
+            answer = []
+            async for message in llm.astream(prompt):
+                if message.content:
+                    if not answer:
+                        QUERY_STAGE_SECONDS.observe(time.perf_counter() - llm_start, "llm_first_token")
+                    answer.append(message.content)
+                    yield sse_event("token", {"text": message.content})
+            QUERY_STAGE_SECONDS.observe(time.perf_counter() - llm_start, "llm")
+            cache_answer(query, scope, settings, query_vector, "".join(answer), sources, history)
+            await record_turn("".join(answer), sources)
+            yield sse_event("done", {"citations": cite_pages(sources)})
+        except Exception as e:
+            QUERY_ERRORS.inc(1, "stream")
+            logging.error(f"Error during streaming LLM inference: {e}")
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            finish()
+
+    return StreamingResponse(cached_events() if cached is not None else events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/answer-cache")
+async def answer_cache_stats():
+    """Report hit and miss counters of the answer cache."""
+    if ANSWER_CACHE is None:
+        return {"enabled": False}
+    return {"enabled": True, **ANSWER_CACHE.stats()}
+
+@app.post("/sessions")
+async def create_session():
+    """Start a chat session; pass its session_id with /query or /query/stream to ask follow-up questions."""
+    return {"session_id": await asyncio.to_thread(SESSIONS.create)}
+
+@app.get("/sessions")
+async def session_stats():
+    """Report session counts, the query rewrite cache hit rate and how often follow-ups reused earlier chunks."""
+    return await asyncio.to_thread(SESSIONS.stats)
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """The turns of a chat session, oldest first."""
+    require_session(session_id)
+    turns = await asyncio.to_thread(SESSIONS.turns, session_id)
+    return {"session_id": session_id, "turns": [dataclasses.asdict(turn) for turn in turns]}
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not await asyncio.to_thread(SESSIONS.delete, session_id):
+        raise HTTPException(status_code=404, detail="Chat session not found.")
+    return {"session_id": session_id, "deleted": True}
+
+def cache_lookups() -> Dict[Tuple, float]:
+    """Hits and misses of the embedding, extraction, answer and chat session caches since startup."""
+    lookups = {}
+    if EMBEDDING_CACHE is not None:
+        stats = EMBEDDING_CACHE.stats()
+        lookups.update({("embedding", "hit"): stats["hits"], ("embedding", "miss"): stats["misses"]})
+    if EXTRACTION_CACHE is not None:
+        stats = EXTRACTION_CACHE.stats()
+        lookups.update({("extraction", "hit"): stats["hits"], ("extraction", "miss"): stats["misses"]})
+    if ANSWER_CACHE is not None:
+        stats = ANSWER_CACHE.stats()
+        lookups.update({
+            ("answer", "exact_hit"): stats["exact_hits"],
+            ("answer", "semantic_hit"): stats["semantic_hits"],
+            ("answer", "miss"): stats["misses"],
+        })
+    stats = SESSIONS.stats()
+    lookups.update({
+        ("query_rewrite", "hit"): stats["rewrite_hits"],
+        ("query_rewrite", "miss"): stats["rewrite_misses"],
+        ("session_candidates", "hit"): stats["candidate_reuses"],
+        ("session_candidates", "miss"): stats["candidate_searches"],
+    })
+    return lookups
+
+def cache_hit_ratios() -> Dict[Tuple, float]:
+    ratios = {}
+    if EMBEDDING_CACHE is not None:
+        ratios[("embedding",)] = EMBEDDING_CACHE.stats()["hit_rate"]
+    if EXTRACTION_CACHE is not None:
+        ratios[("extraction",)] = EXTRACTION_CACHE.stats()["hit_rate"]
+    if ANSWER_CACHE is not None:
+        ratios[("answer",)] = ANSWER_CACHE.stats()["hit_rate"]
+    stats = SESSIONS.stats()
+    ratios[("query_rewrite",)] = stats["rewrite_hit_rate"]
+    ratios[("session_candidates",)] = stats["candidate_reuse_rate"]
+    return ratios
+
+METRICS.register(CallbackMetric("rag_ingestion_jobs", "Ingestion jobs by state.", ("state",),
+                                lambda: {("running",): INGESTION_JOBS.running(), ("queued",): INGESTION_JOBS.pending()}))
+METRICS.register(CallbackMetric("rag_ingestion_queue_capacity", "Ingestion jobs allowed to wait for a worker.", (),
+                                lambda: {(): INGESTION_JOBS.max_pending}))
+METRICS.register(CallbackMetric("rag_query_embedding_queue", "Questions waiting to be embedded.", (),
+                                lambda: {(): QUERY_BATCHER.stats()["queued"]}))
+METRICS.register(CallbackMetric("rag_query_embedding_batch_size", "Average number of questions embedded together.", (),
+                                lambda: {(): QUERY_BATCHER.stats()["average_batch_size"]}))
+METRICS.register(CallbackMetric("rag_ingestion_embedding_waiting", "Chunk batches of ingestions waiting to be embedded.", (),
+                                lambda: {(): INGEST_BATCHER.stats()["waiting"]}))
+METRICS.register(CallbackMetric("rag_cache_lookups", "Cache lookups by cache and result.", ("cache", "result"), cache_lookups, type="counter"))
+METRICS.register(CallbackMetric("rag_cache_hit_ratio", "Share of cache lookups that were hits.", ("cache",), cache_hit_ratios))
+METRICS.register(CallbackMetric("rag_embedding_models_resident_bytes", "Estimated memory of the loaded embedding models.", (),
+                                lambda: {(): EMBEDDING_MODELS.stats()["resident_bytes"]}))
+METRICS.register(CallbackMetric("rag_process_resident_bytes", "Resident memory of the backend process.", (),
+                                lambda: {(): current_rss_bytes()}))
+
+@app.get("/metrics")
+async def metrics():
+    """Expose stage latencies, queue gauges and cache counters in the Prometheus text format."""
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces")
+async def list_traces(limit: int = 20):
+    """Return the most recent traces of sampled or explicitly traced questions and ingestions."""
+    return {"sample_rate": TRACER.sample_rate, "traces": TRACER.recent(limit)}
+
+@app.post("/profiler/start")
+async def start_profiler(interval_ms: float = 10, seconds: float = 60):
+    """Sample the stacks of all threads every interval_ms for at most seconds."""
+    if not 1 <= interval_ms <= 1000 or not 0 < seconds <= PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"Use an interval of 1-1000 ms and at most {PROFILER_MAX_SECONDS} seconds.")
+    if not PROFILER.start(interval_ms / 1000, seconds):
+        raise HTTPException(status_code=409, detail="The profiler is already running.")
+    return PROFILER.stats()
+
+@app.post("/profiler/stop")
+async def stop_profiler():
+    """Stop the sampling profiler and return its summary."""
+    await asyncio.to_thread(PROFILER.stop)
+    return PROFILER.stats()
+
+@app.get("/profiler")
+async def profiler_stats(top: int = 20):
+    """Report whether the profiler runs and the frames most often seen on top of the stack."""
+    return PROFILER.stats(top)
+
+@app.get("/profiler/stacks")
+async def profiler_stacks():
+    """The sampled stacks in collapsed format, for flame graph tools."""
+    return PlainTextResponse(PROFILER.collapsed())
+
 @app.post("/set-settings")
 async def set_settings(settings_data: SettingsData):
     """Set Qdrant and embedding settings."""
     try:
         settings = settings_data.dict()
         MODEL_CONFIG["settings"] = settings
+
+        # Build clients for the new settings now and forget the ones for old settings
+        qdrant_key = (settings["qdrant_cloud_url"], settings["qdrant_api_key"])
+        llm_key = (settings["groq_api_key"], settings["llm_model"])
+        for pool in (QDRANT_CLIENTS, ASYNC_QDRANT_CLIENTS, LLM_CLIENTS):
+            await pool.close_retired(RETIRED_CLIENT_GRACE_SECONDS)
+        QDRANT_CLIENTS.retain([qdrant_key])
+        ASYNC_QDRANT_CLIENTS.retain([qdrant_key])
+        LLM_CLIENTS.retain([llm_key])
+        try:
+            if LOCAL_VECTOR_STORE is None:
+                QDRANT_CLIENTS.get(qdrant_key)
+            LLM_CLIENTS.get(llm_key)
+        except Exception as e:
+            # Saving settings must not depend on it; the clients are built again on first use
+            logging.warning(f"Could not create clients for the new settings yet: {e}")
+
+        # Warm up the selected embedding model without delaying the response
+        asyncio.get_running_loop().run_in_executor(None, EMBEDDING_MODELS.preload, [settings["embedding_model"]])
         return {"message": "Settings saved successfully."}
     except Exception as e:
         logging.error(f"Error saving settings: {e}")
@@ -0,0 +1,391 @@
+"""Time the ingestion and query hot paths stage by stage, offline and reproducibly.
+
+Ingestion is broken into the stages of process_and_upsert_pdf (extract,
+sentence split, chunk, embed, upsert), and questions into the stages of
+/query (embed, search, prompt build, LLM). Every stage calls the backend's
+own functions. The run uses the local vector store in a temporary directory
+instead of Qdrant and a stub LLM, and disables the embedding, answer and
+extraction caches so repetitions do the same work:
+
+    python benchmark.py --synthetic 3 --pages 40 --output baseline.json
+    python benchmark.py manual.pdf --output current.json --compare baseline.json
+
+Synthetic PDFs are generated from a fixed seed, so runs on the same machine
+see the same corpus. With --stub-embeddings, a hashing embedder replaces
+the SentenceTransformer and nothing is downloaded; leave it off to include
+the real model (it must be cached locally to run offline).
+
+Latencies are reported as p50/p95/p99 in milliseconds, with throughput and
+the peak resident memory of each phase. --compare exits with status 1 if a
+latency grew or a throughput fell by more than --threshold relative to the
+baseline file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import zlib
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+INGESTION_STAGES = ("extract", "split", "chunk", "embed", "upsert")
+QUERY_STAGES = ("embed", "search", "prompt", "llm")
+
+WORDS = (
+    "pump valve pressure sensor motor controller firmware calibration torque bearing seal filter "
+    "coolant voltage current relay fuse circuit cable connector housing bracket gasket spring "
+    "inspection maintenance replacement installation operation warning caution procedure interval "
+    "temperature flow rate output input signal display alarm reset error fault status manual "
+    "check ensure remove install tighten loosen measure adjust verify record replace clean"
+).split()
+
+def synthetic_text(rng: random.Random, words: int) -> str:
+    """Manual-like sentences with occasional part numbers and error codes."""
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 24))
+        tokens = [rng.choice(WORDS) for _ in range(length)]
+        if rng.random() < 0.2:
+            tokens[rng.randrange(length)] = f"{rng.choice('ABEPX')}{rng.randint(10, 999)}-{rng.randint(1, 99):02d}"
+        sentences.append(" ".join(tokens).capitalize() + ".")
+        words -= length
+    return " ".join(sentences)
+
+def write_synthetic_pdf(path: str, pages: int, words_per_page: int, seed: int):
+    """Write a minimal PDF with one line of Helvetica text per page."""
+    rng = random.Random(seed)
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{4 + 2 * i} 0 R" for i in range(pages)), pages),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i in range(pages):
+        stream = f"BT /F1 10 Tf 20 700 Td ({synthetic_text(rng, words_per_page)}) Tj ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(data)
+
+class HashingEmbedder:
+    """Deterministic bag-of-words stand-in for a SentenceTransformer; costs about as much as tokenizing."""
+
+    def __init__(self, model_name: str, dimensions: int = 384):
+        self.model_name = model_name
+        self.dimensions = dimensions
+        self.max_seq_length = 256
+        self.tokenizer = None  # chunks are sized in words
+
+    def parameters(self):
+        return []
+
+    def buffers(self):
+        return []
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimensions
+
+    def encode(self, texts, batch_size: int = 32, convert_to_numpy: bool = True, normalize_embeddings: bool = False, show_progress_bar: bool = False):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, zlib.crc32(word.encode()) % self.dimensions] += 1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1, norms)
+        return vectors[0] if single else vectors
+
+class StubMessage(NamedTuple):
+    content: str
+
+class StubLLM:
+    """Answers every prompt with a fixed text after a fixed delay, like a chat model with ainvoke and astream."""
+
+    def __init__(self, latency_ms: float, answer_words: int):
+        self.latency = latency_ms / 1000
+        self.answer = " ".join(WORDS[i % len(WORDS)] for i in range(answer_words))
+
+    async def ainvoke(self, prompt: str) -> StubMessage:
+        await asyncio.sleep(self.latency)
+        return StubMessage(self.answer)
+
+    async def astream(self, prompt: str):
+        await asyncio.sleep(self.latency)
+        for word in self.answer.split():
+            yield StubMessage(word + " ")
+
+def summarize(seconds: List[float]) -> Dict:
+    """Latency percentiles in milliseconds."""
+    if not seconds:
+        return {"count": 0}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+def peak_rss_mb() -> float:
+    """Highest resident memory of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round((peak if sys.platform == "darwin" else peak * 1024) / 1024 / 1024, 1)
+
+class Timer:
+    """Collects the seconds spent in named stages."""
+
+    def __init__(self, stages):
+        self.samples = {stage: [] for stage in stages}
+
+    def add(self, stage: str, start: float) -> float:
+        now = time.perf_counter()
+        self.samples[stage].append(now - start)
+        return now
+
+def ingest_stages(backend, pdf_path: str, collection_name: str, settings: Dict, timer: Timer) -> Dict:
+    """Run the ingestion pipeline one stage at a time into a new collection."""
+    embedding_model = settings["embedding_model"]
+    max_chunk_size, chunk_overlap, length_function = backend.get_chunk_sizing(embedding_model)
+    store = backend.get_vector_store(settings["qdrant_cloud_url"], settings["qdrant_api_key"])
+
+    start = time.perf_counter()
+    pages = list(backend.iter_pdf_pages(pdf_path))
+    start = timer.add("extract", start)
+    sentences = list(backend.iter_sentences(pages))
+    start = timer.add("split", start)
+    chunks = list(backend.iter_chunks(sentences, max_chunk_size, chunk_overlap, length_function))
+    start = timer.add("chunk", start)
+
+    vectors = [backend.embed_texts([chunk.text for chunk in batch], embedding_model)
+               for batch in backend.iter_batches(chunks, backend.EMBEDDING_BATCH_SIZE)]
+    start = timer.add("embed", start)
+
+    store.create_collection(collection_name, vectors[0].shape[1] if vectors else 1)
+    for batch, batch_vectors in zip(backend.iter_batches(chunks, backend.EMBEDDING_BATCH_SIZE), vectors):
+        store.upsert(collection_name, [backend.point_id(chunk.text) for chunk in batch], batch_vectors, [chunk.payload() for chunk in batch])
+    timer.add("upsert", start)
+    return {"pages": len(pages), "chunks": len(chunks)}
+
+async def run_queries(backend, collection_name: str, questions: List[str], settings: Dict, timer: Timer, totals: List[float]):
+    """Answer each question once stage by stage, then once through /query."""
+    scope = ((collection_name,), None)
+    llm = backend.get_llm(settings["groq_api_key"], settings.get("llm_model"))
+    for question in questions:
+        start = time.perf_counter()
+        query_vector = await backend.embed_query(question, settings)
+        start = timer.add("embed", start)
+        hits = await backend.retrieve(scope, question, query_vector, settings)
+        start = timer.add("search", start)
+        prompt, hits = backend.build_prompt(question, hits, settings.get("llm_model"))
+        start = timer.add("prompt", start)
+        await llm.ainvoke(prompt)
+        timer.add("llm", start)
+
+        start = time.perf_counter()
+        await backend.query_qdrant(backend.QueryRequest(query=question, collection_name=collection_name))
+        totals.append(time.perf_counter() - start)
+
+def sample_questions(backend, pdf_paths: List[str], count: int, seed: int) -> List[str]:
+    """Questions made of the opening words of sentences sampled from the corpus."""
+    sentences = [sentence.text for pdf_path in pdf_paths for sentence in backend.iter_sentences(backend.iter_pdf_pages(pdf_path))]
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(sentences).split()[:8]) + "?" for _ in range(count)]
+
+async def run_benchmark(backend, pdf_paths: List[str], args) -> Dict:
+    settings = {
+        "qdrant_cloud_url": "",
+        "qdrant_api_key": "",
+        "embedding_model": args.model,
+        "groq_api_key": "benchmark",
+        "llm_model": args.llm_model,
+    }
+    backend.MODEL_CONFIG["settings"] = settings
+    backend.LLM_CLIENTS = backend.ClientPool("stub LLM", lambda *key: StubLLM(args.llm_latency_ms, args.answer_words))
+    backend.EMBEDDING_MODELS.get(args.model)  # Model load time is not part of any stage
+
+    # Ingestion: stage by stage, then end to end through process_and_upsert_pdf
+    stage_timer = Timer(INGESTION_STAGES)
+    ingest_totals = []
+    pages = chunks = 0
+    for repetition in range(-args.warmup, args.repetitions):
+        timer = stage_timer if repetition >= 0 else Timer(INGESTION_STAGES)
+        for index, pdf_path in enumerate(pdf_paths):
+            counts = ingest_stages(backend, pdf_path, f"stages_{repetition}_{index}", settings, timer)
+            start = time.perf_counter()
+            backend.process_and_upsert_pdf(pdf_path, f"bench_{repetition}_{index}", "", "", args.model)
+            if repetition >= 0:
+                ingest_totals.append(time.perf_counter() - start)
+                pages += counts["pages"]
+                chunks += counts["chunks"]
+    ingest_seconds = sum(ingest_totals)
+    ingestion_rss = peak_rss_mb()
+
+    # Queries against the end-to-end ingested collection of the first document
+    questions = sample_questions(backend, pdf_paths, args.queries, args.seed)
+    await run_queries(backend, "bench_0_0", questions[:args.warmup * 5], settings, Timer(QUERY_STAGES), [])
+    query_timer = Timer(QUERY_STAGES)
+    query_totals = []
+    await run_queries(backend, "bench_0_0", questions, settings, query_timer, query_totals)
+    await backend.QUERY_BATCHER.stop()
+
+    return {
+        "ingestion": {
+            "documents": len(ingest_totals),
+            "pages": pages,
+            "chunks": chunks,
+            "stages": {stage: summarize(samples) for stage, samples in stage_timer.samples.items()},
+            "total": summarize(ingest_totals),
+            "pages_per_second": round(pages / ingest_seconds, 2) if ingest_seconds else 0.0,
+            "chunks_per_second": round(chunks / ingest_seconds, 2) if ingest_seconds else 0.0,
+            "peak_rss_mb": ingestion_rss,
+        },
+        "query": {
+            "queries": len(query_totals),
+            "stages": {stage: summarize(samples) for stage, samples in query_timer.samples.items()},
+            "total": summarize(query_totals),
+            "queries_per_second": round(len(query_totals) / sum(query_totals), 2) if query_totals else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+        },
+    }
+
+def flatten_metrics(results: Dict) -> Dict[str, float]:
+    """Comparable metrics by path, e.g. "query.stages.search.p95_ms"."""
+    metrics = {}
+    for phase in ("ingestion", "query"):
+        section = results.get(phase, {})
+        for stage, summary in [*section.get("stages", {}).items(), ("total", section.get("total", {}))]:
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                if key in summary:
+                    metrics[f"{phase}.{'stages.' if stage != 'total' else ''}{stage}.{key}"] = summary[key]
+        for key in ("pages_per_second", "chunks_per_second", "queries_per_second", "peak_rss_mb"):
+            if key in section:
+                metrics[f"{phase}.{key}"] = section[key]
+    return metrics
+
+def compare(results: Dict, baseline: Dict, threshold: float, min_ms: float) -> List[Dict]:
+    """Metrics that got worse than the baseline by more than threshold (relative).
+
+    Latency changes below min_ms are treated as noise.
+    """
+    current, previous = flatten_metrics(results), flatten_metrics(baseline)
+    regressions = []
+    for name, value in current.items():
+        old = previous.get(name)
+        if not old:
+            continue
+        higher_is_better = name.endswith("_per_second")
+        change = (old - value) / old if higher_is_better else (value - old) / old
+        if name.endswith("_ms") and value - old < min_ms:
+            continue
+        if change > threshold:
+            regressions.append({"metric": name, "baseline": old, "current": value, "change": round(change, 4)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*", help="PDF files to benchmark in addition to the synthetic ones")
+    parser.add_argument("--synthetic", type=int, default=2, help="Synthetic PDFs to generate")
+    parser.add_argument("--pages", type=int, default=40, help="Pages per synthetic PDF")
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repetitions", type=int, default=3, help="Times every PDF is ingested")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=1, help="Unrecorded ingestion rounds (and 5 questions per round) first")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Embedding model")
+    parser.add_argument("--stub-embeddings", action="store_true", help="Use a hashing embedder instead of the model")
+    parser.add_argument("--sentence-splitter", choices=("nltk", "regex"), default="nltk")
+    parser.add_argument("--llm-model", default=None, help="Only selects the context token budget; the LLM is stubbed")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Delay of the stub LLM")
+    parser.add_argument("--answer-words", type=int, default=50)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown counted as a regression")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="Latency changes below this are noise")
+    args = parser.parse_args()
+
+    pdf_paths = [os.path.abspath(path) for path in args.pdfs]
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for i in range(args.synthetic):
+            path = os.path.join(workdir, f"synthetic_{i}.pdf")
+            write_synthetic_pdf(path, args.pages, args.words_per_page, seed=args.seed + i)
+            pdf_paths.append(path)
+        if not pdf_paths:
+            parser.error("give PDF files or --synthetic N")
+
+        # The backend keeps its data under ./uploads and reads its settings at import
+        os.chdir(workdir)
+        os.environ.update({
+            "VECTOR_STORE": "local", "EMBEDDING_CACHE_ENABLED": "false", "ANSWER_CACHE_ENABLED": "false", "EXTRACTION_CACHE_ENABLED": "false",
+            "SENTENCE_SPLITTER": args.sentence_splitter,
+        })
+        import_start = time.perf_counter()
+        import backend
+        import_seconds = time.perf_counter() - import_start
+        if args.stub_embeddings:
+            backend.load_sentence_transformer = HashingEmbedder
+
+        started = time.time()
+        results = asyncio.run(run_benchmark(backend, pdf_paths, args))
+        backend.LOCAL_VECTOR_STORE.close()
+        if backend._extract_pool is not None:
+            backend._extract_pool.shutdown()
+
+    results["run"] = {
+        "started": started,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pdfs": [os.path.basename(path) for path in pdf_paths],
+        "args": {key: value for key, value in vars(args).items() if key not in ("pdfs", "output", "compare")},
+        "backend_import_seconds": round(import_seconds, 3),
+        "chunk_size_unit": backend.CHUNK_SIZE_UNIT,
+        "hybrid_search": backend.HYBRID_SEARCH,
+        "vector_quantization": backend.VECTOR_QUANTIZATION,
+    }
+
+    exit_code = 0
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        ignored = ("threshold", "min_ms")
+        if {k: v for k, v in baseline.get("run", {}).get("args", {}).items() if k not in ignored} != \
+                {k: v for k, v in results["run"]["args"].items() if k not in ignored}:
+            print("WARNING: the baseline was run with different arguments, so the results may not be comparable")
+        regressions = compare(results, baseline, args.threshold, args.min_ms)
+        results["regressions"] = regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression['metric']}: {regression['baseline']} -> {regression['current']} "
+                  f"({regression['change']:+.1%})")
+        exit_code = 1 if regressions else 0
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
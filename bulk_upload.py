@@ -0,0 +1,95 @@
+import hashlib
+import logging
+import os
+import shutil
+import tarfile
+import zipfile
+from typing import BinaryIO, Iterator, List, NamedTuple, Tuple
+
+COPY_BLOCK_SIZE = 1024 * 1024
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+class SpooledFile(NamedTuple):
+    name: str       # file name without directories, e.g. "manual.pdf"
+    path: str       # where it was spooled
+    file_hash: str  # MD5 of the content
+    size: int
+
+def copy_and_hash(source: BinaryIO, path: str) -> Tuple[str, int]:
+    """Copy a stream to path block by block and return the MD5 and size of what was copied."""
+    md5 = hashlib.md5()
+    size = 0
+    with open(path, "wb") as f:
+        for block in iter(lambda: source.read(COPY_BLOCK_SIZE), b""):
+            md5.update(block)
+            f.write(block)
+            size += len(block)
+    return md5.hexdigest(), size
+
+def is_pdf_member(name: str) -> bool:
+    """Whether an archive member is a PDF worth ingesting; skips macOS resource forks."""
+    base = os.path.basename(name)
+    return name.lower().endswith(".pdf") and not base.startswith("._") and "__MACOSX/" not in name
+
+def iter_archive_pdfs(fileobj: BinaryIO, filename: str) -> Iterator[Tuple[str, BinaryIO]]:
+    """Yield (member name, stream) for every PDF in a zip or tar archive, one member at a time.
+
+    Tar archives are read as a stream, so they are never seeked or held
+    in memory; zip archives need their central directory and are read
+    from the (already spooled) upload file.
+    """
+    lower = filename.lower()
+    if lower.endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and is_pdf_member(info.filename):
+                    with archive.open(info) as member:
+                        yield info.filename, member
+    elif lower.endswith(TAR_SUFFIXES):
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for info in archive:
+                if info.isfile() and is_pdf_member(info.name):
+                    member = archive.extractfile(info)
+                    if member is not None:
+                        yield info.name, member
+    else:
+        raise ValueError(f"Unsupported file type: {filename}")
+
+def spool_uploads(uploads: List[Tuple[str, BinaryIO]], spool_dir: str, max_files: int) -> Tuple[List[SpooledFile], List[dict]]:
+    """Write the PDFs of uploaded files and archives to spool_dir, hashing them on the way.
+
+    Returns the spooled PDFs and the uploads or members that were rejected,
+    with the reason. Content seen before in the same upload is not written
+    twice.
+    """
+    os.makedirs(spool_dir, exist_ok=True)
+    spooled: List[SpooledFile] = []
+    rejected: List[dict] = []
+
+    def spool(name: str, stream: BinaryIO):
+        if len(spooled) >= max_files:
+            rejected.append({"filename": name, "reason": f"more than {max_files} files in one upload"})
+            return
+        tmp_path = os.path.join(spool_dir, f"incoming-{len(spooled)}.tmp")
+        file_hash, size = copy_and_hash(stream, tmp_path)
+        path = os.path.join(spool_dir, f"{file_hash}.pdf")
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        spooled.append(SpooledFile(os.path.basename(name), path, file_hash, size))
+
+    for filename, fileobj in uploads:
+        try:
+            if filename.lower().endswith(".pdf"):
+                spool(filename, fileobj)
+            else:
+                for member_name, member in iter_archive_pdfs(fileobj, filename):
+                    spool(member_name, member)
+        except (ValueError, zipfile.BadZipFile, tarfile.TarError) as e:
+            logging.warning(f"Rejected bulk upload file {filename}: {e}")
+            rejected.append({"filename": filename, "reason": str(e)})
+        except Exception:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+            raise
+    return spooled, rejected
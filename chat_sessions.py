@@ -0,0 +1,227 @@
+import dataclasses
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from context_builder import estimate_tokens
+
+@dataclass
+class Turn:
+    question: str
+    standalone_question: str  # the question rewritten to stand on its own, used for retrieval
+    answer: str
+    sources: List[Dict]
+    created_at: float
+
+@dataclass
+class WarmCandidates:
+    """The chunks retrieved for a session's last searched question, kept to answer follow-ups from."""
+    scope: Tuple
+    embedding_model: str
+    hits: List             # SearchHit, in retrieval order
+    vectors: np.ndarray    # normalized chunk embeddings, one row per hit
+    reference_score: float  # best similarity between the searched question and the chunks
+
+def normalized(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector, axis=-1, keepdims=True) + 1e-12)
+
+def format_history(turns: Sequence[Turn], max_tokens: int) -> str:
+    """The most recent turns, oldest first, that fit into max_tokens; older turns are left out."""
+    lines = []
+    used = 0
+    for turn in reversed(turns):
+        text = f"User: {turn.question}\nAssistant: {turn.answer}"
+        used += estimate_tokens(text)
+        if used > max_tokens and lines:
+            break
+        lines.append(text)
+    return "\n".join(reversed(lines))
+
+class ChatSessionStore:
+    """Conversation turns of server-side chat sessions, persisted in SQLite.
+
+    Besides the turns, the database keeps a cache of follow-up questions
+    rewritten into standalone questions. Each session's last retrieved
+    chunks and their embeddings are kept in memory for the most recently
+    used sessions only, so a restart just costs one search per session.
+    """
+
+    def __init__(self, path: str, ttl: float, max_rewrites: int, max_warm_sessions: int):
+        self.ttl = ttl
+        self.max_rewrites = max_rewrites
+        self.max_warm_sessions = max_warm_sessions
+        self.rewrite_hits = 0
+        self.rewrite_misses = 0
+        self.candidate_reuses = 0
+        self.candidate_searches = 0
+        self._warm = OrderedDict()  # session id -> WarmCandidates, least recently used first
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "session_id TEXT NOT NULL, turn INTEGER NOT NULL, question TEXT NOT NULL, standalone_question TEXT NOT NULL, "
+            "answer TEXT NOT NULL, sources TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (session_id, turn))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_rewrites (key TEXT PRIMARY KEY, standalone_question TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS query_rewrites_last_used ON query_rewrites (last_used)")
+        self._conn.commit()
+
+    def create(self) -> str:
+        """Start a new session, dropping sessions idle for longer than the TTL."""
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            expired = [row[0] for row in self._conn.execute("SELECT session_id FROM sessions WHERE updated_at < ?", (now - self.ttl,))]
+            for expired_id in expired:
+                self._delete(expired_id)
+            self._conn.execute("INSERT INTO sessions (session_id, created_at, updated_at) VALUES (?, ?, ?)", (session_id, now, now))
+            self._conn.commit()
+        if expired:
+            logging.info(f"Dropped {len(expired)} expired chat sessions")
+        return session_id
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is not None
+
+    def turns(self, session_id: str, limit: Optional[int] = None) -> List[Turn]:
+        """The session's turns, oldest first; only the last limit turns if given."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question, standalone_question, answer, sources, created_at FROM turns "
+                "WHERE session_id = ? ORDER BY turn DESC LIMIT ?",
+                (session_id, -1 if limit is None else limit),
+            ).fetchall()
+        return [Turn(question, standalone, answer, json.loads(sources), created_at) for question, standalone, answer, sources, created_at in reversed(rows)]
+
+    def add_turn(self, session_id: str, question: str, standalone_question: str, answer: str, sources: List[Dict]) -> int:
+        """Append a turn and return its number, counting from 1."""
+        now = time.time()
+        with self._lock:
+            (turn,) = self._conn.execute("SELECT COALESCE(MAX(turn), 0) + 1 FROM turns WHERE session_id = ?", (session_id,)).fetchone()
+            self._conn.execute(
+                "INSERT INTO turns (session_id, turn, question, standalone_question, answer, sources, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session_id, turn, question, standalone_question, answer, json.dumps(sources), now),
+            )
+            self._conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (now, session_id))
+            self._conn.commit()
+        return turn
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            deleted = self._delete(session_id)
+            self._conn.commit()
+        return deleted
+
+    def _delete(self, session_id: str) -> bool:
+        """Caller holds the lock and commits."""
+        self._warm.pop(session_id, None)
+        self._conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+        return self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount > 0
+
+    def get_rewrite(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT standalone_question FROM query_rewrites WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.rewrite_misses += 1
+                return None
+            self._conn.execute("UPDATE query_rewrites SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.rewrite_hits += 1
+            return row[0]
+
+    def put_rewrite(self, key: str, standalone_question: str):
+        """Remember a rewrite, evicting the least recently used ones above max_rewrites."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_rewrites (key, standalone_question, last_used) VALUES (?, ?, ?)",
+                (key, standalone_question, time.time()),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM query_rewrites").fetchone()
+            if count > self.max_rewrites:
+                self._conn.execute(
+                    "DELETE FROM query_rewrites WHERE key IN (SELECT key FROM query_rewrites ORDER BY last_used LIMIT ?)",
+                    (count - self.max_rewrites,),
+                )
+            self._conn.commit()
+
+    def keep_candidates(self, session_id: str, scope: Tuple, embedding_model: str, hits: List, vectors: np.ndarray, query_vector: np.ndarray):
+        """Keep the chunks retrieved for a session's question, with their embeddings, for its follow-ups."""
+        vectors = normalized(vectors)
+        reference_score = float(np.max(vectors @ normalized(query_vector))) if len(hits) else 0.0
+        with self._lock:
+            self._warm[session_id] = WarmCandidates(scope, embedding_model, hits, vectors, reference_score)
+            self._warm.move_to_end(session_id)
+            while len(self._warm) > self.max_warm_sessions:
+                self._warm.popitem(last=False)
+
+    def rank_candidates(self, session_id: str, scope: Tuple, embedding_model: str, query_vector: np.ndarray, min_ratio: float) -> Optional[List]:
+        """Rank the session's kept chunks for a follow-up question, best first.
+
+        Returns None, so the caller searches, if there are none for this
+        scope and model, or if the best of them is less similar to the new
+        question than min_ratio times its similarity to the question they
+        were retrieved for, i.e. the conversation moved on.
+        """
+        with self._lock:
+            warm = self._warm.get(session_id)
+            if warm is None or warm.scope != scope or warm.embedding_model != embedding_model or not warm.hits:
+                self.candidate_searches += 1
+                return None
+            self._warm.move_to_end(session_id)
+        scores = warm.vectors @ normalized(query_vector)
+        if float(np.max(scores)) < min_ratio * warm.reference_score:
+            with self._lock:
+                self.candidate_searches += 1
+            return None
+        with self._lock:
+            self.candidate_reuses += 1
+        return [dataclasses.replace(warm.hits[i], score=float(scores[i])) for i in np.argsort(-scores, kind="stable")]
+
+    def invalidate(self, collection_name: str):
+        """Forget kept chunks of a collection, e.g. after it was re-ingested."""
+        with self._lock:
+            for session_id in [session_id for session_id, warm in self._warm.items() if collection_name in warm.scope[0]]:
+                del self._warm[session_id]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            (sessions,) = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()
+            (turns,) = self._conn.execute("SELECT COUNT(*) FROM turns").fetchone()
+            (rewrites,) = self._conn.execute("SELECT COUNT(*) FROM query_rewrites").fetchone()
+            warm = len(self._warm)
+        rewrite_lookups = self.rewrite_hits + self.rewrite_misses
+        retrievals = self.candidate_reuses + self.candidate_searches
+        return {
+            "sessions": sessions,
+            "turns": turns,
+            "warm_sessions": warm,
+            "cached_rewrites": rewrites,
+            "rewrite_hits": self.rewrite_hits,
+            "rewrite_misses": self.rewrite_misses,
+            "rewrite_hit_rate": round(self.rewrite_hits / rewrite_lookups, 4) if rewrite_lookups else 0.0,
+            "candidate_reuses": self.candidate_reuses,
+            "candidate_searches": self.candidate_searches,
+            "candidate_reuse_rate": round(self.candidate_reuses / retrievals, 4) if retrievals else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,110 @@
+import math
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+ADJACENT_GAP_CHARS = 2  # chunks separated by at most this much whitespace are joined
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count: about four characters per token for English text."""
+    return math.ceil(len(text) / 4)
+
+@dataclass
+class Passage:
+    """A run of document text made of one or more retrieved chunks."""
+    words: List[str]
+    start_char: Optional[int]
+    end_char: Optional[int]
+    hits: List[int] = field(default_factory=list)  # indices of the chunks it contains, best first
+    source: Tuple = ()  # (collection, document) the offsets refer to
+    pages: Tuple = (None, None)  # first and last page the text comes from, if known
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.words)
+
+    def cited(self) -> str:
+        """The text headed by its document and pages, e.g. "[manual, pp. 3-4]", for the LLM to cite."""
+        first, last = self.pages
+        if first is None:
+            return self.text
+        pages = f"p. {first}" if last in (None, first) else f"pp. {first}-{last}"
+        document = self.source[1] if len(self.source) > 1 else None
+        return f"[{document}, {pages}] {self.text}" if document else f"[{pages}] {self.text}"
+
+    def touches(self, source: Tuple, start_char: Optional[int], end_char: Optional[int]) -> bool:
+        if source != self.source or None in (self.start_char, self.end_char, start_char, end_char):
+            return False
+        return start_char <= self.end_char + ADJACENT_GAP_CHARS and self.start_char <= end_char + ADJACENT_GAP_CHARS
+
+def join_words(left: List[str], right: List[str]) -> List[str]:
+    """Concatenate two word runs, dropping the longest suffix of left that repeats as a prefix of right."""
+    for overlap in range(min(len(left), len(right)), 0, -1):
+        if left[-overlap:] == right[:overlap]:
+            return left + right[overlap:]
+    return left + right
+
+def page_span(first: Tuple, second: Tuple) -> Tuple:
+    """The page range covering both ranges; unknown pages are ignored."""
+    starts = [page for page in (first[0], second[0]) if page is not None]
+    ends = [page for page in (first[1], second[1]) if page is not None]
+    return (min(starts) if starts else None, max(ends) if ends else None)
+
+def merge(passage: Passage, words: List[str], start_char: int, end_char: int, pages: Tuple = (None, None)) -> Passage:
+    """Combine a passage with an overlapping or adjacent chunk in document order."""
+    if start_char >= passage.start_char and end_char <= passage.end_char:
+        merged = passage.words  # Already contained
+    elif start_char <= passage.start_char and end_char >= passage.end_char:
+        merged = words
+    elif start_char < passage.start_char:
+        merged = join_words(words, passage.words)
+    else:
+        merged = join_words(passage.words, words)
+    return Passage(
+        merged, min(passage.start_char, start_char), max(passage.end_char, end_char), list(passage.hits), passage.source,
+        page_span(passage.pages, pages),
+    )
+
+def assemble_context(chunks: Sequence[dict], token_budget: int, separator: str = "\n", cite_pages: bool = False) -> Tuple[str, List[int]]:
+    """Pack retrieved chunk payloads, most relevant first, into at most token_budget tokens.
+
+    Chunks of the same document that overlap or touch (by their start_char
+    and end_char offsets) are merged into one passage, so text repeated by the
+    chunk overlap is sent once; exact duplicates are dropped. A chunk that
+    does not fit the remaining budget is skipped in favour of later, smaller
+    ones. With cite_pages, each passage is headed by its document and the
+    pages it spans (page_start and page_end). Returns the context and the
+    indices of the chunks it contains.
+    """
+    def render(passage: Passage) -> str:
+        return passage.cited() if cite_pages else passage.text
+
+    passages: List[Passage] = []
+    seen_texts = set()
+    for index, chunk in enumerate(chunks):
+        content = chunk.get("content", "")
+        if not content or content in seen_texts:
+            continue
+        start_char, end_char = chunk.get("start_char"), chunk.get("end_char")
+        source = (chunk.get("collection_name"), chunk.get("doc_id"))
+
+        # Fold the chunk and every passage it touches into one passage
+        pages = (chunk.get("page_start"), chunk.get("page_end"))
+        candidate = Passage(content.split(), start_char, end_char, [index], source, pages)
+        touching = [i for i, passage in enumerate(passages) if passage.touches(source, start_char, end_char)]
+        for i in sorted(touching, key=lambda i: passages[i].start_char):
+            hits = sorted(set(candidate.hits) | set(passages[i].hits))
+            candidate = merge(passages[i], candidate.words, candidate.start_char, candidate.end_char, candidate.pages)
+            candidate.hits = hits
+        if touching:
+            packed = [passage for i, passage in enumerate(passages) if i not in touching]
+            packed.insert(min(touching), candidate)
+        else:
+            packed = passages + [candidate]
+
+        if estimate_tokens(separator.join(render(passage) for passage in packed)) > token_budget:
+            continue
+        seen_texts.add(content)
+        passages = packed
+
+    # Passages stay in order of their most relevant chunk
+    return separator.join(render(passage) for passage in passages), sorted(index for passage in passages for index in passage.hits)
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Callable, Dict, List
+
+import numpy as np
+
+class EmbeddingBatcher:
+    """Coalesces concurrent single-text embedding requests into batched forward passes.
+
+    Requests wait in a bounded queue; callers block on a full queue, which
+    pushes back on bursts. The collector takes the first waiting request,
+    gathers more for up to max_wait seconds or max_batch_size texts, then
+    encodes each embedding model's texts in one call on the executor.
+    """
+
+    def __init__(self, encode: Callable[[List[str], str], np.ndarray], executor: Executor, max_batch_size: int, max_wait: float, max_queue_size: int, max_concurrent_batches: int):
+        self.encode = encode
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue_size = max_queue_size
+        self.max_concurrent_batches = max_concurrent_batches
+        self.batches = 0
+        self.texts = 0
+        self._queue = None
+        self._slots = None
+        self._collector = None
+        self._loop = None
+
+    def _start(self):
+        """Create the queue and collector task on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._collector = self._loop.create_task(self._collect())
+
+    async def embed(self, text: str, model_name: str) -> np.ndarray:
+        """Return the embedding of one text, encoded together with other waiting requests."""
+        if self._collector is None or self._collector.done() or self._loop is not asyncio.get_running_loop():
+            self._start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, model_name, future))
+        return await future
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._slots.acquire()
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: List):
+        try:
+            by_model: Dict[str, List] = {}
+            for text, model_name, future in batch:
+                by_model.setdefault(model_name, []).append((text, future))
+            loop = asyncio.get_running_loop()
+            for model_name, items in by_model.items():
+                try:
+                    vectors = await loop.run_in_executor(self.executor, self.encode, [text for text, _ in items], model_name)
+                except Exception as e:
+                    logging.error(f"Error encoding a batch of {len(items)} queries: {e}")
+                    for _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, future), vector in zip(items, vectors):
+                    if not future.done():
+                        future.set_result(vector)
+                self.batches += 1
+                self.texts += len(items)
+        finally:
+            self._slots.release()
+
+    async def stop(self):
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "average_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+class _ChunkRequest:
+    def __init__(self, texts: List[str], model_name: str):
+        self.texts = texts
+        self.model_name = model_name
+        self.future: Future = Future()
+
+class ChunkEmbeddingBatcher:
+    """Shares embedding forward passes between threads ingesting different documents.
+
+    submit queues a batch of chunks and returns a future right away, so an
+    ingestion keeps extracting and chunking its next batch while this one
+    is encoded. A single drain task on the executor encodes the waiting
+    requests one forward pass at a time, combining those for the same model
+    up to max_batch_size texts, so parallel ingestions do not oversubscribe
+    the CPU with concurrent forward passes.
+    """
+
+    def __init__(self, encode: Callable[[List[str], str], np.ndarray], executor: Executor, max_batch_size: int):
+        self.encode = encode
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.texts = 0
+        self._pending = deque()
+        self._draining = False
+        self._lock = threading.Lock()
+
+    def submit(self, texts: List[str], model_name: str) -> Future:
+        """Queue texts for encoding; the future resolves to their embeddings, one row each."""
+        request = _ChunkRequest(texts, model_name)
+        with self._lock:
+            self._pending.append(request)
+            if not self._draining:
+                try:
+                    self.executor.submit(self._drain)
+                except RuntimeError as e:
+                    # The executor is shut down; fail the waiting requests rather than leave them hanging
+                    for pending in self._pending:
+                        pending.future.set_exception(e)
+                    self._pending.clear()
+                    return request.future
+                self._draining = True
+        return request.future
+
+    def embed(self, texts: List[str], model_name: str) -> np.ndarray:
+        """Return the embeddings of texts, one row each, encoded together with other waiting requests."""
+        return self.submit(texts, model_name).result()
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._draining = False
+                    return
+                batch = self._take()
+            self._run(batch)
+
+    def _take(self) -> List[_ChunkRequest]:
+        """Remove the oldest request and those after it for the same model that fit the batch. Caller holds the lock."""
+        first = self._pending.popleft()
+        batch, size = [first], len(first.texts)
+        for request in list(self._pending):
+            if request.model_name == first.model_name and size + len(request.texts) <= self.max_batch_size:
+                self._pending.remove(request)
+                batch.append(request)
+                size += len(request.texts)
+        return batch
+
+    def _run(self, batch: List[_ChunkRequest]):
+        try:
+            vectors = self.encode([text for request in batch for text in request.texts], batch[0].model_name)
+        except Exception as e:
+            logging.error(f"Error encoding a batch of {len(batch)} chunk batches: {e}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        offset = 0
+        for request in batch:
+            request.future.set_result(vectors[offset:offset + len(request.texts)])
+            offset += len(request.texts)
+        self.batches += 1
+        self.texts += offset
+
+    def stats(self) -> Dict:
+        with self._lock:
+            waiting = len(self._pending)
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "average_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "waiting": waiting,
+        }
@@ -0,0 +1,112 @@
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+class EmbeddingCache:
+    """On-disk cache of float32 embeddings keyed by (model, chunk hash), evicting least recently used entries."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, hash TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (model, hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._entries, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+        logging.info(f"Opened embedding cache {path} with {self._entries} entries")
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Return the cached vectors for the given hashes and mark them as recently used."""
+        if not hashes:
+            return {}
+        found = {}
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            # Stay below SQLite's limit on query parameters
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(part))})",
+                    [model, *part],
+                ).fetchall()
+                for chunk_hash, blob in rows:
+                    found[chunk_hash] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                    [(now, model, chunk_hash) for chunk_hash in found],
+                )
+                self._conn.commit()
+            hits = sum(1 for chunk_hash in hashes if chunk_hash in found)
+            self.hits += hits
+            self.misses += len(hashes) - hits
+        return found
+
+    def put_many(self, model: str, items: List[Tuple[str, np.ndarray]]):
+        """Store vectors for the given hashes, then evict old entries above the size cap."""
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (model, chunk_hash, len(vector), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for chunk_hash, vector in items
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            # Entries are content-addressed, so an existing row already holds the same vector
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, hash, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            inserted = self._conn.total_changes - before
+            self._entries += inserted
+            self._bytes += inserted * len(rows[0][3])
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes. Caller holds the lock."""
+        if self._bytes <= self.max_bytes or not self._entries:
+            return
+        average = self._bytes / self._entries
+        excess = int((self._bytes - self.max_bytes) / average) + 1
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._entries, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+        logging.info(f"Evicted {excess} entries from the embedding cache")
+
+    def stats(self) -> Dict:
+        """Return hit-rate and size metrics."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": self._entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
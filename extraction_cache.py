@@ -0,0 +1,172 @@
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+TEXT_FILE = "text.bin"
+INDEX_FILE = "pages.npy"
+META_FILE = "meta.json"
+
+class CachedPages:
+    """The extracted pages of one PDF, read from the cache on demand."""
+
+    def __init__(self, path: str, page_count: int):
+        self.path = path
+        self.page_count = page_count  # pages of the PDF, including ones without text
+
+    def __iter__(self) -> Iterator[Tuple[int, str]]:
+        """Yield (page number, text) for each page with text, decoding one page at a time."""
+        index = np.load(os.path.join(self.path, INDEX_FILE), mmap_mode="r")
+        if not len(index):
+            return
+        with open(os.path.join(self.path, TEXT_FILE), "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as text:
+            for page_number, offset, length in index:
+                yield int(page_number), text[offset:offset + length].decode("utf-8")
+
+class ExtractionWriter:
+    """Collects the pages of one extraction and adds them to the cache on commit.
+
+    Pages are appended to a temporary directory as they arrive; an
+    extraction that is abandoned or fails leaves nothing behind.
+    """
+
+    def __init__(self, cache: "ExtractionCache", file_hash: str):
+        self.cache = cache
+        self.file_hash = file_hash
+        self.path = os.path.join(cache.directory, f".{file_hash}.{uuid.uuid4().hex}.tmp")
+        os.makedirs(self.path)
+        self._text = open(os.path.join(self.path, TEXT_FILE), "wb")
+        self._index: List[Tuple[int, int, int]] = []
+        self._offset = 0
+        self._committed = False
+
+    def add(self, page_number: int, page_text: str):
+        data = page_text.encode("utf-8")
+        self._text.write(data)
+        self._index.append((page_number, self._offset, len(data)))
+        self._offset += len(data)
+
+    def commit(self, page_count: int):
+        self._text.close()
+        np.save(os.path.join(self.path, INDEX_FILE), np.array(self._index, dtype=np.int64).reshape(-1, 3))
+        with open(os.path.join(self.path, META_FILE), "w") as f:
+            json.dump({"extractor": self.cache.extractor, "page_count": page_count, "bytes": self._offset}, f)
+        self.cache._add(self.file_hash, self.path, self._offset)
+        self._committed = True
+
+    def __enter__(self) -> "ExtractionWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self._committed:
+            self._text.close()
+            shutil.rmtree(self.path, ignore_errors=True)
+
+class ExtractionCache:
+    """Per-page PDF text keyed by file hash, so re-ingesting a file never parses the PDF again.
+
+    Each entry is a directory with the UTF-8 text of all pages back to back
+    and a (pages, 3) int64 array of page number, byte offset and byte length;
+    both are memory-mapped when read. Entries made by another extractor
+    version are ignored, and least recently used entries are evicted above
+    max_bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, extractor: str):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extractor = extractor
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Leftovers of extractions interrupted by a restart
+        for name in os.listdir(directory):
+            if name.endswith(".tmp"):
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+        self._sizes: Dict[str, int] = {}  # file hash -> text bytes
+        for name in os.listdir(directory):
+            meta = self._read_meta(name)
+            if meta is not None:
+                self._sizes[name] = meta.get("bytes", 0)
+        logging.info(f"Opened extraction cache {directory} with {len(self._sizes)} entries")
+
+    def _read_meta(self, file_hash: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.directory, file_hash, META_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, file_hash: str) -> Optional[CachedPages]:
+        """Return the cached pages of a file, or None if it was not extracted by this extractor yet."""
+        path = os.path.join(self.directory, file_hash)
+        meta = self._read_meta(file_hash)
+        with self._lock:
+            if meta is None or meta.get("extractor") != self.extractor:
+                self.misses += 1
+                return None
+            self.hits += 1
+        try:
+            os.utime(path)  # recency for eviction
+        except OSError:
+            pass
+        return CachedPages(path, meta["page_count"])
+
+    def writer(self, file_hash: str) -> ExtractionWriter:
+        return ExtractionWriter(self, file_hash)
+
+    def _add(self, file_hash: str, tmp_path: str, size: int):
+        path = os.path.join(self.directory, file_hash)
+        with self._lock:
+            # A concurrent extraction of the same file may have won; an older extractor's entry is replaced
+            existing = self._read_meta(file_hash)
+            if existing is not None and existing.get("extractor") == self.extractor:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                return
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_path, path)
+            self._sizes[file_hash] = size
+            self._evict(keep=file_hash)
+
+    def _evict(self, keep: str):
+        """Delete least recently used entries until the text fits in max_bytes. Caller holds the lock."""
+        total = sum(self._sizes.values())
+        if total <= self.max_bytes:
+            return
+
+        def last_used(file_hash: str) -> float:
+            try:
+                return os.path.getmtime(os.path.join(self.directory, file_hash))
+            except OSError:
+                return 0.0
+
+        evicted = 0
+        for file_hash in sorted(self._sizes, key=last_used):
+            if total <= self.max_bytes:
+                break
+            if file_hash == keep:
+                continue
+            shutil.rmtree(os.path.join(self.directory, file_hash), ignore_errors=True)
+            total -= self._sizes.pop(file_hash)
+            evicted += 1
+        logging.info(f"Evicted {evicted} entries from the extraction cache")
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries, size = len(self._sizes), sum(self._sizes.values())
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    """Raised inside a job when it has been cancelled."""
+
+class QueueFull(Exception):
+    """Raised when the job queue cannot accept more work."""
+
+class IngestionJob:
+    """A unit of background work with status, progress counters and cancellation."""
+
+    def __init__(self, description: Dict):
+        self.id = uuid.uuid4().hex
+        self.description = description
+        self.status = QUEUED
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+
+    def subjob(self, description: Dict) -> "IngestionJob":
+        """A job for one part of this job's work, e.g. one file of a bulk upload; cancelled together with it."""
+        job = IngestionJob(description)
+        job._cancel_event = self._cancel_event
+        return job
+
+    def update(self, **progress):
+        """Update progress counters, e.g. pages_parsed=10."""
+        self.progress.update(progress)
+
+    def cancel(self):
+        """Ask the job to stop at its next checkpoint."""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation was requested."""
+        if self._cancel_event.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            **self.description,
+        }
+
+class JobQueue:
+    """Bounded queue of background jobs executed by a fixed pool of worker threads."""
+
+    def __init__(self, max_workers: int, max_pending: int, history_limit: int = 100):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.history_limit = history_limit
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, job: IngestionJob, fn: Callable[[IngestionJob], Dict], cleanup: Optional[Callable[[], None]] = None) -> IngestionJob:
+        """Queue fn(job) for execution, raising QueueFull when too much work is waiting.
+
+        cleanup runs once the job is finished, including when it is
+        cancelled before it starts.
+        """
+        with self._lock:
+            if self.pending() >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} jobs are already waiting, try again later.")
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn, cleanup)
+        return job
+
+    def _run(self, job: IngestionJob, fn: Callable[[IngestionJob], Dict], cleanup: Optional[Callable[[], None]] = None):
+        try:
+            self._execute(job, fn)
+        finally:
+            if cleanup is not None:
+                try:
+                    cleanup()
+                except Exception as e:
+                    logging.error(f"Cleanup of job {job.id} failed: {e}")
+
+    def _execute(self, job: IngestionJob, fn: Callable[[IngestionJob], Dict]):
+        if job.cancelled:
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            return
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = fn(job)
+            job.status = COMPLETED
+        except JobCancelled:
+            logging.info(f"Job {job.id} cancelled")
+            job.status = CANCELLED
+        except Exception as e:
+            logging.error(f"Job {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond the history limit. Caller holds the lock."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(self._jobs) - self.history_limit)]:
+            del self._jobs[job_id]
+
+    def pending(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    def running(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == RUNNING)
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestionJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[IngestionJob]:
+        """Request cancellation of a queued or running job."""
+        job = self._jobs.get(job_id)
+        if job is not None and job.status not in FINISHED_STATES:
+            job.cancel()
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+        return job
+
+    def shutdown(self):
+        """Cancel outstanding jobs and stop the workers."""
+        for job in self.list():
+            if job.status not in FINISHED_STATES:
+                job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,454 @@
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+import uuid
+from array import array
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from vector_store import storage_name
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+TOKEN_SEPARATORS = re.compile(r"[-_./:]")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were which will with".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens for BM25.
+
+    Compound tokens such as part numbers and error codes ("E-1042",
+    "PN.558/12") are kept whole so they match exactly, and their parts are
+    indexed as well so partial codes still match.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = TOKEN_SEPARATORS.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part not in STOPWORDS)
+    return tokens
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+MERGE_FACTOR = 2  # the newest segments are merged once they hold at least 1/MERGE_FACTOR of the documents of the one before
+
+# Merges run here, one at a time, so commits and searches do not wait for them
+_MERGER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bm25-merge")
+
+def _postings(terms: np.ndarray, docs: np.ndarray, tfs: np.ndarray, vocabulary: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[str]]:
+    """Sort postings into CSR form and drop terms without postings.
+
+    Postings must be in document order within each term; the sort by term
+    is stable, so every posting list stays ordered by document.
+    """
+    order = np.argsort(terms, kind="stable")
+    terms, docs, tfs = terms[order], docs[order], tfs[order]
+    counts = np.bincount(terms, minlength=len(vocabulary))
+    used = counts > 0
+    vocabulary = [term for term, is_used in zip(vocabulary, used) if is_used]
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(counts[used], out=offsets[1:])
+    return offsets, docs, tfs, vocabulary
+
+class _Segment:
+    """An immutable run of postings in CSR form, with its own vocabulary and document numbers.
+
+    The documents of term t are doc_ids[offsets[t]:offsets[t + 1]] with
+    their term frequencies at the same positions in tfs. The arrays are
+    .npy files memory-mapped for search. Removed documents are only marked
+    deleted until the segment is merged.
+    """
+
+    FILES = ("offsets.npy", "doc_ids.npy", "tfs.npy", "doc_lengths.npy", "doc_groups.npy", "terms.json", "groups.json", "points.json")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.doc_ids = np.load(os.path.join(path, "doc_ids.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(path, "tfs.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(path, "doc_lengths.npy"))
+        self.doc_groups = np.load(os.path.join(path, "doc_groups.npy"))
+        with open(os.path.join(path, "terms.json")) as f:
+            self.terms = json.load(f)
+        with open(os.path.join(path, "groups.json")) as f:
+            self.groups = json.load(f)
+        with open(os.path.join(path, "points.json")) as f:
+            self.points = json.load(f)
+        self.vocabulary = {term: term_id for term_id, term in enumerate(self.terms)}
+        self.group_numbers = {group: number for number, group in enumerate(self.groups)}
+        self.doc_numbers = {point_id: doc for doc, point_id in enumerate(self.points)}
+        # Documents of each group, found without scanning doc_groups
+        order = np.argsort(self.doc_groups, kind="stable")
+        bounds = np.searchsorted(self.doc_groups[order], np.arange(len(self.groups) + 1))
+        self.group_docs = [order[bounds[number]:bounds[number + 1]] for number in range(len(self.groups))]
+        self.deleted = set()
+        self.alive = np.ones(len(self.points), dtype=bool)
+        self.alive_count = len(self.points)
+        self.alive_length = int(self.doc_lengths.sum())
+
+    @classmethod
+    def write(cls, path: str, offsets: np.ndarray, docs: np.ndarray, tfs: np.ndarray, lengths: np.ndarray, doc_groups: np.ndarray, vocabulary: List[str], groups: List[str], points: List[str]) -> "_Segment":
+        os.makedirs(path)
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+        np.save(os.path.join(path, "doc_ids.npy"), docs.astype(np.int32))
+        np.save(os.path.join(path, "tfs.npy"), tfs.astype(np.uint16))
+        np.save(os.path.join(path, "doc_lengths.npy"), lengths.astype(np.int32))
+        np.save(os.path.join(path, "doc_groups.npy"), doc_groups.astype(np.int32))
+        with open(os.path.join(path, "terms.json"), "w") as f:
+            json.dump(vocabulary, f)
+        with open(os.path.join(path, "groups.json"), "w") as f:
+            json.dump(groups, f)
+        with open(os.path.join(path, "points.json"), "w") as f:
+            json.dump(points, f)
+        return cls(path)
+
+    def delete(self, doc: int):
+        if doc not in self.deleted:
+            self.deleted.add(doc)
+            self.alive[doc] = False
+            self.alive_count -= 1
+            self.alive_length -= int(self.doc_lengths[doc])
+
+    def docs(self, group: Optional[str] = None) -> np.ndarray:
+        """Numbers of the live documents, or of those in one group."""
+        if group is None:
+            return np.flatnonzero(self.alive)
+        number = self.group_numbers.get(group)
+        if number is None:
+            return np.empty(0, dtype=np.int64)
+        docs = self.group_docs[number]
+        return docs[self.alive[docs]]
+
+class BM25Index:
+    """BM25 inverted index of one collection's chunks, kept as a list of segments.
+
+    Additions and removals are buffered; commit() writes the added chunks
+    as a new segment and marks removed ones deleted, so it costs time in
+    proportion to the change rather than to the whole index. Once the
+    newest segments hold about as many documents as the one before them,
+    they are merged into one in the background, which keeps the number of
+    segments logarithmic in the collection size. segments.json lists the
+    live segments and is replaced last, so a crash leaves the previous
+    state. Chunks may belong to a group, the source document in shared
+    collections, to restrict search.
+    """
+
+    MANIFEST = "segments.json"
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+        self._merging = False
+        self._closed = False
+        self._load()
+        self.rollback()
+
+    def _load(self):
+        self.segments: List[_Segment] = []
+        manifest_path = os.path.join(self.path, self.MANIFEST)
+        if not os.path.exists(manifest_path):
+            return
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        for entry in manifest["segments"]:
+            segment = _Segment(os.path.join(self.path, entry["name"]))
+            for doc in entry["deleted"]:
+                segment.delete(doc)
+            self.segments.append(segment)
+        # Segments written or merged when the process stopped before the manifest was replaced
+        listed = {segment.name for segment in self.segments}
+        for name in os.listdir(self.path):
+            if name.startswith("segment-") and name not in listed:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def __len__(self) -> int:
+        return sum(segment.alive_count for segment in self.segments)
+
+    def _locate(self, point_id: str) -> Optional[Tuple[_Segment, int]]:
+        """The segment and document number of a committed, not deleted chunk. Caller holds the lock."""
+        for segment in reversed(self.segments):
+            doc = segment.doc_numbers.get(point_id)
+            if doc is not None and segment.alive[doc]:
+                return segment, doc
+        return None
+
+    def __contains__(self, point_id: str) -> bool:
+        """Whether the chunk will be indexed after the next commit."""
+        with self.lock:
+            if point_id in self._pending_numbers:
+                return self._pending_numbers[point_id] not in self._removed_pending
+            return point_id not in self._removed and self._locate(point_id) is not None
+
+    def point_ids(self, group: Optional[str] = None) -> List[str]:
+        """Ids of all indexed chunks, or of the chunks in one group."""
+        with self.lock:
+            committed = [segment.points[doc] for segment in self.segments for doc in segment.docs(group)]
+            if group is None:
+                return committed + list(self._pending_points)
+            pending = [point_id for point_id, pending_group in zip(self._pending_points, self._pending_group_names) if pending_group == group]
+            return committed + pending
+
+    def rollback(self):
+        """Drop uncommitted additions and removals."""
+        with self.lock:
+            self._pending_terms = array("i")
+            self._pending_docs = array("i")
+            self._pending_tfs = array("i")
+            self._pending_lengths = array("i")
+            self._pending_group_names = []
+            self._pending_points = []
+            self._pending_numbers = {}
+            self._pending_vocabulary = {}
+            self._removed = set()
+            self._removed_pending = set()
+
+    def add(self, point_ids: List[str], texts: List[str], group: Optional[str] = None):
+        """Buffer chunks for the next commit."""
+        with self.lock:
+            for point_id, text in zip(point_ids, texts):
+                if point_id in self:
+                    continue
+                counts = Counter(tokenize(text))
+                doc = len(self._pending_points)
+                for term, tf in counts.items():
+                    self._pending_terms.append(self._pending_vocabulary.setdefault(term, len(self._pending_vocabulary)))
+                    self._pending_docs.append(doc)
+                    self._pending_tfs.append(tf)
+                self._pending_lengths.append(sum(counts.values()))
+                self._pending_group_names.append(group)
+                self._pending_numbers[point_id] = doc
+                self._pending_points.append(point_id)
+
+    def remove(self, point_ids: Iterable[str]):
+        """Buffer removals for the next commit."""
+        with self.lock:
+            for point_id in point_ids:
+                if point_id in self._pending_numbers:
+                    self._removed_pending.add(self._pending_numbers[point_id])
+                if self._locate(point_id) is not None:
+                    self._removed.add(point_id)
+
+    def commit(self):
+        """Write buffered additions as a new segment, mark buffered removals deleted and save the manifest."""
+        with self.lock:
+            if not self._pending_points and not self._removed and os.path.exists(os.path.join(self.path, self.MANIFEST)):
+                return
+            alive = np.ones(len(self._pending_points), dtype=bool)
+            alive[list(self._removed_pending)] = False
+            if alive.any():
+                docs = np.frombuffer(self._pending_docs, dtype=np.int32)
+                keep = alive[docs]
+                offsets, docs, tfs, vocabulary = _postings(
+                    np.frombuffer(self._pending_terms, dtype=np.int32)[keep],
+                    (np.cumsum(alive, dtype=np.int32) - 1)[docs[keep]],
+                    np.minimum(np.frombuffer(self._pending_tfs, dtype=np.int32)[keep], np.iinfo(np.uint16).max),
+                    list(self._pending_vocabulary),
+                )
+                groups = list(dict.fromkeys(group for group in self._pending_group_names if group is not None))
+                group_numbers = {group: number for number, group in enumerate(groups)}
+                pending_groups = np.array([group_numbers.get(group, -1) for group in self._pending_group_names], dtype=np.int32)
+                self.segments.append(_Segment.write(
+                    self._segment_path(), offsets, docs, tfs,
+                    np.frombuffer(self._pending_lengths, dtype=np.int32)[alive], pending_groups[alive], vocabulary, groups,
+                    [point_id for point_id, is_alive in zip(self._pending_points, alive) if is_alive],
+                ))
+            for point_id in self._removed:
+                location = self._locate(point_id)
+                if location is not None:
+                    segment, doc = location
+                    segment.delete(doc)
+            self._save_manifest()
+            self.rollback()
+            if self._merge_due() and not self._merging and not self._closed:
+                self._merging = True
+                _MERGER.submit(self._merge)
+
+    def _segment_path(self) -> str:
+        return os.path.join(self.path, f"segment-{uuid.uuid4().hex}")
+
+    def _save_manifest(self):
+        """Replace segments.json with the current segments and their deleted documents. Caller holds the lock."""
+        os.makedirs(self.path, exist_ok=True)
+        manifest = {"segments": [{"name": segment.name, "deleted": sorted(segment.deleted)} for segment in self.segments]}
+        tmp_path = os.path.join(self.path, f"{self.MANIFEST}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(self.path, self.MANIFEST))
+
+    def _merge_due(self) -> bool:
+        return len(self.segments) > 1 and self.segments[-1].alive_count * MERGE_FACTOR >= self.segments[-2].alive_count
+
+    def _merge(self):
+        """Merge the newest segments while a merge is due, swapping each result in under the lock."""
+        with self._merge_lock:
+            while True:
+                with self.lock:
+                    if self._closed or not self._merge_due():
+                        self._merging = False
+                        return
+                    # The newest segments, back to the first one that is much larger than them together
+                    start = len(self.segments) - 1
+                    size = self.segments[start].alive_count
+                    while start > 0 and size * MERGE_FACTOR >= self.segments[start - 1].alive_count:
+                        start -= 1
+                        size += self.segments[start].alive_count
+                    run = self.segments[start:]
+                    deleted = [set(segment.deleted) for segment in run]
+                try:
+                    merged = self._merge_segments(run, deleted)
+                except Exception as e:
+                    logging.error(f"Merging BM25 segments of {self.path} failed: {e}")
+                    with self.lock:
+                        self._merging = False
+                    return
+                with self.lock:
+                    # Commits only append segments, so the run is still in place; removals made meanwhile carry over
+                    for segment, deleted_before in zip(run, deleted):
+                        for doc in segment.deleted - deleted_before:
+                            merged.delete(merged.doc_numbers[segment.points[doc]])
+                    self.segments[start:start + len(run)] = [merged]
+                    self._save_manifest()
+                for segment in run:
+                    shutil.rmtree(segment.path, ignore_errors=True)
+
+    def _merge_segments(self, run: List[_Segment], deleted: List[set]) -> _Segment:
+        """Write the live documents of consecutive segments as one segment."""
+        vocabulary: Dict[str, int] = {}
+        group_numbers: Dict[str, int] = {}
+        terms, docs, tfs, lengths, doc_groups, points = [], [], [], [], [], []
+        base = 0
+        for segment, segment_deleted in zip(run, deleted):
+            alive = np.ones(len(segment.points), dtype=bool)
+            alive[list(segment_deleted)] = False
+            term_ids = np.array([vocabulary.setdefault(term, len(vocabulary)) for term in segment.terms], dtype=np.int32)
+            group_ids = np.array([group_numbers.setdefault(group, len(group_numbers)) for group in segment.groups] + [-1], dtype=np.int32)
+            segment_docs = np.asarray(segment.doc_ids)
+            keep = alive[segment_docs]
+            terms.append(np.repeat(term_ids, np.diff(segment.offsets))[keep])
+            docs.append((np.cumsum(alive, dtype=np.int32) - 1 + base)[segment_docs[keep]])
+            tfs.append(np.asarray(segment.tfs)[keep])
+            lengths.append(segment.doc_lengths[alive])
+            # Group -1 picks the trailing -1 of group_ids
+            doc_groups.append(group_ids[segment.doc_groups[alive]])
+            points.extend(point_id for point_id, is_alive in zip(segment.points, alive) if is_alive)
+            base += int(alive.sum())
+        # Later segments hold higher document numbers, so postings stay in document order within each term
+        offsets, merged_docs, merged_tfs, merged_vocabulary = _postings(np.concatenate(terms), np.concatenate(docs), np.concatenate(tfs), list(vocabulary))
+        return _Segment.write(
+            self._segment_path(), offsets, merged_docs, merged_tfs,
+            np.concatenate(lengths), np.concatenate(doc_groups), merged_vocabulary, list(group_numbers), points,
+        )
+
+    def close(self):
+        """Stop merging, waiting for a running merge, before the index files are removed."""
+        with self._merge_lock:
+            self._closed = True
+
+    def search(self, query: str, limit: int, groups: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """Return (point id, BM25 score) of the best matching chunks, optionally only from the given groups."""
+        with self.lock:
+            doc_count = len(self)
+            if doc_count == 0:
+                return []
+            avg_doc_length = sum(segment.alive_length for segment in self.segments) / doc_count
+            # Document frequencies count live documents across all segments
+            postings = []
+            frequencies: Dict[str, int] = {}
+            for segment in self.segments:
+                segment_postings = []
+                for term in set(tokenize(query)):
+                    term_id = segment.vocabulary.get(term)
+                    if term_id is None:
+                        continue
+                    start, stop = int(segment.offsets[term_id]), int(segment.offsets[term_id + 1])
+                    docs = np.asarray(segment.doc_ids[start:stop])
+                    frequencies[term] = frequencies.get(term, 0) + int(np.count_nonzero(segment.alive[docs]))
+                    segment_postings.append((term, docs, np.asarray(segment.tfs[start:stop], dtype=np.float32)))
+                postings.append(segment_postings)
+
+            hits = []
+            for segment, segment_postings in zip(self.segments, postings):
+                if not segment_postings:
+                    continue
+                scores = np.zeros(len(segment.points), dtype=np.float32)
+                for term, docs, tfs in segment_postings:
+                    df = frequencies[term]
+                    idf = math.log(1.0 + (doc_count - df + 0.5) / (df + 0.5))
+                    norms = self.k1 * (1.0 - self.b + self.b * segment.doc_lengths[docs] / avg_doc_length)
+                    scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norms)
+                scores[~segment.alive] = 0.0
+                if groups is not None:
+                    numbers = [segment.group_numbers[group] for group in groups if group in segment.group_numbers]
+                    scores[~np.isin(segment.doc_groups, numbers)] = 0.0
+                matched = int(np.count_nonzero(scores))
+                if matched == 0:
+                    continue
+                k = min(limit, matched)
+                docs = np.argpartition(-scores, k - 1)[:k]
+                hits.extend((segment.points[doc], float(scores[doc])) for doc in docs)
+            hits.sort(key=lambda hit: hit[1], reverse=True)
+            return hits[:limit]
+
+class LexicalIndexStore:
+    """BM25 indexes of all collections, one directory per collection."""
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        self._indexes = {}
+        self._lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _path(self, collection_name: str) -> str:
+        return os.path.join(self.root_dir, storage_name(collection_name))
+
+    def get(self, collection_name: str) -> BM25Index:
+        """Return the collection's index, empty if it was never built. Only for collections that exist."""
+        with self._lock:
+            index = self._indexes.get(collection_name)
+            if index is None:
+                index = BM25Index(self._path(collection_name))
+                self._indexes[collection_name] = index
+            return index
+
+    def create(self, collection_name: str) -> BM25Index:
+        """Return a new empty index, replacing any existing one with the same name."""
+        with self._lock:
+            previous = self._indexes.pop(collection_name, None)
+            if previous is not None:
+                previous.close()
+            shutil.rmtree(self._path(collection_name), ignore_errors=True)
+            index = BM25Index(self._path(collection_name))
+            self._indexes[collection_name] = index
+        logging.info(f"Lexical index for '{collection_name}' created.")
+        return index
+
+    def search(self, collection_name: str, query: str, limit: int, groups: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """Search the collection's index; names without an index on disk find nothing and are not cached."""
+        with self._lock:
+            index = self._indexes.get(collection_name)
+            if index is None:
+                if not os.path.isdir(self._path(collection_name)):
+                    return []
+                index = BM25Index(self._path(collection_name))
+                self._indexes[collection_name] = index
+        return index.search(query, limit, groups)
@@ -0,0 +1,66 @@
+"""Measure /query throughput of a running backend at increasing concurrency.
+
+Start the backend with the answer cache disabled so every request runs the
+full embed -> search -> LLM path, then point this script at a collection:
+
+    ANSWER_CACHE_ENABLED=false uvicorn backend:app --port 8001
+    python loadtest.py --collection my_manual --requests 64 --concurrency 1,2,4,8,16
+
+With the async query path, requests/s should grow with concurrency until
+the LLM or vector store becomes the bottleneck.
+"""
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+def send_query(url: str, collection_name: str, query: str) -> float:
+    """Send one query and return its latency in seconds."""
+    start = time.perf_counter()
+    response = requests.post(f"{url}/query", json={"query": query, "collection_name": collection_name}, timeout=300)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+def run_level(url: str, collection_name: str, query: str, total: int, concurrency: int) -> dict:
+    """Send total queries with the given number in flight and summarize throughput and latency."""
+    # Distinct questions so repeated requests are not answered from any cache
+    queries = [f"{query} (request {i})" for i in range(total)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(lambda q: send_query(url, collection_name, q), queries))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(total / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8001")
+    parser.add_argument("--collection", required=True, help="Collection to query (the PDF file name without .pdf)")
+    parser.add_argument("--query", default="What is this document about?")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    args = parser.parse_args()
+
+    results = []
+    for concurrency in [int(level) for level in args.concurrency.split(",")]:
+        result = run_level(args.url, args.collection, args.query, args.requests, concurrency)
+        results.append(result)
+        print(f"concurrency {concurrency:>3}: {result['requests_per_second']:>7} req/s, "
+              f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms")
+
+    baseline = results[0]["requests_per_second"]
+    for result in results:
+        result["speedup"] = round(result["requests_per_second"] / baseline, 2)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
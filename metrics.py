@@ -0,0 +1,283 @@
+import contextvars
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Upper bounds in seconds, from a cached lookup to a slow LLM answer or a large PDF
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+class Metric:
+    """A named metric family with optional labels, rendered in the Prometheus text format."""
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterator[Tuple[str, Tuple, float]]:
+        """Yield (name suffix, label values, value) for every series."""
+        return iter(())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            # Histogram buckets carry one extra label value, the bucket bound
+            names = self.labelnames + (("le",) if len(labels) > len(self.labelnames) else ())
+            lines.append(f"{self.name}{suffix}{format_labels(names, labels)} {float(value)!r}")
+        return lines
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [("_total", labels, value) for labels, value in self._values.items()]
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, amount: float = 1.0, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, *labels):
+        self.inc(-amount, *labels)
+
+    @contextmanager
+    def track(self, *labels):
+        """Count the block as in flight while it runs."""
+        self.inc(1.0, *labels)
+        try:
+            yield
+        finally:
+            self.dec(1.0, *labels)
+
+    def samples(self):
+        with self._lock:
+            return [("", labels, value) for labels, value in self._values.items()]
+
+class CallbackMetric(Metric):
+    """Reads its values at scrape time from a function returning {label values: value}."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...], callback: Callable[[], Dict[Tuple, float]], type: str = "gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.type = type
+
+    def samples(self):
+        suffix = "_total" if self.type == "counter" else ""
+        return [(suffix, labels, value) for labels, value in self.callback().items()]
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, List] = {}  # label values -> [bucket counts, sum, count]
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labels, (counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append(("_bucket", labels + (f"{bound:g}",), cumulative))
+                samples.append(("_bucket", labels + ("+Inf",), count))
+                samples.append(("_sum", labels, total))
+                samples.append(("_count", labels, count))
+        return samples
+
+class MetricsRegistry:
+    """The metrics exposed on /metrics, in registration order."""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # One broken callback must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(lines) + "\n"
+
+class Trace:
+    """Timed spans of one request or ingestion, relative to its start."""
+
+    def __init__(self, name: str, attributes: Optional[Dict] = None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, duration: float, **attributes):
+        """Record a span from perf_counter() start lasting duration seconds."""
+        span = {"name": name, "start_ms": round((start - self._start) * 1000, 3), "duration_ms": round(duration * 1000, 3)}
+        if attributes:
+            span["attributes"] = attributes
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "spans": spans,
+        }
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+class Tracer:
+    """Starts traces for a sample of requests (or on demand) and keeps the most recent ones."""
+
+    def __init__(self, sample_rate: float, history: int):
+        self.sample_rate = sample_rate
+        self._recent = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def trace(self, name: str, force: bool = False, **attributes) -> Iterator[Optional[Trace]]:
+        """Make a new trace current for the block if forced or sampled; yields None otherwise."""
+        if not force and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            yield None
+            return
+        trace = Trace(name, attributes)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            trace.finish()
+            with self._lock:
+                self._recent.append(trace)
+
+    def recent(self, limit: int) -> List[Dict]:
+        with self._lock:
+            traces = list(self._recent)[-limit:]
+        return [trace.to_dict() for trace in reversed(traces)]
+
+class StageTimer:
+    """Accumulates the time spent in named stages of one pipeline run.
+
+    Stages may nest, e.g. a chunk generator pulling from a page generator;
+    each stage is charged only its own time, without the stages it waits on.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self._stack: List[List] = []  # [stage, start, child seconds]
+
+    @contextmanager
+    def stage(self, name: str, span: bool = True):
+        """Time the block as part of the stage, and as a span of the current trace if span is set."""
+        trace = current_trace() if span else None
+        frame = [name, time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed - frame[2]
+            if self._stack:
+                self._stack[-1][2] += elapsed
+            if trace is not None:
+                trace.add_span(name, frame[1], elapsed)
+
+    def iterate(self, items: Iterable, name: str) -> Iterator:
+        """Yield from items, charging the time spent producing each item to the stage.
+
+        Items are not traced one by one; the stage's total ends up in the report.
+        """
+        iterator = iter(items)
+        while True:
+            with self.stage(name, span=False):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def observe(self, histogram: Histogram, *labels):
+        """Record each stage's total in the histogram, labelled with labels and the stage name."""
+        for name, seconds in self.seconds.items():
+            histogram.observe(seconds, *labels, name)
+
+@contextmanager
+def timed(histogram: Histogram, *labels, trace_name: Optional[str] = None):
+    """Observe the block's duration in the histogram and add it to the current trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, *labels)
+        trace = current_trace()
+        if trace is not None:
+            trace.add_span(trace_name or ".".join(str(label) for label in labels), start, elapsed)
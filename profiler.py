@@ -0,0 +1,102 @@
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+class SamplingProfiler:
+    """Samples the stacks of all threads at a fixed interval while switched on.
+
+    Meant to be turned on for a while under production load: the sampler is
+    a single background thread, so the cost is one stack walk per thread per
+    interval, and nothing runs while it is off. Stacks are aggregated in the
+    collapsed format ("outer;inner;leaf count") that flame graph tools read.
+    """
+
+    def __init__(self, max_stacks: int = 10000):
+        self.max_stacks = max_stacks
+        self.interval = 0.01
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        self._stacks = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.01, duration: Optional[float] = None) -> bool:
+        """Start sampling, discarding earlier samples; stops by itself after duration seconds if given.
+
+        Returns False if the profiler is already running.
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self.interval = interval
+            self.samples = 0
+            self._stacks.clear()
+            self.started_at = time.time()
+            self.stopped_at = None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, args=(duration,), name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logging.info(f"Sampling profiler started ({interval * 1000:.0f} ms interval)")
+        return True
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _sample(self, duration: Optional[float]):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + duration if duration else None
+        while not self._stop.wait(self.interval):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                with self._lock:
+                    # Past the limit only known stacks are counted, so memory stays bounded
+                    if key in self._stacks or len(self._stacks) < self.max_stacks:
+                        self._stacks[key] += 1
+            self.samples += 1
+        self.stopped_at = time.time()
+        logging.info(f"Sampling profiler stopped after {self.samples} samples")
+
+    def collapsed(self) -> str:
+        """The sampled stacks, one "frame;frame;frame count" line each, most frequent first."""
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def stats(self, top: int = 20) -> Dict:
+        with self._lock:
+            leaves = Counter()
+            for stack, count in self._stacks.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+            total = sum(leaves.values())
+        return {
+            "running": self.running,
+            "interval_ms": round(self.interval * 1000, 3),
+            "samples": self.samples,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+            "top_frames": [
+                {"frame": frame, "samples": count, "share": round(count / total, 4)}
+                for frame, count in leaves.most_common(top)
+            ],
+        }
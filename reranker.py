@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Executor
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from sentence_transformers import CrossEncoder
+
+class CrossEncoderReranker:
+    """Rescores retrieved chunks against the question with a small cross-encoder on the CPU.
+
+    The model is loaded on first use. All candidates are scored in one
+    predict call; if that does not finish within the latency budget, the
+    candidates keep their retrieval order. A predict call that overran the
+    budget still runs to the end, so while max_in_flight calls are running
+    further questions skip reranking instead of queueing behind them.
+    """
+
+    def __init__(self, model_name: str, batch_size: int, budget_seconds: float, max_length: int = 512, max_in_flight: int = 2):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_seconds = budget_seconds
+        self.max_length = max_length
+        self.max_in_flight = max_in_flight
+        self.reranked = 0
+        self.fallbacks = 0
+        self.skipped = 0
+        self.total_seconds = 0.0
+        self._model: Optional["CrossEncoder"] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+    def load(self) -> "CrossEncoder":
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                start = time.perf_counter()
+                self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+                logging.info(f"Loaded reranker {self.model_name} in {time.perf_counter() - start:.2f}s")
+            return self._model
+
+    def score(self, query: str, passages: List[str]) -> np.ndarray:
+        """Relevance of each passage to the query, higher is better."""
+        model = self.load()
+        return np.asarray(model.predict([(query, passage) for passage in passages], batch_size=self.batch_size, show_progress_bar=False))
+
+    def _release(self, *_):
+        with self._in_flight_lock:
+            self._in_flight -= 1
+
+    async def rerank(self, query: str, passages: List[str], top_k: int, executor: Optional[Executor] = None) -> List[int]:
+        """Return the indices of the top_k passages, best first.
+
+        Falls back to the first top_k passages in their given order when
+        scoring fails or exceeds the latency budget, or when max_in_flight
+        predict calls are already running.
+        """
+        if len(passages) <= 1:
+            return list(range(len(passages)))[:top_k]
+        with self._in_flight_lock:
+            busy = self._in_flight >= self.max_in_flight
+            if not busy:
+                self._in_flight += 1
+        if busy:
+            self.skipped += 1
+            return list(range(min(top_k, len(passages))))
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        scheduled = False
+        try:
+            # The slot is released when the call really ends, also after it overran the budget or was
+            # cancelled before it started; shielded so a timeout or a cancelled request does not end it early
+            scoring = loop.run_in_executor(executor, self.score, query, passages)
+            scoring.add_done_callback(self._release)
+            scheduled = True
+            scores = await asyncio.wait_for(asyncio.shield(scoring), self.budget_seconds)
+        except asyncio.TimeoutError:
+            self.fallbacks += 1
+            logging.warning(f"Reranking {len(passages)} candidates exceeded {self.budget_seconds * 1000:.0f} ms, keeping retrieval order")
+            return list(range(min(top_k, len(passages))))
+        except Exception as e:
+            self.fallbacks += 1
+            logging.error(f"Error reranking candidates, keeping retrieval order: {e}")
+            return list(range(min(top_k, len(passages))))
+        finally:
+            if not scheduled:
+                self._release()
+        self.reranked += 1
+        self.total_seconds += time.perf_counter() - start
+        return [int(i) for i in np.argsort(-scores, kind="stable")[:top_k]]
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "reranked": self.reranked,
+            "fallbacks": self.fallbacks,
+            "skipped_busy": self.skipped,
+            "average_ms": round(self.total_seconds / self.reranked * 1000, 1) if self.reranked else 0.0,
+        }
@@ -0,0 +1,157 @@
+import logging
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Words that end with a period without ending the sentence, compared lowercased and without the period
+ABBREVIATIONS = frozenset({
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "rev", "gen", "col", "lt", "sgt", "capt",
+    "inc", "ltd", "co", "corp", "dept", "univ", "assn", "bros",
+    "e.g", "i.e", "etc", "vs", "cf", "al", "approx", "ca", "viz",
+    "fig", "figs", "eq", "eqs", "tab", "sec", "ch", "vol", "no", "nos", "pp", "p", "ed", "eds", "ref", "refs",
+    "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+})
+# Sentence-ending punctuation with any closing quotes or brackets, followed by whitespace or the end of the text
+SENTENCE_END = re.compile(r"[.!?…]+[\"'”’)\]]*(?=\s|$)")
+
+Span = Tuple[int, int]
+
+class RegexSentenceSplitter:
+    """Rule-based splitter: a sentence ends at ., ! or ? followed by whitespace and a word that is not lowercase.
+
+    Periods after known abbreviations, single-letter initials and dotted
+    abbreviations like "U.S." do not end a sentence. This is an order of
+    magnitude faster than Punkt and needs no model data; boundaries differ
+    from Punkt's on some edge cases.
+    """
+    name = "regex"
+    parallel = False  # splitting a page costs about as much as sending it to another process
+
+    def spans(self, text: str) -> List[Span]:
+        """(start, end) character offsets of every sentence, without surrounding whitespace."""
+        spans = []
+        start = 0
+        length = len(text)
+        for match in SENTENCE_END.finditer(text):
+            end = match.end()
+            following = end
+            while following < length and text[following].isspace():
+                following += 1
+            if following < length and text[following].islower():
+                continue
+            if match.group()[0] == "." and match.end() - match.start() == 1 and self._is_abbreviation(text, match.start()):
+                continue
+            self._append(spans, text, start, end)
+            start = end
+        self._append(spans, text, start, length)
+        return spans
+
+    @staticmethod
+    def _is_abbreviation(text: str, period: int) -> bool:
+        word_start = period
+        while word_start > 0 and not text[word_start - 1].isspace():
+            word_start -= 1
+        word = text[word_start:period].lstrip("\"'(“‘[").lower()
+        if not word:
+            return False
+        if len(word) == 1 and word.isalpha():
+            return True  # an initial, as in "J. Smith"
+        if word in ABBREVIATIONS:
+            return True
+        # Dotted abbreviations like "U.S" or "e.g": only letters, none of them longer than two
+        parts = word.split(".")
+        return len(parts) > 1 and all(0 < len(part) <= 2 and part.isalpha() for part in parts)
+
+    @staticmethod
+    def _append(spans: List[Span], text: str, start: int, end: int):
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            spans.append((start, end))
+
+    def split(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.spans(text)]
+
+class NltkSentenceSplitter:
+    """NLTK's Punkt splitter, loaded from bundled or cached data without touching the network.
+
+    NLTK itself is imported on first use. Punkt data is looked up in
+    data_dir first and then in NLTK's usual locations; it is only
+    downloaded if allow_download is set.
+    """
+    name = "nltk"
+    parallel = True
+
+    def __init__(self, language: str = "english", data_dir: Optional[str] = None, allow_download: bool = False):
+        self.language = language
+        self.data_dir = data_dir
+        self.allow_download = allow_download
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Return the Punkt tokenizer, raising LookupError if its data is not available."""
+        with self._lock:
+            if self._tokenizer is None:
+                import nltk
+                if self.data_dir and self.data_dir not in nltk.data.path:
+                    nltk.data.path.insert(0, self.data_dir)
+                try:
+                    self._tokenizer = self._load_punkt(nltk)
+                except LookupError:
+                    if not self.allow_download:
+                        raise
+                    logging.info("Downloading NLTK punkt data")
+                    for resource in ("punkt_tab", "punkt"):
+                        nltk.download(resource, download_dir=self.data_dir, quiet=True, raise_on_error=False)
+                    self._tokenizer = self._load_punkt(nltk)
+            return self._tokenizer
+
+    def _load_punkt(self, nltk):
+        # NLTK 3.8.2 and later read the punkt_tab tables, older versions the punkt pickle
+        if hasattr(nltk.tokenize, "PunktTokenizer"):
+            nltk.data.find(f"tokenizers/punkt_tab/{self.language}/")
+            return nltk.tokenize.PunktTokenizer(self.language)
+        return nltk.data.load(f"tokenizers/punkt/{self.language}.pickle")
+
+    def spans(self, text: str) -> List[Span]:
+        return list(self.load().span_tokenize(text))
+
+    def split(self, text: str) -> List[str]:
+        return self.load().tokenize(text)
+
+SPLITTERS = {"regex": RegexSentenceSplitter, "nltk": NltkSentenceSplitter}
+
+_splitters: Dict[Tuple, object] = {}
+_splitters_lock = threading.Lock()
+
+def get_sentence_splitter(name: str = "regex", data_dir: Optional[str] = None, allow_download: bool = False):
+    """Return the shared splitter of the given kind, falling back to the regex splitter if Punkt data is missing."""
+    key = (name, data_dir, allow_download)
+    with _splitters_lock:
+        splitter = _splitters.get(key)
+        if splitter is not None:
+            return splitter
+        if name not in SPLITTERS:
+            raise ValueError(f"Unknown sentence splitter {name!r}, expected one of {', '.join(SPLITTERS)}")
+        if name == "nltk":
+            splitter = NltkSentenceSplitter(data_dir=data_dir, allow_download=allow_download)
+            try:
+                splitter.load()
+            except LookupError:
+                logging.warning(
+                    f"NLTK punkt data not found (searched {data_dir or 'the default NLTK paths'}); "
+                    "splitting sentences with the regex splitter instead"
+                )
+                splitter = RegexSentenceSplitter()
+        else:
+            splitter = RegexSentenceSplitter()
+        _splitters[key] = splitter
+        return splitter
+
+def split_pages(pages: List[str], name: str, data_dir: Optional[str] = None, allow_download: bool = False) -> List[List[Span]]:
+    """Sentence spans of each page. Runs in worker processes, which load their own splitter."""
+    splitter = get_sentence_splitter(name, data_dir, allow_download)
+    return [splitter.spans(page) for page in pages]
@@ -0,0 +1,124 @@
+"""Compare recall and memory of the vector storage options on a sample corpus.
+
+Chunks the given PDFs exactly like ingestion, embeds them once, and stores
+them in a temporary local collection for every combination of quantization
+(VECTOR_QUANTIZATION) and dimension reduction (VECTOR_REDUCTION,
+VECTOR_DIMENSIONS). A sample of chunk openings serves as queries; recall@k
+is measured against exact full-precision search:
+
+    python vector_benchmark.py manual1.pdf manual2.pdf --model all-MiniLM-L6-v2 --dimensions 128,256
+
+"Search memory" is what a search scans and should be kept in RAM: the
+float32 vectors without quantization, the codes with it. Qdrant's scalar
+and binary quantization keep the same per-vector sizes in RAM.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+import backend
+from vector_reduction import VectorReducer
+from vector_store import LocalCollection
+
+def load_corpus(pdf_paths, embedding_model):
+    """Chunk the PDFs with the ingestion settings for the model."""
+    max_chunk_size, chunk_overlap, length_function = backend.get_chunk_sizing(embedding_model)
+    texts = []
+    for pdf_path in pdf_paths:
+        pages = backend.iter_pdf_pages(pdf_path)
+        texts.extend(chunk.text for chunk in backend.iter_chunks(backend.iter_sentences(pages), max_chunk_size, chunk_overlap, length_function))
+    return list(dict.fromkeys(texts))
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> list:
+    scores = queries @ vectors.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+def run_config(vectors, queries, truth, k, quantization, reduction, dimensions, oversampling, rescore, fit_samples):
+    with tempfile.TemporaryDirectory() as tmp:
+        reducer = None
+        stored, stored_queries = vectors, queries
+        if reduction:
+            reducer = VectorReducer(reduction, dimensions)
+            reducer.fit(vectors[:fit_samples])
+            stored, stored_queries = reducer.transform(vectors), reducer.transform(queries)
+        collection = LocalCollection.create(os.path.join(tmp, "bench"), stored.shape[1], ann_threshold=len(stored) + 1,
+                                            quantization=quantization, oversampling=oversampling, rescore=rescore)
+        ids = [str(i) for i in range(len(stored))]
+        for start in range(0, len(stored), 1000):
+            collection.upsert(ids[start:start + 1000], stored[start:start + 1000], [{} for _ in ids[start:start + 1000]])
+
+        recalls, latencies = [], []
+        for query, expected in zip(stored_queries, truth):
+            begin = time.perf_counter()
+            hits = collection.search(query, k)
+            latencies.append(time.perf_counter() - begin)
+            recalls.append(len({int(hit.id) for hit in hits} & expected) / k)
+
+        vectors_bytes = os.path.getsize(collection.vectors_path)
+        codes_bytes = os.path.getsize(collection.codes_path) if quantization != "none" else 0
+        collection.conn.close()
+    return {
+        "quantization": quantization,
+        "reduction": f"{reduction}:{dimensions}" if reduction else "none",
+        "rescore": rescore if quantization != "none" else None,
+        f"recall@{k}": round(statistics.mean(recalls), 4),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "bytes_per_vector": (codes_bytes or vectors_bytes) // len(stored),
+        "search_memory_mb": round((codes_bytes or vectors_bytes) / 1024 / 1024, 3),
+        "disk_mb": round((vectors_bytes + codes_bytes) / 1024 / 1024, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="+", help="PDF files forming the sample corpus")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Embedding model")
+    parser.add_argument("--queries", type=int, default=200, help="Chunks sampled as queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dimensions", default="128,256", help="Comma-separated reduced dimensions to try")
+    parser.add_argument("--oversampling", type=float, default=2.0)
+    parser.add_argument("--fit-samples", type=int, default=2048, help="Vectors the PCA basis is fitted on")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    texts = load_corpus(args.pdfs, args.model)
+    random.seed(0)
+    sampled = random.sample(texts, min(args.queries, len(texts)))
+    # The opening words of a chunk stand in for a question about it
+    query_texts = [" ".join(text.split()[:20]) for text in sampled]
+    vectors = backend.embed_texts(texts, args.model, normalize=True)
+    queries = backend.embed_texts(query_texts, args.model, normalize=True)
+    truth = exact_top_k(vectors, queries, args.k)
+    print(f"{len(texts)} chunks, {len(queries)} queries, {vectors.shape[1]} dimensions")
+
+    configs = [("none", "", 0, True), ("int8", "", 0, True), ("binary", "", 0, True), ("binary", "", 0, False)]
+    for dimensions in [int(value) for value in args.dimensions.split(",") if value]:
+        if dimensions >= vectors.shape[1]:
+            continue
+        for reduction in ("pca", "matryoshka"):
+            configs.append(("none", reduction, dimensions, True))
+            configs.append(("int8", reduction, dimensions, True))
+
+    results = []
+    for quantization, reduction, dimensions, rescore in configs:
+        result = run_config(vectors, queries, truth, args.k, quantization, reduction, dimensions, args.oversampling, rescore, args.fit_samples)
+        results.append(result)
+        print(f"{quantization:>6} {result['reduction']:>15} rescore={str(result['rescore']):>5}: "
+              f"recall@{args.k} {result[f'recall@{args.k}']:.3f}, {result['bytes_per_vector']:>5} bytes/vector, "
+              f"p50 {result['p50_ms']} ms")
+
+    baseline = results[0]["bytes_per_vector"]
+    for result in results:
+        result["memory_ratio"] = round(result["bytes_per_vector"] / baseline, 4)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
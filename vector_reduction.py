@@ -0,0 +1,100 @@
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+from vector_store import storage_name
+
+REDUCTION_METHODS = ("matryoshka", "pca")
+
+class VectorReducer:
+    """Maps embeddings of one collection to fewer dimensions.
+
+    "matryoshka" keeps the leading dimensions, which only preserves quality
+    for models trained with Matryoshka representation learning. "pca"
+    projects onto the principal components of the first vectors ingested
+    into the collection. Outputs are L2-normalized for cosine search.
+    """
+
+    def __init__(self, method: str, dimensions: int, mean: Optional[np.ndarray] = None, components: Optional[np.ndarray] = None):
+        if method not in REDUCTION_METHODS:
+            raise ValueError(f"Unknown vector reduction method: {method}")
+        self.method = method
+        self.dimensions = dimensions
+        self.mean = mean
+        self.components = components  # (dimensions, input dimensions) for PCA
+
+    @property
+    def fitted(self) -> bool:
+        return self.method == "matryoshka" or self.components is not None
+
+    def fit(self, vectors: np.ndarray):
+        """Fit the PCA basis. With fewer vectors than dimensions, the missing components are zero."""
+        if self.method != "pca":
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.mean = vectors.mean(axis=0)
+        _, singular_values, basis = np.linalg.svd(vectors - self.mean, full_matrices=False)
+        components = np.zeros((self.dimensions, vectors.shape[1]), dtype=np.float32)
+        kept = min(self.dimensions, len(basis))
+        components[:kept] = basis[:kept]
+        self.components = components
+        explained = (singular_values[:kept] ** 2).sum() / max((singular_values ** 2).sum(), 1e-12)
+        logging.info(f"Fitted PCA to {self.dimensions} dimensions on {len(vectors)} vectors ({explained:.1%} of variance)")
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        single = vectors.ndim == 1
+        vectors = np.atleast_2d(vectors)
+        if self.method == "matryoshka":
+            reduced = vectors[:, :self.dimensions]
+        else:
+            reduced = (vectors - self.mean) @ self.components.T
+        norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+        reduced = np.ascontiguousarray(reduced / np.where(norms == 0, 1, norms), dtype=np.float32)
+        return reduced[0] if single else reduced
+
+    def save(self, path: str):
+        np.savez(path, method=self.method, dimensions=self.dimensions,
+                 mean=self.mean if self.mean is not None else np.empty(0, dtype=np.float32),
+                 components=self.components if self.components is not None else np.empty((0, 0), dtype=np.float32))
+
+    @staticmethod
+    def load(path: str) -> "VectorReducer":
+        with np.load(path) as data:
+            mean = data["mean"] if data["mean"].size else None
+            components = data["components"] if data["components"].size else None
+            return VectorReducer(str(data["method"]), int(data["dimensions"]), mean, components)
+
+class VectorReducerStore:
+    """The fitted reducer of every reduced collection, one .npz file per collection."""
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        self._reducers: Dict[str, Optional[VectorReducer]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _path(self, collection_name: str) -> str:
+        return os.path.join(self.root_dir, f"{storage_name(collection_name)}.npz")
+
+    def get(self, collection_name: str) -> Optional[VectorReducer]:
+        """Return the collection's fitted reducer, or None if its vectors are stored at full size."""
+        with self._lock:
+            if collection_name not in self._reducers:
+                path = self._path(collection_name)
+                self._reducers[collection_name] = VectorReducer.load(path) if os.path.exists(path) else None
+            return self._reducers[collection_name]
+
+    def put(self, collection_name: str, reducer: Optional[VectorReducer]):
+        """Store the reducer of a new collection, or record that it has none."""
+        with self._lock:
+            path = self._path(collection_name)
+            if reducer is None:
+                if os.path.exists(path):
+                    os.remove(path)
+            else:
+                reducer.save(path)
+            self._reducers[collection_name] = reducer
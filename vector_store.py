@@ -0,0 +1,693 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from qdrant_client import AsyncQdrantClient, QdrantClient
+
+try:
+    import hnswlib  # Optional: approximate search for large local collections
+except ImportError:
+    hnswlib = None
+
+QUANTIZATION_MODES = ("none", "int8", "binary")
+SCAN_BLOCK_ROWS = 65536  # rows of quantized codes scored at a time
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+# Payload fields indexed for filtering in shared multi-document collections, with their Qdrant schema type
+PAYLOAD_INDEXES = {
+    "doc_id": "keyword",
+    "page_start": "integer",
+    "upload_time": "float",
+}
+
+def qdrant_models():
+    """The qdrant_client models, imported on first use so the local store starts without loading the client."""
+    from qdrant_client import models
+    return models
+
+@dataclass
+class SearchHit:
+    id: str
+    score: float
+    payload: dict
+    collection_name: Optional[str] = None  # set when several collections are searched at once
+
+class VectorStore:
+    """Operations the ingestion and query paths need from a vector database."""
+
+    def collection_matches(self, collection_name: str, embedding_size: int) -> bool:
+        """Check whether a collection exists with the given vector size."""
+        raise NotImplementedError
+
+    def create_collection(self, collection_name: str, embedding_size: int):
+        """Create a collection, replacing any existing one with the same name."""
+        raise NotImplementedError
+
+    def create_payload_indexes(self, collection_name: str):
+        """Index the PAYLOAD_INDEXES fields for filtered search, if not indexed yet."""
+        raise NotImplementedError
+
+    def upsert(self, collection_name: str, ids: List[str], vectors: np.ndarray, payloads: List[dict]):
+        """Insert or replace points."""
+        raise NotImplementedError
+
+    def get_payloads(self, collection_name: str, fields: Iterable[str], doc_id: Optional[str] = None) -> Dict[str, dict]:
+        """Return {point id: payload restricted to fields} for every point, or every point of one document, without vectors."""
+        raise NotImplementedError
+
+    def set_payloads(self, collection_name: str, updates: List[Tuple[str, dict]]):
+        """Merge the given payload fields into existing points."""
+        raise NotImplementedError
+
+    def delete(self, collection_name: str, ids: List[str]):
+        """Delete points by id."""
+        raise NotImplementedError
+
+    def fetch(self, collection_name: str, ids: List[str]) -> Dict[str, dict]:
+        """Return {point id: payload} for the given ids that exist."""
+        raise NotImplementedError
+
+    async def afetch(self, collection_name: str, ids: List[str]) -> Dict[str, dict]:
+        """Fetch payloads without blocking the event loop; by default runs fetch in a worker thread."""
+        return await asyncio.to_thread(self.fetch, collection_name, ids)
+
+    def search(self, collection_name: str, query_vector: np.ndarray, limit: int, doc_ids: Optional[List[str]] = None) -> List[SearchHit]:
+        """Return the points most similar to query_vector by cosine similarity, optionally only from the given documents."""
+        raise NotImplementedError
+
+    async def asearch(self, collection_name: str, query_vector: np.ndarray, limit: int, doc_ids: Optional[List[str]] = None) -> List[SearchHit]:
+        """Search without blocking the event loop; by default runs search in a worker thread."""
+        return await asyncio.to_thread(self.search, collection_name, query_vector, limit, doc_ids)
+
+def doc_filter(doc_ids: Optional[List[str]]):
+    """Qdrant filter matching points of the given documents."""
+    if doc_ids is None:
+        return None
+    models = qdrant_models()
+    return models.Filter(must=[models.FieldCondition(key="doc_id", match=models.MatchAny(any=list(doc_ids)))])
+
+class QdrantVectorStore(VectorStore):
+    """Vector store backed by a Qdrant server."""
+
+    def __init__(self, client: "QdrantClient", batch_size: int = 10, page_size: int = 1000, async_client: Optional["AsyncQdrantClient"] = None,
+                 quantization: str = "none", oversampling: float = 2.0, rescore: bool = True):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {quantization}")
+        self.client = client
+        self.async_client = async_client
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.quantization = quantization
+        self.oversampling = oversampling
+        self.rescore = rescore
+
+    def _quantization_config(self):
+        models = qdrant_models()
+        if self.quantization == "int8":
+            return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True))
+        if self.quantization == "binary":
+            return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def _search_params(self):
+        if self.quantization == "none":
+            return None
+        models = qdrant_models()
+        return models.SearchParams(quantization=models.QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling))
+
+    def collection_matches(self, collection_name: str, embedding_size: int) -> bool:
+        existing = {collection.name for collection in self.client.get_collections().collections}
+        if collection_name not in existing:
+            return False
+        params = self.client.get_collection(collection_name).config.params.vectors
+        return getattr(params, "size", None) == embedding_size
+
+    def create_collection(self, collection_name: str, embedding_size: int):
+        try:
+            quantized = self.quantization != "none"
+            models = qdrant_models()
+            self.client.recreate_collection(
+                collection_name=collection_name,
+                # Quantized codes stay in RAM; the full vectors, only read for rescoring, stay on disk
+                vectors_config=models.VectorParams(size=embedding_size, distance=models.Distance.COSINE, on_disk=quantized or None),
+                quantization_config=self._quantization_config(),
+            )
+            logging.info(f"Collection '{collection_name}' created or already exists.")
+        except Exception as e:
+            logging.error(f"Error creating Qdrant collection: {e}")
+            raise
+        self.create_payload_indexes(collection_name)
+
+    def create_payload_indexes(self, collection_name: str):
+        indexed = self.client.get_collection(collection_name).payload_schema or {}
+        for field_name, schema in PAYLOAD_INDEXES.items():
+            if field_name not in indexed:
+                self.client.create_payload_index(collection_name=collection_name, field_name=field_name,
+                                                 field_schema=qdrant_models().PayloadSchemaType(schema), wait=True)
+
+    def upsert(self, collection_name: str, ids: List[str], vectors: np.ndarray, payloads: List[dict]):
+        total_batches = (len(ids) + self.batch_size - 1) // self.batch_size
+        for i in range(0, len(ids), self.batch_size):
+            batch = qdrant_models().Batch(
+                ids=ids[i:i + self.batch_size],
+                vectors=vectors[i:i + self.batch_size].tolist(),  # Converted per batch, not for the whole document
+                payloads=payloads[i:i + self.batch_size],
+            )
+            self.client.upsert(collection_name=collection_name, points=batch, wait=True)  # Ensure upsert completes
+            logging.info(f"Upserted batch {i // self.batch_size + 1} of {total_batches} to Qdrant.")
+
+    def get_payloads(self, collection_name: str, fields: Iterable[str], doc_id: Optional[str] = None) -> Dict[str, dict]:
+        payloads = {}
+        offset = None
+        scroll_filter = None
+        if doc_id is not None:
+            models = qdrant_models()
+            scroll_filter = models.Filter(must=[models.FieldCondition(key="doc_id", match=models.MatchValue(value=doc_id))])
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                scroll_filter=scroll_filter,
+                limit=self.page_size,
+                offset=offset,
+                with_payload=list(fields),
+                with_vectors=False,
+            )
+            for point in points:
+                payloads[str(point.id)] = point.payload or {}
+            if offset is None:
+                return payloads
+
+    def set_payloads(self, collection_name: str, updates: List[Tuple[str, dict]]):
+        models = qdrant_models()
+        for i in range(0, len(updates), self.page_size):
+            operations = [
+                models.SetPayloadOperation(set_payload=models.SetPayload(payload=payload, points=[point_id]))
+                for point_id, payload in updates[i:i + self.page_size]
+            ]
+            self.client.batch_update_points(collection_name=collection_name, update_operations=operations, wait=True)
+
+    def delete(self, collection_name: str, ids: List[str]):
+        for i in range(0, len(ids), self.page_size):
+            self.client.delete(
+                collection_name=collection_name,
+                points_selector=qdrant_models().PointIdsList(points=ids[i:i + self.page_size]),
+                wait=True,
+            )
+
+    def fetch(self, collection_name: str, ids: List[str]) -> Dict[str, dict]:
+        points = self.client.retrieve(collection_name=collection_name, ids=ids, with_payload=True, with_vectors=False)
+        return {str(point.id): point.payload or {} for point in points}
+
+    async def afetch(self, collection_name: str, ids: List[str]) -> Dict[str, dict]:
+        if self.async_client is None:
+            return await super().afetch(collection_name, ids)
+        points = await self.async_client.retrieve(collection_name=collection_name, ids=ids, with_payload=True, with_vectors=False)
+        return {str(point.id): point.payload or {} for point in points}
+
+    def search(self, collection_name: str, query_vector: np.ndarray, limit: int, doc_ids: Optional[List[str]] = None) -> List[SearchHit]:
+        hits = self.client.search(
+            collection_name=collection_name,
+            query_vector=np.asarray(query_vector, dtype=np.float32).tolist(),
+            query_filter=doc_filter(doc_ids),
+            search_params=self._search_params(),
+            limit=limit,
+        )
+        return [SearchHit(str(hit.id), hit.score, hit.payload or {}) for hit in hits]
+
+    async def asearch(self, collection_name: str, query_vector: np.ndarray, limit: int, doc_ids: Optional[List[str]] = None) -> List[SearchHit]:
+        if self.async_client is None:
+            return await super().asearch(collection_name, query_vector, limit, doc_ids)
+        hits = await self.async_client.search(
+            collection_name=collection_name,
+            query_vector=np.asarray(query_vector, dtype=np.float32).tolist(),
+            query_filter=doc_filter(doc_ids),
+            search_params=self._search_params(),
+            limit=limit,
+        )
+        return [SearchHit(str(hit.id), hit.score, hit.payload or {}) for hit in hits]
+
+class LocalCollection:
+    """One collection on local disk.
+
+    Vectors are L2-normalized and appended to a raw float32 file that is
+    memory-mapped for search; row numbers, ids and payloads live in SQLite.
+    Replaced and deleted points are tombstoned and the file is compacted
+    once tombstones dominate.
+
+    A quantized collection also keeps int8 or 1-bit codes of its vectors in
+    a second file. Search scans the codes and rescores the best
+    limit * oversampling rows with the full vectors, so only those rows of
+    the float32 file are read.
+    """
+
+    def __init__(self, path: str, ann_threshold: int, oversampling: float = 2.0, rescore: bool = True):
+        self.path = path
+        self.ann_threshold = ann_threshold
+        self.oversampling = oversampling
+        self.rescore = rescore
+        self.lock = threading.RLock()
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.quantization = meta.get("quantization", "none")
+        self.scale = meta.get("scale")  # int8 code per unit of vector component, fitted on the first upsert
+        self.conn = sqlite3.connect(os.path.join(path, "points.db"), check_same_thread=False)
+        self.create_payload_indexes()
+        self._matrix = None
+        self._codes = None
+        self._alive = None
+        self._ann = None
+
+    @staticmethod
+    def create(path: str, dim: int, ann_threshold: int, quantization: str = "none", oversampling: float = 2.0, rescore: bool = True) -> "LocalCollection":
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {quantization}")
+        os.makedirs(path)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"dim": dim, "quantization": quantization}, f)
+        open(os.path.join(path, "vectors.f32"), "wb").close()
+        if quantization != "none":
+            open(os.path.join(path, "codes.bin"), "wb").close()
+        with sqlite3.connect(os.path.join(path, "points.db")) as conn:
+            conn.execute("CREATE TABLE points (row INTEGER PRIMARY KEY, id TEXT, payload TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)")
+            conn.execute("CREATE UNIQUE INDEX points_id ON points (id) WHERE deleted = 0")
+        return LocalCollection(path, ann_threshold, oversampling, rescore)
+
+    def create_payload_indexes(self):
+        for field_name in PAYLOAD_INDEXES:
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS points_{field_name} ON points (json_extract(payload, '$.{field_name}')) WHERE deleted = 0"
+            )
+        self.conn.commit()
+
+    def doc_rows(self, doc_ids: List[str]) -> np.ndarray:
+        """Row numbers of the live points of the given documents. Caller holds the lock."""
+        placeholders = ",".join("?" * len(doc_ids))
+        rows = self.conn.execute(
+            f"SELECT row FROM points WHERE deleted = 0 AND json_extract(payload, '$.doc_id') IN ({placeholders})", list(doc_ids)
+        ).fetchall()
+        return np.array([row for row, in rows], dtype=np.int64)
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def codes_path(self) -> str:
+        return os.path.join(self.path, "codes.bin")
+
+    @property
+    def code_width(self) -> int:
+        """Bytes per quantized vector."""
+        return self.dim if self.quantization == "int8" else (self.dim + 7) // 8
+
+    def row_count(self) -> int:
+        return os.path.getsize(self.vectors_path) // (self.dim * 4)
+
+    def _invalidate(self):
+        self._matrix = None
+        self._codes = None
+        self._alive = None
+        self._ann = None
+
+    def _live_rows(self, ids: List[str]) -> List[int]:
+        """Row numbers of the live points with the given ids. Caller holds the lock."""
+        rows = []
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            rows.extend(row for row, in self.conn.execute(
+                f"SELECT row FROM points WHERE deleted = 0 AND id IN ({','.join('?' * len(batch))})", batch
+            ))
+        return rows
+
+    def _apply_changes(self, removed: List[int], added: Optional[np.ndarray] = None, vectors: Optional[np.ndarray] = None):
+        """Bring the cached live mask and HNSW graph up to date with appended and tombstoned rows. Caller holds the lock.
+
+        The memory maps are reopened for the new file size; the HNSW graph
+        gets the new vectors added and the removed rows marked deleted, so
+        searching during ingestion does not rebuild it after every batch.
+        """
+        self._matrix = None
+        self._codes = None
+        added = np.empty(0, dtype=np.int64) if added is None else added
+        if self._alive is not None:
+            alive = np.concatenate([self._alive, np.ones(len(added), dtype=bool)])
+            alive[removed] = False
+            self._alive = alive
+        if self._ann is not None:
+            for row in removed:
+                try:
+                    self._ann.mark_deleted(int(row))
+                except RuntimeError:
+                    pass  # Not in the graph, e.g. tombstoned before it was built
+            if len(added):
+                needed = self._ann.get_current_count() + len(added)
+                if needed > self._ann.get_max_elements():
+                    self._ann.resize_index(max(needed, 2 * self._ann.get_max_elements()))
+                self._ann.add_items(vectors, added)
+
+    def _fit_scale(self, vectors: np.ndarray):
+        """Fix the int8 scale from the first vectors, clipping the top 1% of component magnitudes. Caller holds the lock."""
+        self.scale = 127.0 / max(float(np.quantile(np.abs(vectors), 0.99)), 1e-6)
+        meta_path = os.path.join(self.path, "meta.json")
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta["scale"] = self.scale
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+
+    def quantize(self, vectors: np.ndarray) -> np.ndarray:
+        """Codes of normalized vectors: int8 components, or the packed sign bits."""
+        if self.quantization == "int8":
+            return np.clip(np.rint(vectors * self.scale), -127, 127).astype(np.int8)
+        return np.packbits(vectors > 0, axis=1)
+
+    def codes(self) -> np.ndarray:
+        if self._codes is None:
+            rows = self.row_count()
+            dtype = np.int8 if self.quantization == "int8" else np.uint8
+            if rows == 0:
+                self._codes = np.empty((0, self.code_width), dtype=dtype)
+            else:
+                self._codes = np.memmap(self.codes_path, dtype=dtype, mode="r", shape=(rows, self.code_width))
+        return self._codes
+
+    def approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        """Cosine similarity estimated from the quantized codes, scanned in blocks. Caller holds the lock."""
+        codes = self.codes()
+        scores = np.empty(len(codes), dtype=np.float32)
+        if self.quantization == "int8":
+            query = query / self.scale
+            for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+                scores[start:start + SCAN_BLOCK_ROWS] = codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32) @ query
+        else:
+            query_bits = np.packbits(query > 0)
+            for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+                distance = POPCOUNT[np.bitwise_xor(codes[start:start + SCAN_BLOCK_ROWS], query_bits)].sum(axis=1, dtype=np.int32)
+                scores[start:start + SCAN_BLOCK_ROWS] = 1.0 - 2.0 * distance / self.dim
+        return scores
+
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            rows = self.row_count()
+            if rows == 0:
+                self._matrix = np.empty((0, self.dim), dtype=np.float32)
+            else:
+                self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._matrix
+
+    def alive(self) -> np.ndarray:
+        if self._alive is None:
+            alive = np.zeros(self.row_count(), dtype=bool)
+            rows = [row for row, in self.conn.execute("SELECT row FROM points WHERE deleted = 0")]
+            alive[rows] = True
+            self._alive = alive
+        return self._alive
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, payloads: List[dict]):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        with self.lock:
+            start = self.row_count()
+            # Only needed to update the cached live mask and HNSW graph in place
+            replaced = self._live_rows(ids) if self._alive is not None or self._ann is not None else []
+            if self.quantization != "none":
+                if self.quantization == "int8" and self.scale is None:
+                    self._fit_scale(vectors)
+                with open(self.codes_path, "ab") as f:
+                    f.write(self.quantize(vectors).tobytes())
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            self.conn.executemany(
+                "UPDATE points SET deleted = 1 WHERE id = ? AND deleted = 0", [(point_id,) for point_id in ids]
+            )
+            self.conn.executemany(
+                "INSERT INTO points (row, id, payload) VALUES (?, ?, ?)",
+                [(start + i, point_id, json.dumps(payload)) for i, (point_id, payload) in enumerate(zip(ids, payloads))],
+            )
+            self.conn.commit()
+            self._apply_changes(replaced, np.arange(start, start + len(ids), dtype=np.int64), vectors)
+            self._maybe_compact()
+
+    def delete(self, ids: List[str]):
+        with self.lock:
+            removed = self._live_rows(ids) if self._alive is not None or self._ann is not None else []
+            self.conn.executemany(
+                "UPDATE points SET deleted = 1 WHERE id = ? AND deleted = 0", [(point_id,) for point_id in ids]
+            )
+            self.conn.commit()
+            self._apply_changes(removed)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        """Rewrite the vector file without tombstoned rows once they make up most of it. Caller holds the lock."""
+        total = self.row_count()
+        alive = self.alive()
+        if total < 1000 or alive.sum() > total // 2:
+            return
+        keep = np.flatnonzero(alive)
+        if self.quantization != "none":
+            codes = self.codes()
+            with open(self.codes_path + ".tmp", "wb") as f:
+                for i in range(0, len(keep), 10000):
+                    f.write(np.ascontiguousarray(codes[keep[i:i + 10000]]).tobytes())
+            del codes
+            self._codes = None
+            os.replace(self.codes_path + ".tmp", self.codes_path)
+        tmp_path = self.vectors_path + ".tmp"
+        matrix = self.matrix()
+        with open(tmp_path, "wb") as f:
+            for i in range(0, len(keep), 10000):
+                f.write(np.ascontiguousarray(matrix[keep[i:i + 10000]]).tobytes())
+        del matrix
+        self._matrix = None
+        os.replace(tmp_path, self.vectors_path)
+        self.conn.execute("DELETE FROM points WHERE deleted = 1")
+        self.conn.executemany(
+            "UPDATE points SET row = ? WHERE row = ?", [(new_row, int(old_row)) for new_row, old_row in enumerate(keep)]
+        )
+        self.conn.commit()
+        self._invalidate()
+        logging.info(f"Compacted local collection {self.path} to {len(keep)} rows")
+
+    def get_payloads(self, fields: Iterable[str], doc_id: Optional[str] = None) -> Dict[str, dict]:
+        fields = list(fields)
+        with self.lock:
+            if doc_id is None:
+                rows = self.conn.execute("SELECT id, payload FROM points WHERE deleted = 0").fetchall()
+            else:
+                rows = self.conn.execute(
+                    "SELECT id, payload FROM points WHERE deleted = 0 AND json_extract(payload, '$.doc_id') = ?", (doc_id,)
+                ).fetchall()
+        result = {}
+        for point_id, payload in rows:
+            payload = json.loads(payload)
+            result[point_id] = {field: payload.get(field) for field in fields}
+        return result
+
+    def set_payloads(self, updates: List[Tuple[str, dict]]):
+        with self.lock:
+            for point_id, update in updates:
+                row = self.conn.execute("SELECT payload FROM points WHERE id = ? AND deleted = 0", (point_id,)).fetchone()
+                if row is not None:
+                    payload = json.loads(row[0])
+                    payload.update(update)
+                    self.conn.execute("UPDATE points SET payload = ? WHERE id = ? AND deleted = 0", (json.dumps(payload), point_id))
+            self.conn.commit()
+
+    def fetch(self, ids: List[str]) -> Dict[str, dict]:
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT id, payload FROM points WHERE deleted = 0 AND id IN ({placeholders})", list(ids)
+            ).fetchall()
+        return {point_id: json.loads(payload) for point_id, payload in rows}
+
+    def _ann_index(self):
+        """Build an HNSW index over live rows for large collections when hnswlib is installed.
+
+        It is built once and then updated in place by upserts and deletes;
+        compaction renumbers the rows, so it is rebuilt after that.
+        """
+        if hnswlib is None:
+            return None
+        alive = self.alive()
+        rows = np.flatnonzero(alive)
+        if len(rows) < self.ann_threshold:
+            return None
+        if self._ann is None:
+            logging.info(f"Building HNSW index over {len(rows)} vectors in {self.path}")
+            index = hnswlib.Index(space="ip", dim=self.dim)
+            index.init_index(max_elements=len(rows), ef_construction=200, M=16)
+            matrix = self.matrix()
+            for i in range(0, len(rows), 10000):
+                part = rows[i:i + 10000]
+                index.add_items(np.ascontiguousarray(matrix[part]), part)
+            index.set_ef(128)
+            self._ann = index
+        return self._ann
+
+    def search(self, query_vector: np.ndarray, limit: int, doc_ids: Optional[List[str]] = None) -> List[SearchHit]:
+        query = np.asarray(query_vector, dtype=np.float32).ravel()
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self.lock:
+            # Quantized collections are scanned through their codes instead of an in-memory HNSW graph
+            ann = self._ann_index() if doc_ids is None and self.quantization == "none" else None
+            if doc_ids is not None:
+                # Exact search over the documents' rows only
+                rows = self.doc_rows(doc_ids)
+                if len(rows) == 0:
+                    return []
+                scores = np.asarray(self.matrix()[rows]) @ query
+                order = np.argsort(-scores)[:limit]
+                rows, scores = rows[order], scores[order]
+            elif ann is not None:
+                # The graph still counts points marked deleted
+                labels, distances = ann.knn_query(query, k=min(limit, int(self.alive().sum())))
+                rows = labels[0].astype(np.int64)
+                scores = 1.0 - distances[0]
+            elif self.quantization != "none":
+                alive = self.alive()
+                if not alive.any():
+                    return []
+                scores = self.approximate_scores(query)
+                scores[~alive] = -np.inf
+                k = min(max(limit, int(limit * self.oversampling)) if self.rescore else limit, int(alive.sum()))
+                rows = np.argpartition(-scores, k - 1)[:k]
+                if self.rescore:
+                    # Exact scores from the full vectors of the candidates only
+                    rows = np.sort(rows)
+                    scores = np.asarray(self.matrix()[rows]) @ query
+                else:
+                    scores = scores[rows]
+                order = np.argsort(-scores)[:limit]
+                rows, scores = rows[order], scores[order]
+            else:
+                alive = self.alive()
+                if not alive.any():
+                    return []
+                # Brute-force cosine similarity over the memory-mapped matrix
+                scores = self.matrix() @ query
+                scores[~alive] = -np.inf
+                k = min(limit, int(alive.sum()))
+                rows = np.argpartition(-scores, k - 1)[:k]
+                rows = rows[np.argsort(-scores[rows])]
+                scores = scores[rows]
+            placeholders = ",".join("?" * len(rows))
+            records = {
+                row: (point_id, payload)
+                for row, point_id, payload in self.conn.execute(
+                    f"SELECT row, id, payload FROM points WHERE deleted = 0 AND row IN ({placeholders})",
+                    [int(row) for row in rows],
+                )
+            }
+        return [
+            SearchHit(records[int(row)][0], float(score), json.loads(records[int(row)][1]))
+            for row, score in zip(rows, scores)
+            if int(row) in records
+        ]
+
+# Collection names that are used as directory and file names unchanged
+PLAIN_STORAGE_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,99}")
+
+def storage_name(collection_name: str) -> str:
+    """A directory or file name for a collection that cannot escape the store's root.
+
+    Plain names are kept as they are; others become a slug plus a short
+    hash of the name, e.g. "Report (2023)" -> "Report-2023-3f1a9c2b7d4e".
+    """
+    if PLAIN_STORAGE_NAME.fullmatch(collection_name) and ".." not in collection_name:
+        return collection_name
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "-", collection_name).strip("-")[:48] or "collection"
+    return f"{slug}-{hashlib.sha1(collection_name.encode('utf-8')).hexdigest()[:12]}"
+
+class LocalVectorStore(VectorStore):
+    """Vector store kept on local disk, for single-node deployments without a Qdrant server.
+
+    New collections use the given quantization mode; existing ones keep
+    the mode they were created with.
+    """
+
+    def __init__(self, root_dir: str, ann_threshold: int = 50000, quantization: str = "none", oversampling: float = 2.0, rescore: bool = True):
+        self.root_dir = root_dir
+        self.ann_threshold = ann_threshold
+        self.quantization = quantization
+        self.oversampling = oversampling
+        self.rescore = rescore
+        self._collections = {}
+        self._lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _path(self, collection_name: str) -> str:
+        return os.path.join(self.root_dir, storage_name(collection_name))
+
+    def _get(self, collection_name: str) -> Optional[LocalCollection]:
+        with self._lock:
+            collection = self._collections.get(collection_name)
+            if collection is None and os.path.exists(os.path.join(self._path(collection_name), "meta.json")):
+                collection = LocalCollection(self._path(collection_name), self.ann_threshold, self.oversampling, self.rescore)
+                self._collections[collection_name] = collection
+            return collection
+
+    def _require(self, collection_name: str) -> LocalCollection:
+        collection = self._get(collection_name)
+        if collection is None:
+            raise KeyError(f"Collection '{collection_name}' not found")
+        return collection
+
+    def collection_matches(self, collection_name: str, embedding_size: int) -> bool:
+        collection = self._get(collection_name)
+        return collection is not None and collection.dim == embedding_size
+
+    def create_payload_indexes(self, collection_name: str):
+        self._require(collection_name).create_payload_indexes()
+
+    def create_collection(self, collection_name: str, embedding_size: int):
+        with self._lock:
+            previous = self._collections.pop(collection_name, None)
+            if previous is not None:
+                previous.conn.close()
+            shutil.rmtree(self._path(collection_name), ignore_errors=True)
+            self._collections[collection_name] = LocalCollection.create(
+                self._path(collection_name), embedding_size, self.ann_threshold, self.quantization, self.oversampling, self.rescore,
+            )
+        logging.info(f"Local collection '{collection_name}' created.")
+
+    def upsert(self, collection_name: str, ids: List[str], vectors: np.ndarray, payloads: List[dict]):
+        self._require(collection_name).upsert(ids, vectors, payloads)
+        logging.info(f"Upserted {len(ids)} points to local collection '{collection_name}'.")
+
+    def get_payloads(self, collection_name: str, fields: Iterable[str], doc_id: Optional[str] = None) -> Dict[str, dict]:
+        return self._require(collection_name).get_payloads(fields, doc_id)
+
+    def set_payloads(self, collection_name: str, updates: List[Tuple[str, dict]]):
+        self._require(collection_name).set_payloads(updates)
+
+    def delete(self, collection_name: str, ids: List[str]):
+        self._require(collection_name).delete(ids)
+
+    def fetch(self, collection_name: str, ids: List[str]) -> Dict[str, dict]:
+        return self._require(collection_name).fetch(ids)
+
+    def search(self, collection_name: str, query_vector: np.ndarray, limit: int, doc_ids: Optional[List[str]] = None) -> List[SearchHit]:
+        return self._require(collection_name).search(query_vector, limit, doc_ids)
+
+    def close(self):
+        with self._lock:
+            for collection in self._collections.values():
+                collection.conn.close()
+            self._collections.clear()